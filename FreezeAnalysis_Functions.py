@@ -4,13 +4,40 @@ LIST OF FUNCTIONS
 
 LoadAndCrop  
 Measure_Motion 
+Measure_Motion_Regions
+Measure_Motion_Shards
+Downsample
+Motion_Buffers
+Motion_Block
+Video_Hash
+Motion_Cache_Path
+Motion_Cache_Load
+Motion_Cache_Save
+Motion_Masks_Load
+Crop_Spec
 cropframe
+FrameReader
 Measure_Freezing 
+Freeze_Runs
+Freezing_Bouts
+Freezing_Sweep
+Stream_Freezing
 Play_Video 
 Play_Video_ext
+FrameDisplay
 Save_Data 
 Summarize 
 Batch 
+Batch_File
+Write_CSV
+Write_Frames
+Read_Frames
+Compact_Dtype
+Batch_Part_Path
+Batch_Consolidate
+Batch_Manifest_Load
+Batch_Manifest_Update
+Batch_Manifest_Check
 Calibrate 
 
 """
@@ -25,19 +52,24 @@ import os
 import sys
 import cv2
 import fnmatch
+import hashlib
+import json
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import pandas as pd
-import PIL.Image
 import time
 import warnings
+import threading
+import queue
+import subprocess
+import tempfile
 from scipy import ndimage
 import holoviews as hv
 from holoviews import opts
 from holoviews import streams
 from holoviews.streams import Stream, param
-from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from IPython.display import clear_output, Image, display
 hv.notebook_extension('bokeh')
 warnings.filterwarnings("ignore")
@@ -171,11 +203,12 @@ def LoadAndCrop(video_dict,stretch={'width':1,'height':1},cropmethod=None,fstfil
     
 ########################################################################################
 
-def Measure_Motion (video_dict,mt_cutoff,crop=None,SIGMA=1):
+def Measure_Motion (video_dict,mt_cutoff,crop=None,SIGMA=1,block_size=32,cache=True,
+                    precision='float',downsample=1,n_workers=1,masks=None):
     """ 
     -------------------------------------------------------------------------------------
     
-    Loops through segment of video file, frame by frame, and calculates number of pixels 
+    Loops through segment of video file, block by block, and calculates number of pixels 
     per frame whose intensity value changed from prior frame.
     
     -------------------------------------------------------------------------------------
@@ -188,24 +221,72 @@ def Measure_Motion (video_dict,mt_cutoff,crop=None,SIGMA=1):
                 'start' : frame at which to start. 0-based [int]
                 'end' : frame at which to end.  set to None if processing 
                         whole video [int]
+                'reader' : (optional) video decoding backend, 'cv2' (default) or 
+                           'ffmpeg'. See `FrameReader` [str]
                 'ftype' : (only if batch processing) 
                           video file type extension (e.g. 'wmv') [str]
                 'FileNames' : (only if batch processing)
                               List of filenames of videos in folder to be batch 
                               processed.  [list]
                 
-        mt_cutoff:: [float]
+        mt_cutoff:: [float or list]
             Threshold value for determining magnitude of change sufficient to mark
-            pixel as changing from prior frame.
+            pixel as changing from prior frame. If list of values is passed, motion
+            is measured for each cutoff in a single pass through the video.
                 
-        crop:: [holoviews.streams.stream]
+        crop:: [holoviews.streams.stream or dict]
             Holoviews stream object enabling dynamic selection in response to 
             cropping tool. `crop.data` contains x and y coordinates of crop
-            boundary vertices.
+            boundary vertices. Alternatively, dictionary of named crop regions 
+            (e.g. one per chamber), with region names as keys and crop streams or 
+            specifications as values, e.g. {'A': crop_A, 'B': crop_B}. Motion of all
+            regions is measured in a single pass through the video.
                 
         SIGMA:: [float]
             Sigma value for gaussian filter applied to each image. Passed to 
             OpenCV `cv2.GuassianBlur`.
+            
+        block_size:: [uint]
+            Number of frames decoded into memory together, before being processed 
+            one at a time. Requires approximately 2 bytes per pixel per frame in 
+            block.
+            
+        cache:: [bool]
+            Whether to store `Motion` in, and retrieve it from, on-disk motion cache.
+            See `Motion_Cache_Path` for details.
+            
+        precision:: [str]
+            Numeric precision of frame processing. Takes the following values:
+                'float' : frames are blurred and differenced as float64 values.
+                'uint8' : frames are blurred, differenced and thresholded as uint8 
+                          values with OpenCV kernels (`cv2.absdiff`, `cv2.threshold`,
+                          `cv2.countNonZero`). Faster and uses 1/8 of the memory 
+                          bandwidth, but approximate. See Notes.
+                          
+        downsample:: [float]
+            Factor by which frames are reduced in width and height, after cropping, 
+            prior to analysis. Frames are resampled with `cv2.INTER_AREA`. Default 
+            of 1 analyzes frames at full resolution.
+            
+        n_workers:: [uint]
+            Number of worker processes across which the video segment is split. If
+            `n_workers=None`, one worker per available cpu is used. See 
+            `Measure_Motion_Shards`.
+            
+        masks:: [str]
+            Whether to save per-frame motion masks (pixels exceeding `mt_cutoff`), such
+            that `PlayVideo` and `PlayVideo_ext` can display them without repeating 
+            the analysis. Takes the following values:
+                None : masks are not saved.
+                'npy' : masks are bit-packed and saved as .npy file, which playback 
+                        memory-maps to read individual frames.
+                'npz' : masks are bit-packed and saved as compressed .npz file, which
+                        is smaller but is loaded in full by playback.
+            Masks are saved in `video_dict['mask_dir']` (default: 'MotionMasks' folder
+            within `video_dict['dpath']`), and their path is stored in 
+            `video_dict['masks']`, which is set to None when masks are not saved. Only 
+            supported for a single crop region, single `mt_cutoff` value and 
+            `n_workers=1`.
     
     -------------------------------------------------------------------------------------
     Returns:
@@ -213,46 +294,92 @@ def Measure_Motion (video_dict,mt_cutoff,crop=None,SIGMA=1):
             Array containing number of pixels per frame whose intensity change from
             previous frame exceeds `mt_cutoff`. Length is number of frames passed to
             function to loop through. Value of first index, corresponding to first frame,
-            is set to 0.
+            is set to 0. If list of cutoffs is passed, `Motion` is 2d array of shape 
+            (frames, cutoffs), with column `k` corresponding to `mt_cutoff[k]`. If 
+            dictionary of named crop regions is passed, dictionary of such arrays, with 
+            region names as keys.
     
     -------------------------------------------------------------------------------------
     Notes:
+        - Frames of a block are decoded together, after which each is blurred, 
+          differenced, thresholded and counted in preallocated buffers. The last 
+          blurred frame of each block is carried over to the next, such that `Motion`
+          is identical to frame by frame processing.
+        - If `cache=True` and motion has previously been measured for the same video
+          with the same `start`, `end`, `crop`, `SIGMA` and `mt_cutoff`, stored values
+          are returned without decoding the video. Named crop regions are stored 
+          separately.
+        - When a list of cutoffs is passed, the blurred absolute difference of each
+          pixel is binned by the cutoffs, and a per-frame histogram of the bins is 
+          accumulated. Counts are identical to separate runs with each cutoff.
+        - With `precision='uint8'`, blurred frames are rounded to integer values by 
+          OpenCV's fixed-point Gaussian filter. Blurred values are typically within 
+          0.6 grayscale levels of the float64 values on camera footage (up to 2 
+          levels on pure noise), such that only pixels whose float64 change lies 
+          within approximately 1-2 levels of `mt_cutoff` can be classified 
+          differently. Because differences are integers, `mt_cutoff` is in effect 
+          rounded down to the nearest integer. `Motion` typically differs from the 
+          float64 path by a few percent of its value; compare both on a sample video
+          before adopting it.
+        - When `downsample` is greater than 1, `SIGMA` is divided by `downsample` so
+          that blurring covers the same area of the original frame, and `Motion` is 
+          multiplied by the ratio of original to downsampled pixels, such that it 
+          remains in units of original pixels. `FreezeThresh` values can therefore be 
+          compared across resolutions. `mt_cutoff` should be calibrated with the same 
+          `downsample` (see `Calibrate`).
+        - Motion masks are stored at the resolution of cropped frames. If `downsample`
+          is greater than 1, masks are enlarged with nearest neighbour interpolation
+          before being saved.
 
     """
     
-    #Upoad file
-    cap = cv2.VideoCapture(video_dict['fpath'])
-    cap_max = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) 
-    cap_max = int(video_dict['end']) if video_dict['end'] is not None else cap_max
-    cap.set(cv2.CAP_PROP_POS_FRAMES,video_dict['start']) 
-
-    #Initialize first frame and array to store motion values in
-    ret, frame_new = cap.read()
-    frame_new = cv2.cvtColor(frame_new, cv2.COLOR_BGR2GRAY)
-    frame_new = cropframe(frame_new, crop)
-    frame_new = cv2.GaussianBlur(frame_new.astype('float'),(0,0),SIGMA)  
-    Motion = np.zeros(cap_max - video_dict['start'])
-
-    #Loop through frames to detect frame by frame differences
-    for x in range (1,len(Motion)):
-        frame_old = frame_new
-        ret, frame_new = cap.read()
-        if ret == True:
-            #Reset new frame and process calculate difference between old/new frames
-            frame_new = cv2.cvtColor(frame_new, cv2.COLOR_BGR2GRAY)
-            frame_new = cropframe(frame_new, crop)
-            frame_new = cv2.GaussianBlur(frame_new.astype('float'),(0,0),SIGMA)  
-            frame_dif = np.absolute(frame_new - frame_old)
-            frame_cut = (frame_dif > mt_cutoff).astype('uint8')
-            Motion[x]=np.sum(frame_cut)
-        else: 
-            #if no frame is detected
-            x = x-1 #Reset x to last frame detected
-            Motion = Motion[:x] #Amend length of motion vector
-            break
+    #Measure motion of each named region (e.g. chamber) in a single pass
+    crop = Crop_Spec(crop)
+    named = isinstance(crop, dict) and 'y0' not in crop
+    regions = crop if named else {None: crop}
+    if masks is not None and (named or np.ndim(mt_cutoff) != 0 or n_workers != 1):
+        raise ValueError('masks can only be saved for a single crop region, a single '
+                         'mt_cutoff value and n_workers=1')
+    
+    #Define cache files
+    if cache or masks is not None:
+        cache_paths = {}
+        for name, spec in regions.items():
+            params = dict(start=video_dict['start'], end=video_dict['end'], 
+                          mt_cutoff=np.asarray(mt_cutoff,dtype='float').tolist(),
+                          crop=spec, SIGMA=SIGMA,
+                          precision=precision, downsample=downsample,
+                          reader=video_dict.get('reader','cv2'))
+            cache_paths[name] = Motion_Cache_Path(video_dict,params)
+    mask_path = None
+    if masks is not None:
+        mask_dir = video_dict.get('mask_dir', os.path.join(os.path.normpath(video_dict['dpath']), 'MotionMasks'))
+        key = os.path.splitext(os.path.basename(cache_paths[None]))[0]
+        mask_path = os.path.join(mask_dir, '{k}_masks.{ext}'.format(k=key, ext=masks))
+    
+    #Return stored motion values if segment has previously been measured
+    if cache and (mask_path is None or os.path.isfile(mask_path)):
+        Motion = {name: Motion_Cache_Load(cache_paths[name]) for name in regions}
+        if all(M is not None for M in Motion.values()):
+            video_dict['masks'] = mask_path
+            return Motion if named else Motion[None]
+    
+    #Split video segment across worker processes if requested
+    if n_workers != 1:
+        Motion = Measure_Motion_Shards(video_dict,mt_cutoff,crop,SIGMA,n_workers=n_workers,
+                                       block_size=block_size,precision=precision,
+                                       downsample=downsample)
+        Motion = Motion if named else {None: Motion}
+    else:
+        Motion = Measure_Motion_Regions(video_dict,mt_cutoff,regions,SIGMA,block_size,
+                                        precision,downsample,mask_path)
+    video_dict['masks'] = mask_path
         
-    cap.release() #release video
-    return(Motion) #return motion values
+    if cache:
+        for name in regions:
+            Motion_Cache_Save(cache_paths[name],Motion[name],
+                              max_mb=video_dict.get('cache_mb',1000))
+    return Motion if named else Motion[None] #return motion values
 
 
 
@@ -260,100 +387,168 @@ def Measure_Motion (video_dict,mt_cutoff,crop=None,SIGMA=1):
 
 ########################################################################################
 
-def cropframe(frame,crop=None):
+def Measure_Motion_Regions(video_dict,mt_cutoff,regions,SIGMA=1,block_size=32,
+                           precision='float',downsample=1,mask_path=None):
     """ 
     -------------------------------------------------------------------------------------
     
-    Crops passed frame with `crop` specification
-    
-    -------------------------------------------------------------------------------------
-    Args:
-        frame:: [numpy.ndarray]
-            2d numpy array 
-        crop:: [hv.streams.stream]
-            Holoviews stream object enabling dynamic selection in response to 
-            cropping tool. `crop.data` contains x and y coordinates of crop
-            boundary vertices. Set to None if no cropping supplied.
-    
-    -------------------------------------------------------------------------------------
-    Returns:
-        frame:: [numpy.ndarray]
-            2d numpy array
-    
-    -------------------------------------------------------------------------------------
-    Notes:
-
-    """
-    
-    try:
-        Xs=[crop.data['x0'][0],crop.data['x1'][0]]
-        Ys=[crop.data['y0'][0],crop.data['y1'][0]]
-        fxmin,fxmax=int(min(Xs)), int(max(Xs))
-        fymin,fymax=int(min(Ys)), int(max(Ys))
-        return frame[fymin:fymax,fxmin:fxmax]
-    except:
-        return frame
- 
-    
-    
-    
-
-########################################################################################
-
-def Measure_Freezing(Motion,FreezeThresh,MinDuration=0):
-    """ 
-    -------------------------------------------------------------------------------------
+    Loops through segment of video file once, block by block, and calculates number of 
+    pixels per frame whose intensity value changed from prior frame, within each of a 
+    set of regions. Called by `Measure_Motion`.
     
-    Calculates freezing on a frame by frame basis based upon measure of motion.
-
     -------------------------------------------------------------------------------------
     Args:
-        Motion:: [numpy.array]
-            Array containing number of pixels per frame whose intensity change from
-            previous frame exceeds `mt_cutoff`. 
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+                'fpath' : full path to file [str]
+                'start' : frame at which to start. 0-based [int]
+                'end' : frame at which to end.  set to None if processing 
+                        whole video [int]
+                'reader' : (optional) video decoding backend, 'cv2' (default) or 
+                           'ffmpeg'. See `FrameReader` [str]
                 
-        FreezeThresh:: [float]
-            Threshold value for determining magnitude of activity in `Motion` to designate
-            frame as freezing/not freezing (i.e. if motion is below `FreezeThresh`, animal
-            is likely freezing).
+        mt_cutoff:: [float or list]
+            Threshold value for determining magnitude of change sufficient to mark
+            pixel as changing from prior frame. See `Measure_Motion`.
                 
-        MinDuration:: [uint8]
-            Duration for which `Motion` must be below `FreezeThresh` for freezing to be 
-            registered.
+        regions:: [dict]
+            Dictionary of crop specifications (see `Crop_Spec`), with region names as
+            keys. A value of None specifies the whole frame.
+                
+        SIGMA:: [float]
+            Sigma value for gaussian filter applied to each image. Passed to 
+            OpenCV `cv2.GuassianBlur`.
+            
+        block_size:: [uint]
+            Number of frames decoded into memory together. See `Measure_Motion`.
+            
+        precision:: [str]
+            Numeric precision of frame processing, 'float' or 'uint8'. See 
+            `Measure_Motion`.
+            
+        downsample:: [float]
+            Factor by which frames are reduced in width and height, after cropping, 
+            prior to analysis. See `Measure_Motion`.
+            
+        mask_path:: [str]
+            Path of .npy or .npz file to which bit-packed motion masks are saved. 
+            Only valid for a single region and scalar `mt_cutoff`. Set to None if 
+            masks are not to be saved. A .json file recording the video, frame range
+            and crop of the masks is saved alongside. See `Motion_Masks_Load`.
     
     -------------------------------------------------------------------------------------
     Returns:
-        Freezing:: [numpy.array]
-            Array defining whether animal is freezing on frame by frame basis.  
-            0 = Not Freezing; 100 = Freezing
+        Motion:: [dict]
+            Dictionary with region names as keys, and for each region, array of motion
+            values as returned by `Measure_Motion`.
     
     -------------------------------------------------------------------------------------
     Notes:
-        - Although Motion argument is often `Motion` array returned by function 
-          `Measure_Motion`, any unidimensional array could be passed.
+        - Each frame is decoded once and cropped to each region, and each region is 
+          blurred and differenced in its own block buffers.
+        - If a single region is passed, frames are cropped to it during decoding. 
+          Otherwise, whole frames are decoded and converted to grayscale.
 
     """
+    
+    #Upoad file, decoding frames in background
+    single = len(regions) == 1
+    cap = FrameReader(video_dict['fpath'],video_dict['start'],video_dict['end'],
+                      crop=list(regions.values())[0] if single else None,
+                      reader=video_dict.get('reader','cv2'))
+    cap_max = cap.frame_count
+    cap_max = int(video_dict['end']) if video_dict['end'] is not None else cap_max
+    length = cap_max - video_dict['start']
 
-    #Find frames below thresh
-    BelowThresh = (Motion<FreezeThresh).astype(int)
-
-    #Perform local cumulative thresh detection
-    #For each consecutive frame motion is below threshold count is increased by 1 until motion goes above thresh, 
-    #at which point coint is set back to 0
-    CumThresh = np.zeros(len(Motion))
-    for x in range (1,len(Motion)):
-        if (BelowThresh[x]==1):
-            CumThresh[x] = CumThresh[x-1] + BelowThresh[x]
-
-    #Define periods where motion is below thresh for minduration as freezing
-    Freezing = (CumThresh>=MinDuration).astype(int)
-    for x in range( len(Freezing) - 2, -1, -1) : 
-        if Freezing[x] == 0 and Freezing[x+1]>0 and Freezing[x+1]<MinDuration:
-            Freezing[x] = Freezing[x+1] + 1
-    Freezing = (Freezing>0).astype(int)
-    Freezing = Freezing*100 #Convert to Percentage
+    #Initialize first frame, arrays to store motion values in, and block buffers
+    ret, frame_new = cap.read()
+    Motion, scale, buffers = {}, {}, {}
+    for name, spec in regions.items():
+        frame = frame_new if single else cropframe(frame_new, spec)
+        Motion[name] = np.zeros((length,) + np.shape(mt_cutoff))
+        
+        #Set scaling of motion values for downsampled frames
+        scale[name] = frame.size
+        frame = Downsample(frame, downsample)
+        scale[name] = scale[name] / frame.size
+        buffers[name] = Motion_Buffers(frame,block_size,SIGMA/downsample,precision)
+    SIGMA = SIGMA / downsample
+    
+    #Initialize bit-packed motion masks, at resolution of cropped frames
+    if mask_path is not None:
+        h,w = frame_new.shape
+        mask_shape = (length, h, (w+7)//8)
+        tmp_path = '{p}.{pid}.tmp'.format(p=mask_path, pid=os.getpid())
+        os.makedirs(os.path.dirname(mask_path), exist_ok=True)
+        if mask_path.endswith('.npy'):
+            mask_store = np.lib.format.open_memmap(tmp_path,mode='w+',dtype='uint8',shape=mask_shape)
+        else:
+            mask_store = np.zeros(mask_shape,dtype='uint8')
+
+    #Loop through blocks of frames to detect frame by frame differences
+    x = 1
+    while x < length:
+        
+        #Decode block of frames
+        n = min(block_size, length - x)
+        for i in range(n):
+            ret, frame_new = cap.read()
+            if ret == False:
+                break
+            for name, spec in regions.items():
+                frame = frame_new if single else cropframe(frame_new, spec)
+                buffers[name]['gray'][i] = Downsample(frame, downsample)
+        n = i+1 if ret == True else i
+        
+        #Blur, difference, threshold and count block
+        for name in regions:
+            Motion[name][x:x+n] = Motion_Block(buffers[name],n,mt_cutoff,SIGMA,precision) * scale[name]
+            
+        #Store masks of block
+        if mask_path is not None:
+            frame_cut = buffers[name]['frame_cut'][:n]
+            if frame_cut.shape[1:] != (h,w):
+                frame_cut = [cv2.resize(cut,(w,h),interpolation=cv2.INTER_NEAREST) for cut in frame_cut]
+            mask_store[x:x+n] = np.packbits(frame_cut, axis=2)
+        x += n
+        
+        if ret == False: 
+            #if no frame is detected, amend length of motion vector. 
+            #As with frame by frame processing, the last frame detected is also dropped.
+            length = x-1
+            break
+        
+    cap.release() #release video
     
-    return(Freezing)
+    #Save masks under temporary name, then rename
+    if mask_path is not None:
+        if mask_path.endswith('.npy'):
+            mask_store.flush()
+            
+            #Copy masks of frames processed to file of that length, if video ended early
+            if length < mask_shape[0]:
+                trim_path = '{p}.trim.{pid}.tmp'.format(p=mask_path, pid=os.getpid())
+                trimmed = np.lib.format.open_memmap(trim_path,mode='w+',dtype='uint8',
+                                                    shape=(length,)+mask_shape[1:])
+                trimmed[:] = mask_store[:length]
+                trimmed.flush()
+                del trimmed
+                os.replace(trim_path, tmp_path)
+            del mask_store
+        else:
+            with open(tmp_path,'wb') as f:
+                np.savez_compressed(f, masks=mask_store[:length])
+        os.replace(tmp_path, mask_path)
+        
+        #Record video, frame range and crop of masks, checked by Motion_Masks_Load
+        info = dict(video=Video_Hash(video_dict['fpath']), start=video_dict['start'],
+                    end=video_dict['end'], crop=regions[None])
+        with open(tmp_path,'w') as f:
+            json.dump(info, f, default=str)
+        os.replace(tmp_path, mask_path + '.json')
+    return {name: M[:length] for name, M in Motion.items()}
 
 
 
@@ -361,213 +556,1647 @@ def Measure_Freezing(Motion,FreezeThresh,MinDuration=0):
 
 ########################################################################################
 
-def PlayVideo(video_dict,display_dict,Freezing,mt_cutoff,crop=None,SIGMA=1):
+def Measure_Motion_Shards(video_dict,mt_cutoff,crop=None,SIGMA=1,n_workers=None,**kwargs):
     """ 
     -------------------------------------------------------------------------------------
     
-    Play portion of video back, displaying thresholded video in tandem. Displayed
-    externally
-
+    Measures motion of a single video segment in parallel, by splitting its frames into
+    contiguous shards that are each processed by `Measure_Motion` in a separate worker 
+    process, with its own `cv2.VideoCapture`. Results are stitched into a single 
+    `Motion` array.
+    
     -------------------------------------------------------------------------------------
     Args:
         video_dict:: [dict]
             Dictionary with the following keys:
                 'dpath' : directory containing files [str]
                 'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+                'fpath' : full path to file [str]
                 'fps' : frames per second of video files to be processed [int]
                 'start' : frame at which to start. 0-based [int]
                 'end' : frame at which to end.  set to None if processing 
                         whole video [int]
-                'ftype' : (only if batch processing) 
-                          video file type extension (e.g. 'wmv') [str]
-                'FileNames' : (only if batch processing)
-                              List of filenames of videos in folder to be batch 
-                              processed.  [list]
                 
-        display_dict:: [dict]
-            Dictionary with the following keys:
-                'start' : start point of video segment in frames [int]
-                'end' : end point of video segment in frames [int]
-                'fps' : frames per second of video file/files to be processed [int]
-                'save_video' : option to save video if desired [bool]
-                               Currently, will be saved at 20 fps even if video 
-                               is something else
-                               
-        Freezing:: [numpy.array]
-            Array defining whether animal is freezing on frame by frame basis.  
-            0 = Not Freezing; 100 = Freezing
-        
-        mt_cutoff:: [float]
+        mt_cutoff:: [float or list]
             Threshold value for determining magnitude of change sufficient to mark
-            pixel as changing from prior frame.
-        
+            pixel as changing from prior frame. See `Measure_Motion`.
+                
         crop:: [holoviews.streams.stream]
             Holoviews stream object enabling dynamic selection in response to 
             cropping tool. `crop.data` contains x and y coordinates of crop
-            boundary vertices. Set to None if no cropping supplied.
-            
+            boundary vertices.
+                
         SIGMA:: [float]
             Sigma value for gaussian filter applied to each image. Passed to 
             OpenCV `cv2.GuassianBlur`.
+            
+        n_workers:: [uint]
+            Number of shards, and of worker processes. If `n_workers=None`, one 
+            worker per available cpu is used.
+            
+        **kwargs:: 
+            Additional arguments passed to `Measure_Motion` (e.g. `precision`, 
+            `downsample`, `block_size`).
     
     -------------------------------------------------------------------------------------
     Returns:
-        Nothing returned
+        Motion:: [numpy.array or dict]
+            Array containing number of pixels per frame whose intensity change from
+            previous frame exceeds `mt_cutoff`. Dictionary of arrays if named crop
+            regions are passed. See `Measure_Motion`.
     
     -------------------------------------------------------------------------------------
     Notes:
+        - Each shard after the first starts one frame early, such that the difference
+          between its first frame and the last frame of the prior shard is measured.
+          Provided the video supports frame-accurate seeking via 
+          `cv2.CAP_PROP_POS_FRAMES`, `Motion` is identical to a serial run.
+        - If the video ends before the expected last frame, `Motion` is truncated as
+          in a serial run, and shards beyond the end are ignored.
 
     """
     
-    #Upoad file
+    #Define shards
     cap = cv2.VideoCapture(video_dict['fpath'])
-    cap.set(cv2.CAP_PROP_POS_FRAMES,video_dict['start']+display_dict['start']) 
-
-    #set text parameters
-    textfont = cv2.FONT_HERSHEY_SIMPLEX
-    textposition = (10,30)
-    textfontscale = 1
-    textlinetype = 2
-    textfontcolor = 255
-
-    #Initialize first frame
-    ret, frame_new = cap.read()
-    frame_new = cv2.cvtColor(frame_new, cv2.COLOR_BGR2GRAY)
-    frame_new = cropframe(frame_new, crop)
-    frame_new = cv2.GaussianBlur(frame_new.astype('float'),(0,0),SIGMA)
-
-    #Initialize video storage if desired
-    if display_dict['save_video']==True:
-        width, height = int(frame_new.shape[1]), int(frame_new.shape[0])
-        fourcc = 0
-        writer = cv2.VideoWriter(os.path.join(os.path.normpath(video_dict['dpath']), 'video_output.avi'), 
-                         fourcc, 20.0, (width, height), isColor=False)
-
-    #Loop through frames to detect frame by frame differences
-    for x in range (display_dict['start']+1,display_dict['end']):
+    cap_max = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) 
+    cap_max = int(video_dict['end']) if video_dict['end'] is not None else cap_max
+    cap.release()
+    n_workers = n_workers if n_workers is not None else os.cpu_count()
+    bounds = np.linspace(video_dict['start'], cap_max, n_workers+1).astype(int)
+    bounds = np.unique(bounds)
+    jobs = []
+    for shard_start, shard_end in zip(bounds[:-1], bounds[1:]):
+        job_dict = video_dict.copy()
+        job_dict['start'] = max(shard_start-1, video_dict['start'])
+        job_dict['end'] = shard_end
+        jobs.append(job_dict)
+    
+    #Measure motion of each shard, in separate processes
+    crop = Crop_Spec(crop)
+    with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+        futures = [pool.submit(Measure_Motion,job_dict,mt_cutoff,crop,SIGMA,
+                               cache=False,n_workers=1,**kwargs) for job_dict in jobs]
+        
+        #Stitch shards, dropping overlapping first frame of all but the first shard
+        parts = []
+        length = None
+        for job_dict, future in zip(jobs, futures):
+            shard = future.result()
+            named = isinstance(shard, dict)
+            shard = shard if named else {None: shard}
+            parts.append({name: M if len(parts) == 0 else M[1:] for name, M in shard.items()})
+            n = len(next(iter(shard.values())))
+            if n < job_dict['end'] - job_dict['start']:
+                #video ended within shard. Truncate as serial processing would.
+                length = job_dict['start'] - video_dict['start'] + n
+                for future in futures:
+                    future.cancel()
+                break
+    
+    Motion = {name: np.concatenate([part[name] for part in parts])[:length] for name in parts[0]}
+    return Motion if named else Motion[None]
 
-        #Attempt to load next frame
-        frame_old = frame_new
-        ret, frame_new = cap.read()
-        if ret == True:
-            
-            #process frame           
-            frame_new = cv2.cvtColor(frame_new, cv2.COLOR_BGR2GRAY)
-            frame_new = cropframe(frame_new, crop)
-            frame_new = cv2.GaussianBlur(frame_new.astype('float'),(0,0),SIGMA) 
-            frame_dif = np.absolute(frame_new - frame_old)
-            frame_cut = (frame_dif > mt_cutoff).astype('uint8')*255
 
-            #Add text to videos, display and save
-            texttext = 'FREEZING' if Freezing[x]==100 else 'ACTIVE'
-            cv2.putText(frame_new,texttext,textposition,textfont,textfontscale,textfontcolor,textlinetype)
-            display = np.concatenate((frame_new.astype('uint8'),frame_cut))
-            display_image(display,display_dict['fps'],display_dict['resize'])
-            if display_dict['save_video']==True:
-                writer.write(display) 
 
-        else: 
-            print('No frame detected at frame : ' + str(x) + '.Stopping video play')
-            break
 
-    #Close video window and video writer if open        
-    print('Done playing segment')
-    if display_dict['save_video']==True:
-        writer.release()
 
-def display_image(frame,fps,resize):
-    img = PIL.Image.fromarray(frame, "L")
-    img = img.resize(size=resize) if resize else img
-    buffer = BytesIO()
-    img.save(buffer,format="JPEG")    
-    display(Image(data=buffer.getvalue()))
-    time.sleep(1/fps)
-    clear_output(wait=True)
-        
-        
-    
-    
-    
 ########################################################################################
 
-def PlayVideo_ext(video_dict,display_dict,Freezing,mt_cutoff,crop=None,SIGMA=1):
+def Downsample(frame,downsample=1):
     """ 
     -------------------------------------------------------------------------------------
     
-    Play portion of video back, displaying thresholded video in tandem. Displayed in
-    Jupyter Notebook
-
+    Reduces width and height of frame by factor `downsample`, using area resampling.
+    
     -------------------------------------------------------------------------------------
     Args:
-        video_dict:: [dict]
-            Dictionary with the following keys:
-                'dpath' : directory containing files [str]
-                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
-                'fps' : frames per second of video files to be processed [int]
-                'start' : frame at which to start. 0-based [int]
-                'end' : frame at which to end.  set to None if processing 
-                        whole video [int]
-                'ftype' : (only if batch processing) 
-                          video file type extension (e.g. 'wmv') [str]
-                'FileNames' : (only if batch processing)
-                              List of filenames of videos in folder to be batch 
-                              processed.  [list]
-                
-        display_dict:: [dict]
-            Dictionary with the following keys:
-                'start' : start point of video segment in frames [int]
-                'end' : end point of video segment in frames [int]
-                'resize' : Default is None, in which original size is retained.
-                           Alternatively, set to tuple as follows: (width,height).
-                           Because this is in pixel units, must be integer values.
-                'fps' : frames per second of video file/files to be processed [int]
-                'save_video' : option to save video if desired [bool]
-                               Currently, will be saved at 20 fps even if video 
-                               is something else
-                               
-        Freezing:: [numpy.array]
-            Array defining whether animal is freezing on frame by frame basis.  
-            0 = Not Freezing; 100 = Freezing
-        
-        mt_cutoff:: [float]
-            Threshold value for determining magnitude of change sufficient to mark
-            pixel as changing from prior frame.
-        
-        crop:: [holoviews.streams.stream]
-            Holoviews stream object enabling dynamic selection in response to 
-            cropping tool. `crop.data` contains x and y coordinates of crop
-            boundary vertices. Set to None if no cropping supplied.
+        frame:: [numpy.ndarray]
+            2d numpy array
             
-        SIGMA:: [float]
-            Sigma value for gaussian filter applied to each image. Passed to 
-            OpenCV `cv2.GuassianBlur`.
+        downsample:: [float]
+            Factor by which width and height are reduced. If 1, frame is returned
+            unchanged.
     
     -------------------------------------------------------------------------------------
     Returns:
-        Nothing returned
+        frame:: [numpy.ndarray]
+            2d numpy array
     
     -------------------------------------------------------------------------------------
     Notes:
 
     """
     
-    #Upoad file
-    cap = cv2.VideoCapture(video_dict['fpath'])
-    rate = int(1000/display_dict['fps']) #duration each frame is present for, in milliseconds
-    cap.set(cv2.CAP_PROP_POS_FRAMES,video_dict['start']+display_dict['start']) 
+    if downsample == 1:
+        return frame
+    h,w = frame.shape
+    size = (max(int(round(w/downsample)),1), max(int(round(h/downsample)),1))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
 
-    #set text parameters
-    textfont = cv2.FONT_HERSHEY_SIMPLEX
-    textposition = (10,30)
-    textfontscale = 1
-    textlinetype = 2
-    textfontcolor = 255
 
-    #Initialize first frame
-    ret, frame_new = cap.read()
-    frame_new = cv2.cvtColor(frame_new, cv2.COLOR_BGR2GRAY)
-    frame_new = cropframe(frame_new, crop)
-    frame_new = cv2.GaussianBlur(frame_new.astype('float'),(0,0),SIGMA)
+
+
+
+########################################################################################
+
+def Motion_Buffers(frame,block_size,SIGMA=1,precision='float'):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Allocates buffers used by `Motion_Block` to process blocks of frames, and 
+    initializes them with first frame of video segment.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        frame:: [numpy.ndarray]
+            First grayscale frame of video segment, after cropping.
+            
+        block_size:: [uint]
+            Number of frames decoded together.
+                
+        SIGMA:: [float]
+            Sigma value for gaussian filter applied to each image. Passed to 
+            OpenCV `cv2.GuassianBlur`.
+            
+        precision:: [str]
+            'float' or 'uint8'. See `Measure_Motion`.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        buffers:: [dict]
+            Dictionary with the following keys:
+                'gray' : decoded frames of block, to be filled by caller 
+                         [numpy.ndarray of shape (block_size,h,w)]
+                'converted' : frame converted to processing dtype [numpy.ndarray]
+                'blurred' : pair of blurred frames, current and prior 
+                            [numpy.ndarray of shape (2,h,w)]
+                'last' : index in 'blurred' of last blurred frame [int]
+                'frame_dif' : absolute difference of current frame [numpy.ndarray]
+                'frame_cut' : thresholded differences of block 
+                              [numpy.ndarray of shape (block_size,h,w)]
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+
+    """
+    
+    h,w = frame.shape
+    dtype = 'uint8' if precision == 'uint8' else 'float'
+    buffers = dict(
+        gray = np.zeros((block_size,h,w),dtype='uint8'),
+        converted = np.zeros((h,w),dtype=dtype),
+        blurred = np.zeros((2,h,w),dtype=dtype),
+        last = 0,
+        frame_dif = np.zeros((h,w),dtype=dtype),
+        frame_cut = np.zeros((block_size,h,w),dtype='uint8'))
+    np.copyto(buffers['converted'], frame)
+    cv2.GaussianBlur(buffers['converted'],(0,0),SIGMA,dst=buffers['blurred'][0])
+    return buffers
+
+
+
+
+
+########################################################################################
+
+def Motion_Block(buffers,n,mt_cutoff,SIGMA=1,precision='float'):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Blurs, differences, thresholds and counts first `n` frames held in 
+    `buffers['gray']`, one frame at a time, such that each frame's working arrays 
+    remain in cache. Last blurred frame is retained in `buffers['blurred']`, ready for
+    the next block.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        buffers:: [dict]
+            Dictionary of block buffers, as returned by `Motion_Buffers`.
+            
+        n:: [uint]
+            Number of frames in block.
+            
+        mt_cutoff:: [float or list]
+            Threshold value for determining magnitude of change sufficient to mark
+            pixel as changing from prior frame. See `Measure_Motion`.
+                
+        SIGMA:: [float]
+            Sigma value for gaussian filter applied to each image. Passed to 
+            OpenCV `cv2.GuassianBlur`.
+            
+        precision:: [str]
+            'float' or 'uint8'. See `Measure_Motion`.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Motion:: [numpy.array]
+            Number of pixels per frame of block whose intensity change from previous 
+            frame exceeds `mt_cutoff`. If list of cutoffs is passed, 2d array of shape
+            (n, cutoffs).
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Frames are converted to float into a preallocated buffer, rather than by 
+          `astype`, and blurred, differenced and thresholded into preallocated 
+          buffers, such that no arrays are allocated per frame for a single cutoff.
+
+    """
+    
+    gray, blurred, frame_dif = buffers['gray'], buffers['blurred'], buffers['frame_dif']
+    Motion = np.zeros((n,) + np.shape(mt_cutoff))
+    if np.ndim(mt_cutoff) != 0:
+        cutoffs = np.asarray(mt_cutoff,dtype='float')
+        order = np.argsort(cutoffs)
+    
+    for i in range(n):
+        
+        #Blur frame, and difference from prior blurred frame
+        old, new = blurred[buffers['last']], blurred[1-buffers['last']]
+        if precision == 'uint8':
+            cv2.GaussianBlur(gray[i],(0,0),SIGMA,dst=new)
+        else:
+            np.copyto(buffers['converted'], gray[i])
+            cv2.GaussianBlur(buffers['converted'],(0,0),SIGMA,dst=new)
+        cv2.absdiff(new, old, dst=frame_dif)
+        buffers['last'] = 1 - buffers['last']
+        
+        #Threshold and count
+        frame_cut = buffers['frame_cut'][i]
+        if np.ndim(mt_cutoff) == 0 and precision == 'uint8':
+            cv2.threshold(frame_dif, mt_cutoff, 1, cv2.THRESH_BINARY, dst=frame_cut)
+            Motion[i] = cv2.countNonZero(frame_cut)
+        elif np.ndim(mt_cutoff) == 0:
+            np.greater(frame_dif, mt_cutoff, out=frame_cut)
+            Motion[i] = cv2.countNonZero(frame_cut)
+        else:
+            #bin index of each pixel is number of cutoffs its difference exceeds
+            bin_idx = np.searchsorted(cutoffs[order], frame_dif.ravel(), side='left')
+            hist = np.bincount(bin_idx, minlength=len(cutoffs)+1)
+            Motion[i,order] = np.cumsum(hist[::-1])[::-1][1:]
+    return Motion
+
+
+
+
+
+########################################################################################
+
+def Video_Hash(fpath,chunk_size=2**20,n_chunks=8):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Returns hash identifying content of video file. To remain fast for large files, the
+    hash is computed from file size and evenly spaced chunks of the file, including its 
+    first and last bytes.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        fpath:: [str]
+            Path to video file.
+            
+        chunk_size:: [uint]
+            Number of bytes in each chunk read.
+            
+        n_chunks:: [uint]
+            Number of chunks read in addition to first and last chunk of file.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        digest:: [str]
+            Hexadecimal SHA-1 digest.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+
+    """
+    
+    size = os.path.getsize(fpath)
+    digest = hashlib.sha1(str(size).encode())
+    with open(fpath,'rb') as f:
+        positions = np.linspace(0, max(size-chunk_size,0), n_chunks+2).astype(int)
+        for position in np.unique(positions):
+            f.seek(position)
+            digest.update(f.read(chunk_size))
+    return digest.hexdigest()
+
+
+
+
+
+########################################################################################
+
+def Motion_Cache_Path(video_dict,params):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Returns path of file in which motion values are cached for given video and set of
+    motion parameters. Cache files are stored in `video_dict['cache_dir']`, which 
+    defaults to folder 'MotionCache' within `video_dict['dpath']`.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+                'fpath' : full path to file [str]
+                'cache_dir' : (optional) directory in which to store cached motion
+                              values [str]
+                'cache_mb' : (optional) maximum size of cache directory, in 
+                             megabytes. Defaults to 1000 [numeric]
+                              
+        params:: [dict]
+            Dictionary of all parameters that `Motion` depends upon (e.g. 'start', 
+            'end', 'crop', 'SIGMA', 'mt_cutoff'). Values must be json serializable.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        cache_path:: [str]
+            Path to .npy cache file. File may not yet exist.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Cache files are named by a hash of `params` and `Video_Hash` of the video 
+          file, not by file name, such that a renamed video is still recognized and a
+          modified video is not. A video moved to another folder is only recognized 
+          if `video_dict['cache_dir']` points to the same cache directory.
+
+    """
+    
+    cache_dir = video_dict.get('cache_dir', os.path.join(os.path.normpath(video_dict['dpath']), 'MotionCache'))
+    key = json.dumps(dict(params, video=Video_Hash(video_dict['fpath'])), sort_keys=True, default=str)
+    key = hashlib.sha1(key.encode()).hexdigest()[:20]
+    fname = 'motion_{k}.npy'.format(k=key)
+    return os.path.join(cache_dir, fname)
+
+
+
+
+
+########################################################################################
+
+def Motion_Cache_Load(cache_path):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Loads cached motion values, if present, and marks cache file as recently used.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        cache_path:: [str]
+            Path to .npy cache file, as returned by `Motion_Cache_Path`.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Motion:: [numpy.array]
+            Array containing number of pixels per frame whose intensity change from
+            previous frame exceeds `mt_cutoff`. None if not in cache.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+
+    """
+    
+    try:
+        Motion = np.load(cache_path).astype('float')
+    except (OSError, ValueError):
+        return None
+    os.utime(cache_path)
+    print('Loaded motion from cache: {f}'.format(f=cache_path))
+    return Motion
+
+
+
+
+
+########################################################################################
+
+def Motion_Cache_Save(cache_path,Motion,max_mb=1000):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Saves motion values to cache. If cache directory then exceeds `max_mb`, least 
+    recently used cache files are removed.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        cache_path:: [str]
+            Path to .npy cache file, as returned by `Motion_Cache_Path`.
+            
+        Motion:: [numpy.array]
+            Array containing number of pixels per frame whose intensity change from
+            previous frame exceeds `mt_cutoff`.
+            
+        max_mb:: [numeric]
+            Maximum size of cache directory, in megabytes.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Nothing returned
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Motion values are pixel counts, and are stored as uint32. Motion values 
+          scaled from downsampled frames are stored as float64.
+        - File is written under a temporary name and then renamed, such that parallel
+          workers never read a partially written file.
+        - Only motion cache files ('motion_*.npy') count toward `max_mb` and are 
+          removed, such that other files in the cache directory (e.g. cached reference
+          frames, if `cache_dir` is shared) are left untouched. Motion masks are stored
+          in a separate folder (see `Measure_Motion`), and are never removed.
+
+    """
+    
+    #Write cache file
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = '{p}.{pid}.tmp'.format(p=cache_path, pid=os.getpid())
+    with open(tmp_path,'wb') as f:
+        integer = np.all(Motion == np.around(Motion))
+        np.save(f, Motion.astype('uint32') if integer else Motion)
+    os.replace(tmp_path, cache_path)
+    
+    #Evict least recently used files until cache is within size limit
+    files = []
+    for f in os.listdir(cache_dir):
+        try:
+            stat = os.stat(os.path.join(cache_dir,f))
+            files.append((stat.st_mtime, stat.st_size, os.path.join(cache_dir,f)))
+        except OSError: #file removed by another process
+            pass
+    files = sorted(f for f in files if fnmatch.fnmatch(os.path.basename(f[2]),'motion_*.npy'))
+    total = sum(f[1] for f in files)
+    files = [f for f in files if f[2] != cache_path] #never evict file just written
+    while total > max_mb*2**20 and len(files) > 0:
+        mtime, size, oldest = files.pop(0)
+        total -= size
+        try:
+            os.remove(oldest)
+        except OSError:
+            pass
+
+
+
+
+
+########################################################################################
+
+def Motion_Masks_Load(mask_path,video_dict=None,crop=None):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Loads bit-packed motion masks saved by `Measure_Motion`. 
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        mask_path:: [str]
+            Path to .npy or .npz mask file, as stored in `video_dict['masks']` by
+            `Measure_Motion`.
+            
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'fpath' : Full path to video file.
+                'start' : Frame at which analysis starts.
+                'end' : Frame at which analysis ends.
+            If passed, masks are only returned if they were saved for this video and
+            frame range.
+            
+        crop:: [holoviews.streams.stream or dict]
+            Crop that masks must have been saved with. Only checked if `video_dict`
+            is passed.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        masks:: [numpy.array]
+            Array of shape (frames, height, ceil(width/8)), with row `i` of frame `f` 
+            holding bits of pixels whose intensity change from the prior frame 
+            exceeded `mt_cutoff`. Memory-mapped for .npy files. Unpack a frame with 
+            `np.unpackbits(masks[f], axis=1, count=width)`. None if file is missing,
+            or if masks do not match `video_dict` and `crop`.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Frames are relative to `video_dict['start']` when masks were saved. First 
+          frame has no prior frame, and is empty.
+
+    """
+    
+    if not os.path.isfile(mask_path):
+        return None
+    
+    #Check masks against current video, frame range and crop
+    if video_dict is not None:
+        try:
+            with open(mask_path + '.json') as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            info = None
+        current = dict(video=Video_Hash(video_dict['fpath']), start=video_dict['start'],
+                       end=video_dict['end'], crop=Crop_Spec(crop))
+        if info != json.loads(json.dumps(current, default=str)):
+            print('Motion masks do not match current video, frame range or crop. '
+                  'Motion is recomputed for display: {f}'.format(f=mask_path))
+            return None
+    
+    if mask_path.endswith('.npy'):
+        return np.load(mask_path, mmap_mode='r')
+    with np.load(mask_path) as f:
+        return f['masks']
+    
+    
+    
+    
+    
+########################################################################################
+
+def Crop_Spec(crop):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Converts `crop` into a plain crop specification, with integer bounds of the cropped
+    region. The specification can be computed once per video, applied to each frame by
+    `cropframe`, and passed to other processes or saved, without holoviews.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        crop:: [hv.streams.stream or dict]
+            Holoviews stream object enabling dynamic selection in response to 
+            cropping tool. `crop.data` contains x and y coordinates of crop
+            boundary vertices. Set to None if no cropping supplied. If a crop 
+            specification is passed, it is returned unchanged. If a dictionary of 
+            named crop regions is passed, each region is converted.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        crop:: [dict]
+            Dictionary with the following keys, or None if no cropping supplied:
+                'y0' : first row of cropped region [int]
+                'y1' : row after last row of cropped region [int]
+                'x0' : first column of cropped region [int]
+                'x1' : column after last column of cropped region [int]
+            If dictionary of named crop regions is passed, dictionary of such
+            specifications, with region names as keys.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Bounds are used as python slice bounds, such that a frame is cropped as
+          `frame[y0:y1,x0:x1]`.
+        - Region names should not be 'y0', 'y1', 'x0' or 'x1'.
+
+    """
+    
+    #Dictionary of named regions
+    if isinstance(crop, dict) and 'y0' not in crop:
+        return {name: Crop_Spec(region) for name, region in crop.items()}
+    
+    if crop is None or isinstance(crop, dict):
+        return crop
+    
+    #No crop drawn
+    if len(crop.data.get('x0',[])) == 0:
+        return None
+    
+    Xs=[crop.data['x0'][0],crop.data['x1'][0]]
+    Ys=[crop.data['y0'][0],crop.data['y1'][0]]
+    return dict(y0=int(min(Ys)), y1=int(max(Ys)), x0=int(min(Xs)), x1=int(max(Xs)))
+    
+    
+    
+    
+
+########################################################################################    
+def cropframe(frame,crop=None):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Crops passed frame with `crop` specification
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        frame:: [numpy.ndarray]
+            2d numpy array. 3d arrays (e.g. color frames) are cropped in their first 
+            two dimensions.
+        crop:: [hv.streams.stream or dict]
+            Holoviews stream object enabling dynamic selection in response to 
+            cropping tool. `crop.data` contains x and y coordinates of crop
+            boundary vertices. Set to None if no cropping supplied. Alternatively, 
+            crop specification returned by `Crop_Spec`, which should be used when
+            cropping many frames.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        frame:: [numpy.ndarray]
+            2d numpy array. View of passed frame.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+
+    """
+    
+    crop = Crop_Spec(crop)
+    if crop is None:
+        return frame
+    return frame[crop['y0']:crop['y1'],crop['x0']:crop['x1']]
+ 
+    
+    
+    
+
+########################################################################################
+
+class FrameReader:
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Reads frames of a video on a background thread, converting each to grayscale and 
+    cropping it, such that decoding of upcoming frames proceeds while the current frame
+    is analyzed. Frames are written to a small, fixed set of reusable buffers.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        fpath:: [str]
+            Full path to video file.
+            
+        start:: [uint]
+            Frame at which to start. 0-based.
+            
+        end:: [uint]
+            Frame at which to end (exclusive). Set to None to read until the last 
+            frame of the video.
+                
+        crop:: [holoviews.streams.stream]
+            Holoviews stream object enabling dynamic selection in response to 
+            cropping tool. `crop.data` contains x and y coordinates of crop
+            boundary vertices. Set to None if no cropping supplied. Alternatively,
+            crop specification returned by `Crop_Spec`.
+            
+        n_buffers:: [uint]
+            Number of frame buffers. Decoding runs at most `n_buffers-1` frames 
+            ahead of analysis. Must be at least 2.
+            
+        reader:: [str]
+            Decoding backend. Takes the following values:
+                'cv2' : frames are decoded to BGR by `cv2.VideoCapture`, then 
+                        cropped and converted to grayscale.
+                'ffmpeg' : frames are decoded by an `ffmpeg` subprocess, which 
+                           crops them and extracts luma before writing raw 
+                           grayscale frames to a pipe. Requires `ffmpeg` on the 
+                           system path. See Notes.
+    
+    -------------------------------------------------------------------------------------
+    Attributes:
+        fps:: [float]
+            Frames per second of video, as reported by OpenCV.
+            
+        frame_count:: [uint]
+            Total number of frames in video, as reported by OpenCV.
+            
+        shape:: [tuple]
+            Shape of processed frames, (height, width). None if no frame could be read.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - `read` mirrors `cv2.VideoCapture.read`, returning `ret, frame`. The returned
+          frame is only valid until the next call to `read`, after which its buffer
+          is reused. Copy it if it must be retained.
+        - `release` should be called when done, or the reader used as a context 
+          manager.
+        - With `reader='ffmpeg'`, grayscale values are the decoder's luma plane
+          rather than OpenCV's weighted sum of BGR values. These typically differ by
+          a grayscale level or less, but can differ more in fine, saturated color 
+          detail, where chroma subsampling affects the BGR values. Parameters such as `mt_cutoff`
+          should be calibrated with the same backend used for analysis. The first 
+          frame is located by input seeking (ffmpeg's `-ss`) to time `start/fps`. 
+          ffmpeg decodes from the preceding keyframe and discards frames before 
+          `start`, such that the prefix of the video is not decoded. This assumes a
+          constant frame rate.
+        - If ffmpeg exits with an error before `end`, `read` raises `RuntimeError`
+          with ffmpeg's error output, rather than ending the video early.
+
+    """
+    
+    def __init__(self,fpath,start=0,end=None,crop=None,n_buffers=4,reader='cv2'):
+        
+        #Open video
+        self.cap = cv2.VideoCapture(fpath)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.remaining = end - start if end is not None else None
+        self.crop = Crop_Spec(crop)
+        self.reader = reader
+        self.free = queue.Queue()
+        self.filled = queue.Queue()
+        self.current = None
+        self.done = False
+        self.error = None
+        self.stopped = threading.Event()
+        self.thread = None
+        self.shape = None
+        if reader == 'cv2':
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES,start)
+        elif reader == 'ffmpeg':
+            self.open_ffmpeg(fpath,start)
+        else:
+            raise ValueError("reader must be 'cv2' or 'ffmpeg'")
+        
+        #Read first frame to define buffers
+        frame = None
+        if reader == 'cv2' and self.remaining != 0:
+            ret, frame = self.cap.read()
+            self.shape = cropframe(frame, self.crop).shape[:2] if ret == True else None
+        if self.shape is None or self.remaining == 0:
+            self.shape = None
+            self.filled.put(None)
+            return
+        for i in range(max(n_buffers,2)):
+            buffer = np.frombuffer(bytearray(self.shape[0]*self.shape[1]),dtype='uint8')
+            self.free.put(buffer.reshape(self.shape))
+        buffer = self.free.get()
+        if not self.grab(buffer,frame):
+            self.shape = None
+            self.filled.put(None)
+            return
+        self.filled.put(buffer)
+        
+        #Decode remaining frames in background
+        self.thread = threading.Thread(target=self.decode,daemon=True)
+        self.thread.start()
+        
+    def open_ffmpeg(self,fpath,start):
+        
+        #Define crop region in ffmpeg terms, with same bounds as `cropframe`
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.cap.release()
+        rows, cols = range(height), range(width)
+        if self.crop is not None:
+            rows = rows[self.crop['y0']:self.crop['y1']]
+            cols = cols[self.crop['x0']:self.crop['x1']]
+        self.shape = (len(rows), len(cols))
+        if len(rows) == 0 or len(cols) == 0:
+            self.remaining = 0
+            return
+        vf = 'format=gray,crop={w}:{h}:{x}:{y}'.format(
+            w=len(cols), h=len(rows), x=cols[0], y=rows[0])
+        
+        #Seek to time of start frame, from which ffmpeg decodes from prior keyframe
+        seek = []
+        if start > 0 and self.fps > 0:
+            seek = ['-ss', '{t:.6f}'.format(t=start/self.fps)]
+        
+        #Launch decoder, writing raw grayscale frames to pipe and errors to file
+        command = ['ffmpeg', '-v', 'error', '-nostdin'] + seek + ['-i', fpath, '-an', '-sn', 
+                   '-vf', vf, '-vsync', '0', '-f', 'rawvideo', '-pix_fmt', 'gray', '-']
+        if self.remaining is not None:
+            command[-1:-1] = ['-frames:v', str(self.remaining)]
+        self.stderr = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(command, stdout=subprocess.PIPE, 
+                                     stderr=self.stderr, bufsize=0)
+        
+    def grab(self,buffer,frame=None):
+        
+        if self.reader == 'cv2':
+            if frame is None:
+                ret, frame = self.cap.read()
+                if ret == False:
+                    return False
+            cv2.cvtColor(cropframe(frame, self.crop), cv2.COLOR_BGR2GRAY, dst=buffer)
+            return True
+        
+        #Fill buffer directly from ffmpeg pipe
+        view = memoryview(buffer).cast('B')
+        n = 0
+        while n < len(view):
+            n_read = self.proc.stdout.readinto(view[n:])
+            if not n_read:
+                self.check_ffmpeg()
+                return False
+            n += n_read
+        return True
+    
+    def check_ffmpeg(self):
+        
+        #Raise ffmpeg's error output if it exited with an error, unless killed by release
+        if self.proc.wait() != 0 and not self.stopped.is_set():
+            self.stderr.seek(0)
+            message = self.stderr.read().decode(errors='replace').strip()
+            raise RuntimeError('ffmpeg exited with code {c}: {m}'.format(
+                c=self.proc.returncode, m=message))
+        
+    def decode(self):
+        try:
+            x = 1
+            while not self.stopped.is_set() and (self.remaining is None or x < self.remaining):
+                buffer = self.free.get()
+                if self.stopped.is_set() or not self.grab(buffer):
+                    break
+                self.filled.put(buffer)
+                x += 1
+        except Exception as e:
+            self.error = e
+        self.filled.put(None)
+        
+    def read(self):
+        
+        #Return buffer of prior frame for reuse
+        if self.current is not None:
+            self.free.put(self.current)
+            self.current = None
+        if self.done:
+            return False, None
+        
+        #Get next frame
+        self.current = self.filled.get()
+        if self.current is None:
+            self.done = True
+            if self.error is not None:
+                raise self.error
+            return False, None
+        return True, self.current
+    
+    def release(self):
+        self.stopped.set()
+        if self.reader == 'ffmpeg' and hasattr(self, 'proc'):
+            self.proc.kill()
+        if self.thread is not None:
+            self.free.put(np.empty(self.shape,dtype='uint8')) #unblock decoding thread
+            self.thread.join()
+        if self.reader == 'ffmpeg' and hasattr(self, 'proc'):
+            self.proc.stdout.close()
+            self.proc.wait()
+            self.stderr.close()
+        self.cap.release()
+        self.done = True
+        
+    def __enter__(self):
+        return self
+    
+    def __exit__(self,*args):
+        self.release()
+        
+        
+        
+        
+
+########################################################################################
+
+def Measure_Freezing(Motion,FreezeThresh,MinDuration=0):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Calculates freezing on a frame by frame basis based upon measure of motion.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        Motion:: [numpy.array or dict]
+            Array containing number of pixels per frame whose intensity change from
+            previous frame exceeds `mt_cutoff`. Alternatively, dictionary of such 
+            arrays, with region (e.g. chamber) names as keys.
+                
+        FreezeThresh:: [float]
+            Threshold value for determining magnitude of activity in `Motion` to designate
+            frame as freezing/not freezing (i.e. if motion is below `FreezeThresh`, animal
+            is likely freezing).
+                
+        MinDuration:: [uint8]
+            Duration for which `Motion` must be below `FreezeThresh` for freezing to be 
+            registered.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Freezing:: [numpy.array or dict]
+            Array defining whether animal is freezing on frame by frame basis.  
+            0 = Not Freezing; 100 = Freezing. If `Motion` is dictionary, dictionary of
+            such arrays, with the same keys.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Although Motion argument is often `Motion` array returned by function 
+          `Measure_Motion`, any unidimensional array could be passed.
+
+    """
+    
+    #Measure freezing of each region separately
+    if isinstance(Motion, dict):
+        return {name: Measure_Freezing(M,FreezeThresh,MinDuration) for name, M in Motion.items()}
+
+    #Find start and end of each freezing bout, and mark bouts as freezing
+    starts, ends = Freeze_Runs(Motion,FreezeThresh,MinDuration)
+    Freezing = np.zeros(len(Motion)+1,dtype=int)
+    Freezing[starts] += 1
+    Freezing[ends] -= 1
+    Freezing = (np.cumsum(Freezing[:-1])>0).astype(int)
+    Freezing = Freezing*100 #Convert to Percentage
+    
+    return(Freezing)
+
+
+
+
+
+########################################################################################
+
+def Freeze_Runs(Motion,FreezeThresh,MinDuration=0):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Finds start and end frames of freezing bouts, by run-length encoding frames where
+    motion is below threshold.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        Motion:: [numpy.array]
+            Array containing number of pixels per frame whose intensity change from
+            previous frame exceeds `mt_cutoff`. 
+                
+        FreezeThresh:: [float]
+            Threshold value for determining magnitude of activity in `Motion` to designate
+            frame as freezing/not freezing.
+                
+        MinDuration:: [uint8]
+            Duration for which `Motion` must be below `FreezeThresh` for freezing to be 
+            registered.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        starts:: [numpy.array]
+            First frame of each freezing bout.
+            
+        ends:: [numpy.array]
+            Frame following last frame of each freezing bout.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - As in prior frame by frame implementation of `Measure_Freezing`, the first 
+          frame is never counted as below threshold, and if `MinDuration` is 0 or less
+          every frame is considered freezing.
+
+    """
+    
+    #Find runs of frames below thresh. First frame is never counted, as Motion is 0 by definition.
+    BelowThresh = np.zeros(len(Motion)+2,dtype='int8')
+    BelowThresh[2:-1] = Motion[1:]<FreezeThresh
+    edges = np.diff(BelowThresh)
+    starts = np.flatnonzero(edges==1)
+    ends = np.flatnonzero(edges==-1)
+    
+    #Runs of at least MinDuration frames are freezing
+    if MinDuration <= 0 and len(Motion) > 0:
+        return np.array([0]), np.array([len(Motion)])
+    keep = (ends - starts) >= MinDuration
+    return starts[keep], ends[keep]
+
+
+
+
+
+########################################################################################
+
+def Freezing_Bouts(Motion,FreezeThresh,MinDuration=0):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Returns table of freezing bouts, with start frame, end frame and duration of each.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        Motion:: [numpy.array]
+            Array containing number of pixels per frame whose intensity change from
+            previous frame exceeds `mt_cutoff`. 
+                
+        FreezeThresh:: [float]
+            Threshold value for determining magnitude of activity in `Motion` to designate
+            frame as freezing/not freezing.
+                
+        MinDuration:: [uint8]
+            Duration for which `Motion` must be below `FreezeThresh` for freezing to be 
+            registered.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        bouts:: [pandas.dataframe]
+            Pandas dataframe with one row per freezing bout, with columns 'Start' 
+            (first frame of bout), 'End' (frame following last frame of bout) and
+            'Duration' (number of frames).
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Frames are relative to first frame of `Motion`, and freezing bouts match 
+          `Measure_Freezing(Motion,FreezeThresh,MinDuration)`.
+
+    """
+    
+    starts, ends = Freeze_Runs(Motion,FreezeThresh,MinDuration)
+    bouts = pd.DataFrame({
+        'Start' : starts,
+        'End' : ends,
+        'Duration' : ends - starts
+    })
+    return bouts
+
+
+
+
+
+########################################################################################
+
+def Freezing_Sweep(Motion,FreezeThresh,MinDuration,bin_dict=None):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Calculates percent freezing per bin for every combination of `FreezeThresh` and 
+    `MinDuration` values provided. Intended for calibration of freezing parameters 
+    against hand scoring.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        Motion:: [numpy.array or dict]
+            Array containing number of pixels per frame whose intensity change from
+            previous frame exceeds `mt_cutoff`. Alternatively, dictionary of such arrays, 
+            with keys being names of the videos (e.g. filenames).
+                
+        FreezeThresh:: [list]
+            List of `FreezeThresh` values to be examined.
+                
+        MinDuration:: [list]
+            List of `MinDuration` values to be examined.
+        
+        bin_dict:: [dict]
+            Dictionary specifying bins.  Dictionary keys should be names of the bins.  
+            Dictionary value for each bin should be a tuple, with the start and end of 
+            the bin, in frames, relative to the start of the analysis period. If no bins 
+            are to be specified, set bin_dict = None.
+            example = bin_dict = {1:(0,100), 2:(100,200)}
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        df:: [pandas.dataframe]
+            Pandas dataframe with one row per combination of file, `FreezeThresh`, 
+            `MinDuration` and bin, with percent freezing in column 'Freezing'.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Values of 'Freezing' are identical to those returned by `Summarize` after 
+          `Measure_Freezing`.
+        - Runs of frames below threshold are found once per `FreezeThresh` value, and 
+          are shared across all `MinDuration` values.
+
+    """
+    
+    Motions = Motion if isinstance(Motion,dict) else {None : Motion}
+    MinDuration = np.asarray(MinDuration)
+    
+    results = []
+    for file, Motion in Motions.items():
+        
+        #define bins, with bounds matching slicing of Motion
+        avg_dict = {'all': (0, len(Motion))}
+        bins = bin_dict if bin_dict is not None else avg_dict
+        ranges = [range(len(Motion))[slice(rng[0],rng[1])] for rng in bins.values()]
+        lengths = np.array([len(rng) for rng in ranges])
+        
+        for thresh in FreezeThresh:
+            
+            #find all runs below threshold, ordered from longest to shortest
+            starts, ends = Freeze_Runs(Motion,thresh,MinDuration=1)
+            order = np.argsort(ends - starts, kind='stable')[::-1]
+            starts, ends = starts[order], ends[order]
+            
+            #number of runs long enough to be freezing for each MinDuration
+            n_runs = np.searchsorted(-(ends - starts), -MinDuration, side='right')
+            
+            #frames freezing in each bin, for each MinDuration
+            count = np.zeros((len(MinDuration),len(ranges)))
+            for b, rng in enumerate(ranges):
+                overlap = np.minimum(ends, rng.stop) - np.maximum(starts, rng.start)
+                overlap = np.concatenate(([0], np.cumsum(np.maximum(overlap, 0))))
+                count[:,b] = np.where(MinDuration > 0, overlap[n_runs], len(rng))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                freezing = 100*count / lengths
+            
+            results.append(pd.DataFrame({
+                'File' : [file]*freezing.size,
+                'FreezeThresh' : np.ones(freezing.size)*thresh,
+                'MinFreezeDuration' : np.repeat(MinDuration, len(ranges)),
+                'bin' : list(bins.keys())*len(MinDuration),
+                'range(f)' : list(bins.values())*len(MinDuration),
+                'Freezing' : freezing.ravel()
+            }))
+    
+    df = pd.concat(results, ignore_index=True)
+    df = df.drop(columns='File') if None in Motions else df
+    return df
+
+
+
+
+
+########################################################################################
+
+def Stream_Freezing(source,mt_cutoff,FreezeThresh,MinDuration,crop=None,SIGMA=1,
+                    precision='float',realtime=False,fps=None,budget=None):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Measures motion and freezing frame by frame from a live capture source (e.g. camera)
+    or video file, yielding results for each frame as soon as it is processed, such that
+    freezing can be acted upon during a session (e.g. to trigger stimuli).
+
+    -------------------------------------------------------------------------------------
+    Args:
+        source:: [str, int, cv2.VideoCapture or FrameReader]
+            Capture source. If string, path to video file, which is read with 
+            `FrameReader`. If integer, index of camera passed to `cv2.VideoCapture`.
+            Alternatively, any object with `read` method returning `ret, frame` 
+            (e.g. opened `cv2.VideoCapture`). Frames from sources other than 
+            `FrameReader` are cropped and converted to grayscale.
+        
+        mt_cutoff:: [float]
+            Threshold value for determining magnitude of change sufficient to mark
+            pixel as changing from prior frame.
+                
+        FreezeThresh:: [float]
+            Threshold value for determining magnitude of activity in `Motion` to designate
+            frame as freezing/not freezing.
+                
+        MinDuration:: [uint8]
+            Duration for which `Motion` must be below `FreezeThresh` for freezing to be 
+            registered.
+                
+        crop:: [holoviews.streams.stream]
+            Holoviews stream object enabling dynamic selection in response to 
+            cropping tool. `crop.data` contains x and y coordinates of crop
+            boundary vertices. Set to None if no cropping supplied.
+                
+        SIGMA:: [float]
+            Sigma value for gaussian filter applied to each image. Passed to 
+            OpenCV `cv2.GuassianBlur`.
+            
+        precision:: [str]
+            Numeric precision of frame processing, 'float' or 'uint8'. See 
+            `Measure_Motion`.
+            
+        realtime:: [bool]
+            If True, frames from a video file are released at the file's native frame
+            rate, simulating a live camera. Has no effect on other sources.
+            
+        fps:: [float]
+            Frame rate of source, used when `realtime=True`. If None, taken from 
+            `cv2.VideoCapture` sources, or from `fps` attribute of other sources 
+            (e.g. `FrameReader`), if present.
+            
+        budget:: [float]
+            Maximum acceptable latency per frame, in seconds. Frames whose 'Latency'
+            exceeds `budget` are flagged with 'OverBudget'. Set to None for no budget.
+    
+    -------------------------------------------------------------------------------------
+    Yields:
+        result:: [dict]
+            Dictionary for each frame, with the following keys:
+                'Frame' : frame number, relative to first frame of source [int]
+                'Motion' : number of pixels whose intensity change from prior frame
+                           exceeds `mt_cutoff` [float]
+                'Freezing' : 100 if animal is freezing, otherwise 0 [int]
+                'Event' : 'onset' on frame at which a freezing bout is detected, 
+                          'offset' on first frame following a bout, otherwise None [str]
+                'EventFrame' : for onsets, first frame of the bout, which precedes 
+                               detection by `MinDuration-1` frames. For offsets, 
+                               current frame. Otherwise None [int]
+                'Latency' : time from frame being returned by source to result being
+                            yielded, in seconds [float]
+                'OverBudget' : True if 'Latency' exceeds `budget`, otherwise False 
+                               [bool]
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Motion values are identical to those of `Measure_Motion` with the same 
+          parameters. Bouts are identical to those of `Freezing_Bouts`, but are 
+          detected once `MinDuration` frames below `FreezeThresh` have been observed,
+          such that 'Freezing' only becomes 100 at onset. `MinDuration` is treated as
+          at least 1.
+        - Frames over `budget` are flagged, not dropped, such that 'Motion' is always
+          measured between consecutive frames. Latency does not include time frames
+          spend buffered by the source before being read; if processing falls behind
+          a live camera, buffered frames are processed late rather than skipped.
+        - The source is released when the stream ends, or when the generator is 
+          closed (e.g. by `break` in a for loop) if it was opened here.
+        - Example:
+              for result in Stream_Freezing('video.avi',10,100,15):
+                  if result['Event'] == 'onset':
+                      ...
+        
+    """
+    
+    #Open source
+    if isinstance(source, (str, int)):
+        cap = FrameReader(source,crop=crop) if isinstance(source, str) else cv2.VideoCapture(source)
+        release = True
+    else:
+        cap, release = source, False
+    if fps is None:
+        fps = cap.get(cv2.CAP_PROP_FPS) if isinstance(cap, cv2.VideoCapture) else getattr(cap,'fps',None)
+    pace = realtime and isinstance(source, str) and bool(fps) and fps > 0
+    crop = Crop_Spec(crop)
+    
+    try:
+        #Initialize first frame and buffers
+        x = 0
+        ret, frame = cap.read()
+        t_start = time.perf_counter()
+        while ret == True:
+            t_frame = time.perf_counter()
+            if not isinstance(cap, FrameReader):
+                frame = cv2.cvtColor(cropframe(frame, crop), cv2.COLOR_BGR2GRAY)
+            
+            if x == 0:
+                buffers = Motion_Buffers(frame,1,SIGMA,precision)
+                Motion, Freezing, run = 0, 0, 0
+                event, event_frame = None, None
+            else:
+                #Measure motion from prior frame
+                buffers['gray'][0] = frame
+                Motion = Motion_Block(buffers,1,mt_cutoff,SIGMA,precision)[0]
+                
+                #Update count of consecutive frames below threshold, and freezing state
+                run = run+1 if Motion < FreezeThresh else 0
+                event, event_frame = None, None
+                if Freezing == 0 and run >= max(MinDuration,1):
+                    Freezing, event, event_frame = 100, 'onset', x-run+1
+                elif Freezing == 100 and run == 0:
+                    Freezing, event, event_frame = 0, 'offset', x
+            
+            latency = time.perf_counter() - t_frame
+            yield {'Frame' : x, 'Motion' : Motion, 'Freezing' : Freezing, 'Event' : event,
+                   'EventFrame' : event_frame, 'Latency' : latency, 
+                   'OverBudget' : budget is not None and latency > budget}
+            
+            #Wait for next frame, if replaying file at native frame rate
+            x += 1
+            if pace:
+                time.sleep(max(t_start + x/fps - time.perf_counter(), 0))
+            ret, frame = cap.read()
+    finally:
+        if release:
+            cap.release()
+        
+
+
+
+
+########################################################################################
+
+def PlayVideo(video_dict,display_dict,Freezing,mt_cutoff,crop=None,SIGMA=1,masks=None):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Play portion of video back, displaying thresholded video in tandem. Displayed
+    externally
+
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+                'fps' : frames per second of video files to be processed [int]
+                'start' : frame at which to start. 0-based [int]
+                'end' : frame at which to end.  set to None if processing 
+                        whole video [int]
+                'reader' : (optional) video decoding backend, 'cv2' (default) or 
+                           'ffmpeg'. See `FrameReader` [str]
+                'ftype' : (only if batch processing) 
+                          video file type extension (e.g. 'wmv') [str]
+                'FileNames' : (only if batch processing)
+                              List of filenames of videos in folder to be batch 
+                              processed.  [list]
+                
+        display_dict:: [dict]
+            Dictionary with the following keys:
+                'start' : start point of video segment in frames [int]
+                'end' : end point of video segment in frames [int]
+                'fps' : frames per second of video file/files to be processed [int]
+                'quality' : (optional) JPEG quality of displayed frames, 0-100. 
+                            Default is 75. [int]
+                'save_video' : option to save video if desired [bool]
+                               Currently, will be saved at 20 fps even if video 
+                               is something else
+                               
+        Freezing:: [numpy.array]
+            Array defining whether animal is freezing on frame by frame basis.  
+            0 = Not Freezing; 100 = Freezing
+        
+        mt_cutoff:: [float]
+            Threshold value for determining magnitude of change sufficient to mark
+            pixel as changing from prior frame.
+        
+        crop:: [holoviews.streams.stream]
+            Holoviews stream object enabling dynamic selection in response to 
+            cropping tool. `crop.data` contains x and y coordinates of crop
+            boundary vertices. Set to None if no cropping supplied.
+            
+        SIGMA:: [float]
+            Sigma value for gaussian filter applied to each image. Passed to 
+            OpenCV `cv2.GuassianBlur`.
+            
+        masks:: [str]
+            Path to motion masks saved by `Measure_Motion`. If None, 
+            `video_dict['masks']` is used, if present. Set to False to recompute 
+            masks from `mt_cutoff` and `SIGMA`. Masks saved for another video, 
+            frame range or crop are ignored (see `Motion_Masks_Load`).
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Nothing returned
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - When motion masks saved by `Measure_Motion` are used, frames are only 
+          decoded and overlaid, and are displayed without blurring. `mt_cutoff` and
+          `SIGMA` are then ignored, and masks reflect the values passed to 
+          `Measure_Motion`.
+
+    """
+    
+    #Upoad file
+    cap = FrameReader(video_dict['fpath'],video_dict['start']+display_dict['start'],
+                      video_dict['start']+display_dict['end'],crop,
+                      reader=video_dict.get('reader','cv2'))
+
+    #set text parameters
+    textfont = cv2.FONT_HERSHEY_SIMPLEX
+    textposition = (10,30)
+    textfontscale = 1
+    textlinetype = 2
+    textfontcolor = 255
+
+    #Load motion masks saved by Measure_Motion, if available
+    masks = video_dict.get('masks') if masks is None else masks
+    masks = Motion_Masks_Load(masks,video_dict,crop) if masks else None
+
+    #Initialize first frame
+    ret, frame_new = cap.read()
+    frame_new = cv2.GaussianBlur(frame_new.astype('float'),(0,0),SIGMA) if masks is None else frame_new
+
+    #Initialize video storage if desired
+    if display_dict['save_video']==True:
+        width, height = int(frame_new.shape[1]), int(frame_new.shape[0])
+        fourcc = 0
+        writer = cv2.VideoWriter(os.path.join(os.path.normpath(video_dict['dpath']), 'video_output.avi'), 
+                         fourcc, 20.0, (width, height), isColor=False)
+
+    #Initialize display
+    screen = FrameDisplay(display_dict['fps'],display_dict['resize'],display_dict.get('quality',75))
+
+    #Loop through frames to detect frame by frame differences
+    for x in range (display_dict['start']+1,display_dict['end']):
+
+        #Attempt to load next frame
+        frame_old = frame_new
+        ret, frame_new = cap.read()
+        if ret == True:
+            
+            #process frame, or retrieve its stored mask
+            if masks is None:
+                frame_new = cv2.GaussianBlur(frame_new.astype('float'),(0,0),SIGMA) 
+                frame_dif = np.absolute(frame_new - frame_old)
+                frame_cut = (frame_dif > mt_cutoff).astype('uint8')*255
+            else:
+                frame_cut = np.unpackbits(masks[x], axis=1, count=frame_new.shape[1])*255
+
+            #Add text to videos, display and save
+            texttext = 'FREEZING' if Freezing[x]==100 else 'ACTIVE'
+            cv2.putText(frame_new,texttext,textposition,textfont,textfontscale,textfontcolor,textlinetype)
+            display = np.concatenate((frame_new.astype('uint8'),frame_cut))
+            screen.show(display)
+            if display_dict['save_video']==True:
+                writer.write(display) 
+
+        else: 
+            print('No frame detected at frame : ' + str(x) + '.Stopping video play')
+            break
+
+    #Close video window and video writer if open        
+    cap.release()
+    print('Done playing segment')
+    screen.report()
+    if display_dict['save_video']==True:
+        writer.release()
+
+def display_image(frame,fps,resize):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Displays single frame in notebook, waits `1/fps` seconds and clears it. Retained for
+    compatibility. For playback of consecutive frames, `FrameDisplay` is faster.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        frame:: [numpy.ndarray]
+            2d uint8 array.
+            
+        fps:: [float]
+            Frames per second of playback.
+            
+        resize:: [tuple]
+            (width,height) to which frame is resized. Set to None to retain size.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Nothing returned
+    
+    """
+    
+    display(FrameDisplay(fps,resize).encode(frame))
+    time.sleep(1/fps)
+    clear_output(wait=True)
+    
+    
+    
+
+
+########################################################################################
+
+class FrameDisplay:
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Displays consecutive video frames in notebook at a requested frame rate. Frames are
+    JPEG encoded by OpenCV and shown by updating a single display, rather than clearing
+    and recreating output. Frames are dropped when display falls behind schedule, such 
+    that playback holds the requested frame rate.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        fps:: [float]
+            Requested frames per second of playback.
+            
+        resize:: [tuple]
+            (width,height) to which frames are resized, in pixels. Set to None to 
+            retain original size.
+            
+        quality:: [uint]
+            JPEG quality, 0-100. Lower values encode and transfer faster.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - `show` is called once per video frame, and returns False if the frame was
+          dropped. Frame `i` is due `i/fps` seconds after the first frame. A frame 
+          arriving more than one frame interval late is dropped without encoding 
+          only if another frame was shown less than one frame interval earlier, 
+          such that bursts of late frames are skipped until playback is back on 
+          schedule, while frames from a source slower than `fps` are all shown.
+        - `report` prints achieved playback and display frame rates, and returns 
+          achieved display frame rate.
+
+    """
+    
+    def __init__(self,fps,resize=None,quality=75):
+        self.fps = fps
+        self.resize = resize
+        self.quality = quality
+        self.handle = None
+        self.t_start = None
+        self.t_shown = None
+        self.n_frames = 0
+        self.n_shown = 0
+        
+    def encode(self,frame):
+        if self.resize:
+            frame = cv2.resize(frame,tuple(self.resize),interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode('.jpg',frame,[cv2.IMWRITE_JPEG_QUALITY,int(self.quality)])
+        return Image(data=buffer.tobytes())
+    
+    def show(self,frame):
+        
+        #Drop frame if more than one frame interval behind schedule, and a frame was
+        #shown within the last interval
+        now = time.perf_counter()
+        self.t_start = now if self.t_start is None else self.t_start
+        due = self.t_start + self.n_frames/self.fps
+        self.n_frames += 1
+        if now > due + 1/self.fps and now - self.t_shown < 1/self.fps:
+            return False
+        
+        #Wait until frame is due, and update display
+        time.sleep(max(due-now,0))
+        self.t_shown = max(due,now)
+        image = self.encode(frame)
+        if self.handle is None:
+            self.handle = display(image,display_id=True)
+        else:
+            self.handle.update(image)
+        self.n_shown += 1
+        return True
+    
+    def report(self):
+        elapsed = time.perf_counter() - self.t_start if self.t_start is not None else 0
+        elapsed = max(elapsed, 1/self.fps)
+        achieved = self.n_shown / elapsed
+        print('Played {n} frames at {p:.1f} fps; displayed {s} frames at {a:.1f} fps '
+              '(requested {r} fps, {d} dropped)'.format(
+                  n=self.n_frames, p=self.n_frames/elapsed, s=self.n_shown, a=achieved,
+                  r=self.fps, d=self.n_frames-self.n_shown))
+        return achieved
+        
+        
+    
+    
+    
+########################################################################################
+
+def PlayVideo_ext(video_dict,display_dict,Freezing,mt_cutoff,crop=None,SIGMA=1,masks=None):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Play portion of video back, displaying thresholded video in tandem. Displayed in
+    Jupyter Notebook
+
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+                'fps' : frames per second of video files to be processed [int]
+                'start' : frame at which to start. 0-based [int]
+                'end' : frame at which to end.  set to None if processing 
+                        whole video [int]
+                'reader' : (optional) video decoding backend, 'cv2' (default) or 
+                           'ffmpeg'. See `FrameReader` [str]
+                'ftype' : (only if batch processing) 
+                          video file type extension (e.g. 'wmv') [str]
+                'FileNames' : (only if batch processing)
+                              List of filenames of videos in folder to be batch 
+                              processed.  [list]
+                
+        display_dict:: [dict]
+            Dictionary with the following keys:
+                'start' : start point of video segment in frames [int]
+                'end' : end point of video segment in frames [int]
+                'resize' : Default is None, in which original size is retained.
+                           Alternatively, set to tuple as follows: (width,height).
+                           Because this is in pixel units, must be integer values.
+                'fps' : frames per second of video file/files to be processed [int]
+                'save_video' : option to save video if desired [bool]
+                               Currently, will be saved at 20 fps even if video 
+                               is something else
+                               
+        Freezing:: [numpy.array]
+            Array defining whether animal is freezing on frame by frame basis.  
+            0 = Not Freezing; 100 = Freezing
+        
+        mt_cutoff:: [float]
+            Threshold value for determining magnitude of change sufficient to mark
+            pixel as changing from prior frame.
+        
+        crop:: [holoviews.streams.stream]
+            Holoviews stream object enabling dynamic selection in response to 
+            cropping tool. `crop.data` contains x and y coordinates of crop
+            boundary vertices. Set to None if no cropping supplied.
+            
+        SIGMA:: [float]
+            Sigma value for gaussian filter applied to each image. Passed to 
+            OpenCV `cv2.GuassianBlur`.
+            
+        masks:: [str]
+            Path to motion masks saved by `Measure_Motion`. If None, 
+            `video_dict['masks']` is used, if present. Set to False to recompute 
+            masks from `mt_cutoff` and `SIGMA`. Masks saved for another video, 
+            frame range or crop are ignored (see `Motion_Masks_Load`).
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Nothing returned
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - When motion masks saved by `Measure_Motion` are used, frames are only 
+          decoded and overlaid, and are displayed without blurring. `mt_cutoff` and
+          `SIGMA` are then ignored, and masks reflect the values passed to 
+          `Measure_Motion`.
+
+    """
+    
+    #Upoad file
+    cap = FrameReader(video_dict['fpath'],video_dict['start']+display_dict['start'],
+                      video_dict['start']+display_dict['end'],crop,
+                      reader=video_dict.get('reader','cv2'))
+    rate = int(1000/display_dict['fps']) #duration each frame is present for, in milliseconds
+
+    #set text parameters
+    textfont = cv2.FONT_HERSHEY_SIMPLEX
+    textposition = (10,30)
+    textfontscale = 1
+    textlinetype = 2
+    textfontcolor = 255
+
+    #Load motion masks saved by Measure_Motion, if available
+    masks = video_dict.get('masks') if masks is None else masks
+    masks = Motion_Masks_Load(masks,video_dict,crop) if masks else None
+
+    #Initialize first frame
+    ret, frame_new = cap.read()
+    frame_new = cv2.GaussianBlur(frame_new.astype('float'),(0,0),SIGMA) if masks is None else frame_new
 
     #Initialize video storage if desired
     if display_dict['save_video']==True:
@@ -588,12 +2217,13 @@ def PlayVideo_ext(video_dict,display_dict,Freezing,mt_cutoff,crop=None,SIGMA=1):
         ret, frame_new = cap.read()
         if ret == True:
             
-            #process frame           
-            frame_new = cv2.cvtColor(frame_new, cv2.COLOR_BGR2GRAY)
-            frame_new = cropframe(frame_new, crop)
-            frame_new = cv2.GaussianBlur(frame_new.astype('float'),(0,0),SIGMA) 
-            frame_dif = np.absolute(frame_new - frame_old)
-            frame_cut = (frame_dif > mt_cutoff).astype('uint8')*255
+            #process frame, or retrieve its stored mask
+            if masks is None:
+                frame_new = cv2.GaussianBlur(frame_new.astype('float'),(0,0),SIGMA) 
+                frame_dif = np.absolute(frame_new - frame_old)
+                frame_cut = (frame_dif > mt_cutoff).astype('uint8')*255
+            else:
+                frame_cut = np.unpackbits(masks[x], axis=1, count=frame_new.shape[1])*255
 
             #Add text to videos, display and save
             texttext = 'FREEZING' if Freezing[x]==100 else 'ACTIVE'
@@ -604,28 +2234,300 @@ def PlayVideo_ext(video_dict,display_dict,Freezing,mt_cutoff,crop=None,SIGMA=1):
             if display_dict['save_video']==True:
                 writer.write(display) 
 
-        else: 
-            print('No frame detected at frame : ' + str(x) + '.Stopping video play')
-            break
+        else: 
+            print('No frame detected at frame : ' + str(x) + '.Stopping video play')
+            break
+
+    #Close video window and video writer if open        
+    cap.release()
+    cv2.destroyAllWindows()
+    _=cv2.waitKey(1) 
+    if display_dict['save_video']==True:
+        writer.release()
+
+        
+        
+        
+            
+########################################################################################    
+      
+def SaveData(video_dict,Motion,Freezing,mt_cutoff,FreezeThresh,MinDuration,chamber=None,fmt='csv'):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Saves frame by frame data for motion and freezing to .csv file, or to a compact 
+    binary file (see `Write_Frames`).
+
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+                'fps' : frames per second of video files to be processed [int]
+                'start' : frame at which to start. 0-based [int]
+                'end' : frame at which to end.  set to None if processing 
+                        whole video [int]
+                'ftype' : (only if batch processing) 
+                          video file type extension (e.g. 'wmv') [str]
+                'FileNames' : (only if batch processing)
+                              List of filenames of videos in folder to be batch 
+                              processed.  [list]
+                              
+        Motion:: [numpy.array or dict]
+            Array containing number of pixels per frame whose intensity change from
+            previous frame exceeds `mt_cutoff`. Length is number of frames passed to
+            function to loop through. Value of first index, corresponding to first frame,
+            is set to 0. Alternatively, dictionary of such arrays, with chamber names as
+            keys.
+        
+        Freezing:: [numpy.array or dict]
+            Array defining whether animal is freezing on frame by frame basis.  
+            0 = Not Freezing; 100 = Freezing. Dictionary with the same keys as `Motion`,
+            if `Motion` is dictionary.
+        
+        mt_cutoff:: [float]
+            Threshold value for determining magnitude of change sufficient to mark
+            pixel as changing from prior frame.
+                
+        FreezeThresh:: [float]
+            Threshold value for determining magnitude of activity in `Motion` to designate
+            frame as freezing/not freezing.
+                
+        MinDuration:: [uint8]
+            Duration for which `Motion` must be below `FreezeThresh` for freezing to be 
+            registered.
+            
+        chamber:: [str]
+            Name of chamber that `Motion` and `Freezing` correspond to. Added to output
+            as 'Chamber' column, and to output file name. Set internally when 
+            dictionaries are passed.
+            
+        fmt:: [str]
+            Format of frame by frame output file: 'csv', 'npz', 'parquet' or 'feather'.
+            See `Write_Frames`.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Nothing returned
+        
+    -------------------------------------------------------------------------------------
+    Notes:
+        - If `Motion` and `Freezing` are dictionaries, one file is saved per chamber, 
+          named '<video>_<chamber>_FreezingOutput.csv'.
+        - Binary formats store file name and parameter values once rather than on 
+          every row. Use `Read_Frames` to load them as a dataframe.
+
+    """
+    
+    #Save each chamber to separate file
+    if isinstance(Motion, dict):
+        for name in Motion:
+            SaveData(video_dict,Motion[name],Freezing[name],mt_cutoff,FreezeThresh,
+                     MinDuration,chamber=name,fmt=fmt)
+        return
+
+    #Create Dataframe
+    DataFrame = pd.DataFrame(
+        {'File': [video_dict['file']]*len(Motion),
+         'MotionCutoff':np.ones(len(Motion))*mt_cutoff,
+         'FreezeThresh':np.ones(len(Motion))*FreezeThresh,
+         'MinFreezeDuration':np.ones(len(Motion))*MinDuration,
+         'Frame': np.arange(len(Motion)),
+         'Motion': Motion,
+         'Freezing': Freezing
+        })   
+
+    fname = os.path.splitext(video_dict['fpath'])[0]
+    if chamber is not None:
+        DataFrame.insert(1,'Chamber',chamber)
+        fname = fname + '_' + str(chamber)
+    Write_Frames(DataFrame, fname + '_FreezingOutput.' + fmt)
+    
+    
+    
+    
+    
+########################################################################################        
+
+
+def Summarize(video_dict,Motion,Freezing,FreezeThresh,MinDuration,mt_cutoff,bin_dict=None,
+              chamber=None):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Generate binned summary report of feezing and motion based upon user-specified bins.
+    If no bins are specified (bin_dict=None), session average will be returned.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+                'fps' : frames per second of video files to be processed [int]
+                'start' : frame at which to start. 0-based [int]
+                'end' : frame at which to end.  set to None if processing 
+                        whole video [int]
+                'ftype' : (only if batch processing) 
+                          video file type extension (e.g. 'wmv') [str]
+                'FileNames' : (only if batch processing)
+                              List of filenames of videos in folder to be batch 
+                              processed.  [list]
+                              
+        Motion:: [numpy.array or dict]
+            Array containing number of pixels per frame whose intensity change from
+            previous frame exceeds `mt_cutoff`. Alternatively, dictionary of such arrays,
+            with chamber names as keys.
+        
+        Freezing:: [numpy.array or dict]
+            Array defining whether animal is freezing on frame by frame basis.  
+            0 = Not Freezing; 100 = Freezing. Dictionary with the same keys as `Motion`,
+            if `Motion` is dictionary.
+                
+        FreezeThresh:: [float]
+            Threshold value for determining magnitude of activity in `Motion` to designate
+            frame as freezing/not freezing.
+                
+        MinDuration:: [uint8]
+            Duration for which `Motion` must be below `FreezeThresh` for freezing to be 
+            registered.
+        
+        mt_cutoff:: [float]
+            Threshold value for determining magnitude of change sufficient to mark
+            pixel as changing from prior frame.
+        
+        bin_dict:: [dict]
+            Dictionary specifying bins.  Dictionary keys should be names of the bins.  
+            Dictionary value for each bin should be a tuple, with the start and end of 
+            the bin, in seconds, relative to the start of the analysis period 
+            (i.e. if start frame is 100, it will be relative to that). If no bins are to 
+            be specified, set bin_dict = None.
+            example = bin_dict = {1:(0,100), 2:(100,200)}
+            
+        chamber:: [str]
+            Name of chamber that `Motion` and `Freezing` correspond to. Added to output
+            as 'Chamber' column. Set internally when dictionaries are passed.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        df:: [pandas.dataframe]
+            Returns pandas dataframe with binned summary information.
+        
+    -------------------------------------------------------------------------------------
+    Notes:
+        - If `Motion` and `Freezing` are dictionaries, summaries of all chambers are 
+          returned in a single dataframe, with 'Chamber' column.
+
+    """
+    
+    #Summarize each chamber separately
+    if isinstance(Motion, dict):
+        return pd.concat([Summarize(video_dict,Motion[name],Freezing[name],FreezeThresh,
+                                    MinDuration,mt_cutoff,bin_dict,chamber=name) 
+                          for name in Motion], ignore_index=True)
+    
+    #define bins
+    avg_dict = {'all': (0, len(Motion))}
+    bin_dict = bin_dict if bin_dict is not None else avg_dict
+    #bin_dict = {k: tuple((np.array(v) * video_dict['fps']).tolist()) for k, v in bin_dict.items()}
+    
+    #get means
+    bins = (pd.Series(bin_dict).rename('range(f)')
+            .reset_index().rename(columns=dict(index='bin')))
+    bins['Motion'] = bins['range(f)'].apply(
+        lambda rng: Motion[slice(rng[0],rng[1])].mean())
+    bins['Freezing'] = bins['range(f)'].apply(
+        lambda rng: Freezing[slice(rng[0],rng[1])].mean())
+    
+    #Create data frame to store data in
+    df = pd.DataFrame({
+        'File': [video_dict['file']]*len(bins),
+        'FileLength': np.ones(len(bins))*len(Motion),
+        'MotionCutoff':np.ones(len(bins))*mt_cutoff,
+        'FreezeThresh':np.ones(len(bins))*FreezeThresh,
+        'MinFreezeDuration':np.ones(len(bins))*MinDuration
+    })   
+    df = pd.concat([df,bins],axis=1)
+    if chamber is not None:
+        df.insert(1,'Chamber',chamber)
+    return df
+
+
+
+
+
+########################################################################################
+
+
+def Batch_LoadFiles(video_dict):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Populates list of files in directory (`dpath`) that are of the specified file type
+    (`ftype`).  List is held in `video_dict['FileNames']`.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+                'fps' : frames per second of video files to be processed [int]
+                'start' : frame at which to start. 0-based [int]
+                'end' : frame at which to end.  set to None if processing 
+                        whole video [int]
+                'ftype' : (only if batch processing) 
+                          video file type extension (e.g. 'wmv') [str]
+                'FileNames' : (only if batch processing)
+                              List of filenames of videos in folder to be batch 
+                              processed.  [list]
 
-    #Close video window and video writer if open        
-    cv2.destroyAllWindows()
-    _=cv2.waitKey(1) 
-    if display_dict['save_video']==True:
-        writer.release()
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+                'fps' : frames per second of video file/files to be processed [int]
+                'start' : frame at which to start. 0-based [int]
+                'end' : frame at which to end.  set to None if processing whole 
+                        video [int]
+                'ftype' : (only if batch processing) 
+                          video file type extension (e.g. 'wmv') [str]
+                'FileNames' : (only if batch processing)
+                              List of filenames of videos in folder to be 
+                              batch processed.  [list]
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+    
+    """
+
+    #Get list of video files of designated type
+    if os.path.isdir(video_dict['dpath']):
+        video_dict['FileNames'] = sorted(os.listdir(video_dict['dpath']))
+        video_dict['FileNames'] = fnmatch.filter(video_dict['FileNames'], ('*.' + video_dict['ftype'])) 
+        return video_dict
+    else:
+        raise FileNotFoundError('{path} not found. Check that directory is correct'.format(
+            path=video_dict['dpath']))
 
         
         
         
-            
-########################################################################################    
-      
-def SaveData(video_dict,Motion,Freezing,mt_cutoff,FreezeThresh,MinDuration):
+        
+########################################################################################
+        
+        
+def Batch(video_dict,bin_dict,mt_cutoff,FreezeThresh,MinDuration,crop=None,SIGMA=1,n_workers=1,
+          cache=True,downsample=1,resume=False,fmt='csv'):
     """ 
     -------------------------------------------------------------------------------------
     
-    Saves frame by frame data for motion and freezing to .csv file
-
+    Run FreezeAnalysis on folder of videos of specified filetype. 
+    
     -------------------------------------------------------------------------------------
     Args:
         video_dict:: [dict]
@@ -642,20 +2544,190 @@ def SaveData(video_dict,Motion,Freezing,mt_cutoff,FreezeThresh,MinDuration):
                               List of filenames of videos in folder to be batch 
                               processed.  [list]
                               
-        Motion:: [numpy.array]
-            Array containing number of pixels per frame whose intensity change from
-            previous frame exceeds `mt_cutoff`. Length is number of frames passed to
-            function to loop through. Value of first index, corresponding to first frame,
-            is set to 0.
-        
-        Freezing:: [numpy.array]
-            Array defining whether animal is freezing on frame by frame basis.  
-            0 = Not Freezing; 100 = Freezing
+        bin_dict:: [dict]
+            Dictionary specifying bins.  Dictionary keys should be names of the bins.  
+            Dictionary value for each bin should be a tuple, with the start and end of 
+            the bin, in seconds, relative to the start of the analysis period 
+            (i.e. if start frame is 100, it will be relative to that). If no bins are to 
+            be specified, set bin_dict = None.
+            example = bin_dict = {1:(0,100), 2:(100,200)}
         
         mt_cutoff:: [float]
             Threshold value for determining magnitude of change sufficient to mark
             pixel as changing from prior frame.
+        
+        FreezeThresh:: [float]
+            Threshold value for determining magnitude of activity in `Motion` to designate
+            frame as freezing/not freezing.
                 
+        MinDuration:: [uint8]
+            Duration for which `Motion` must be below `FreezeThresh` for freezing to be 
+            registered.
+            
+        crop:: [holoviews.streams.stream or dict]
+            Holoviews stream object enabling dynamic selection in response to 
+            cropping tool. `crop.data` contains x and y coordinates of crop
+            boundary vertices. Set to None if no cropping supplied. Alternatively,
+            dictionary of named crop regions (e.g. one per chamber), in which case 
+            each chamber is saved and summarized separately. See `Measure_Motion`.
+            
+        SIGMA:: [float]
+            Sigma value for gaussian filter applied to each image. Passed to 
+            OpenCV `cv2.GuassianBlur`    
+            
+        n_workers:: [uint]
+            Number of worker processes used to analyze videos in parallel. If 
+            `n_workers=1`, videos are processed one after the other in the current 
+            process. If `n_workers=None`, one worker per available cpu is used.
+            
+        cache:: [bool]
+            Whether to use on-disk motion cache. When True, videos whose motion has
+            already been measured with the same motion parameters are not decoded
+            again, such that re-scoring a folder with new `FreezeThresh` or 
+            `MinDuration` is fast. See `Motion_Cache_Path`.
+            
+        downsample:: [float]
+            Factor by which frames are reduced in width and height prior to analysis.
+            See `Measure_Motion`.
+            
+        resume:: [bool]
+            Whether to skip videos that have already been processed with the same 
+            parameters, as recorded in 'FreezingManifest.json', and whose outputs are 
+            still present. Their summary is read from 'BatchParts' folder. Allows an 
+            interrupted batch to be resumed.
+            
+        fmt:: [str]
+            Format of frame by frame output file: 'csv', 'npz', 'parquet' or 'feather'.
+            See `Write_Frames`.
+
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        summary_all:: [pandas.dataframe]
+            Pandas dataframe with binned summary information for all videos
+            processed. If `bin_dict = None`, average freezing and motion for each video
+            will be returned.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Rows of `summary_all` follow the order of `video_dict['FileNames']`, 
+          regardless of the order in which parallel workers finish.
+        - If a video fails to be processed (e.g. corrupt file), the error is printed 
+          and remaining videos are still processed. Failed videos are omitted from
+          `summary_all`.
+        - The summary of each video is written to 'BatchParts' folder as soon as it is
+          processed, and is not retained in memory. `Batch_Consolidate` then combines
+          the summaries into 'BatchSummary.csv', such that memory use does not grow 
+          with the number of videos. If processing is interrupted, calling 
+          `Batch_Consolidate` directly combines the summaries of completed videos. 
+          All files are written atomically.
+        - Summaries left in 'BatchParts' by earlier runs are removed for each video 
+          that is to be processed, such that a video that fails is never combined 
+          with a stale summary.
+        - Each video that is completely processed is recorded in 
+          'FreezingManifest.json', along with the parameters used and the files written. 
+          See `Batch_Manifest_Update`.
+    
+    """
+
+    #Plain crop specification, so that it can be sent to worker processes
+    crop = Crop_Spec(crop)
+    named = isinstance(crop,dict) and 'y0' not in crop
+    
+    #Parameters that outputs depend upon, recorded in manifest
+    params = dict(start=video_dict.get('start'), end=video_dict.get('end'), 
+                  fps=video_dict.get('fps'), reader=video_dict.get('reader','cv2'),
+                  bin_dict=bin_dict, mt_cutoff=mt_cutoff, FreezeThresh=FreezeThresh, 
+                  MinDuration=MinDuration, crop=crop, SIGMA=SIGMA, downsample=downsample,
+                  fmt=fmt)
+    manifest = Batch_Manifest_Load(video_dict) if resume else {}
+    
+    #Define set of jobs, one per file, skipping those already processed
+    jobs = []
+    for file in video_dict['FileNames']:
+        job_dict = video_dict.copy()
+        job_dict['file'] = file
+        job_dict['fpath'] = os.path.join(os.path.normpath(video_dict['dpath']), file)
+        if resume and Batch_Manifest_Check(job_dict,manifest,params):
+            print ('Already processed, skipping File: {f}'.format(f=file))
+            continue
+        stem = os.path.splitext(job_dict['fpath'])[0]
+        outputs = [stem + '_' + str(name) for name in crop] if named else [stem]
+        outputs = [output + '_FreezingOutput.' + fmt for output in outputs] + [Batch_Part_Path(job_dict)]
+        jobs.append((job_dict, outputs))
+        
+        #Remove summary of any earlier run, such that it is not combined if file fails
+        if os.path.isfile(Batch_Part_Path(job_dict)):
+            os.remove(Batch_Part_Path(job_dict))
+    
+    #Process files, serially or across pool of worker processes
+    failed = []
+    if n_workers == 1:
+        for job_dict, outputs in jobs:
+            print ('Processing File: {f}'.format(f=job_dict['file']))
+            try:
+                Batch_File(job_dict,bin_dict,mt_cutoff,FreezeThresh,MinDuration,crop=crop,
+                           SIGMA=SIGMA,cache=cache,downsample=downsample,fmt=fmt)
+                Batch_Manifest_Update(job_dict, params, outputs)
+            except Exception as error:
+                failed.append(job_dict['file'])
+                print ('Failed to process file: {f}. {e}'.format(f=job_dict['file'],e=repr(error)))
+    elif len(jobs) > 0:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = {pool.submit(Batch_File,job_dict,bin_dict,mt_cutoff,FreezeThresh,
+                                   MinDuration,crop=crop,SIGMA=SIGMA,cache=cache,
+                                   downsample=downsample,fmt=fmt) : (job_dict, outputs) for job_dict, outputs in jobs}
+            
+            #Record files in manifest as they complete, so that none are lost if interrupted
+            for future in as_completed(futures):
+                job_dict, outputs = futures.pop(future)
+                try:
+                    future.result()
+                    Batch_Manifest_Update(job_dict, params, outputs)
+                    print ('Processed File: {f}'.format(f=job_dict['file']))
+                except Exception as error:
+                    failed.append(job_dict['file'])
+                    print ('Failed to process file: {f}. {e}'.format(f=job_dict['file'],e=repr(error)))
+    if len(failed) > 0:
+        print ('{n} file(s) could not be processed: {f}'.format(n=len(failed),f=', '.join(failed)))
+    
+    #Combine summaries of successfully processed files from disk, in file order
+    return Batch_Consolidate(video_dict)
+
+
+
+
+
+########################################################################################
+
+def Batch_File(video_dict,bin_dict,mt_cutoff,FreezeThresh,MinDuration,crop=None,SIGMA=1,cache=True,
+               downsample=1,fmt='csv'):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Run FreezeAnalysis on a single video file within a batch: motion and freezing are 
+    measured, frame by frame data is saved, and a binned summary is returned. Used by
+    `Batch`, both for serial processing and as the job run by each worker process.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+                'fpath' : full path to file [str]
+                'fps' : frames per second of video files to be processed [int]
+                'start' : frame at which to start. 0-based [int]
+                'end' : frame at which to end.  set to None if processing 
+                        whole video [int]
+                              
+        bin_dict:: [dict]
+            Dictionary specifying bins. See `Batch`.
+        
+        mt_cutoff:: [float]
+            Threshold value for determining magnitude of change sufficient to mark
+            pixel as changing from prior frame.
+        
         FreezeThresh:: [float]
             Threshold value for determining magnitude of activity in `Motion` to designate
             frame as freezing/not freezing.
@@ -663,122 +2735,334 @@ def SaveData(video_dict,Motion,Freezing,mt_cutoff,FreezeThresh,MinDuration):
         MinDuration:: [uint8]
             Duration for which `Motion` must be below `FreezeThresh` for freezing to be 
             registered.
+            
+        crop:: [holoviews.streams.stream or dict]
+            Holoviews stream object enabling dynamic selection in response to 
+            cropping tool. `crop.data` contains x and y coordinates of crop
+            boundary vertices. Set to None if no cropping supplied. Alternatively,
+            dictionary of named crop regions (e.g. one per chamber), in which case 
+            each chamber is saved and summarized separately. See `Measure_Motion`.
+            
+        SIGMA:: [float]
+            Sigma value for gaussian filter applied to each image. Passed to 
+            OpenCV `cv2.GuassianBlur`    
+            
+        cache:: [bool]
+            Whether to use on-disk motion cache. See `Motion_Cache_Path`.
+            
+        downsample:: [float]
+            Factor by which frames are reduced in width and height prior to analysis.
+            See `Measure_Motion`.
+            
+        fmt:: [str]
+            Format of frame by frame output file: 'csv', 'npz', 'parquet' or 'feather'.
+            See `Write_Frames`.
+
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        summary:: [pandas.dataframe]
+            Pandas dataframe with binned summary information for video.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Summary is also written to file as soon as video is processed (see 
+          `Batch_Part_Path`), such that it is retained if batch processing is 
+          interrupted.
+    
+    """
+    
+    #Analyze frame by frame motion and freezing and save csv of results
+    Motion = Measure_Motion(video_dict,mt_cutoff,crop,SIGMA=SIGMA,cache=cache,downsample=downsample)  
+    Freezing = Measure_Freezing(Motion,FreezeThresh,MinDuration)  
+    SaveData(video_dict,Motion,Freezing,mt_cutoff,FreezeThresh,MinDuration,fmt=fmt)
+    summary = Summarize(video_dict,Motion,Freezing,FreezeThresh,
+                        MinDuration,mt_cutoff,bin_dict=bin_dict)
+    Write_CSV(summary, Batch_Part_Path(video_dict))
+    return summary
+
+
+
+
+
+########################################################################################
+
+def Write_CSV(df,path):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Writes dataframe to .csv file atomically: file is written under a temporary name and
+    then renamed, such that an interrupted write never leaves a partial file in place.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        df:: [pandas.dataframe]
+            Dataframe to be written.
+            
+        path:: [str]
+            Path of .csv file.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Nothing returned
+    
+    """
+    
+    tmp_path = '{p}.{pid}.tmp'.format(p=path, pid=os.getpid())
+    df.to_csv(tmp_path)
+    os.replace(tmp_path, path)
+    
+    
+    
+    
+
+########################################################################################
+
+def Write_Frames(df,path):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Writes frame by frame dataframe to file atomically, in format given by extension of
+    `path`: '.csv', '.npz' (compressed numpy archive), '.parquet' or '.feather'. For 
+    binary formats, columns that are constant across frames (e.g. file name and 
+    parameter values) are stored once as metadata, and remaining columns are stored in 
+    the most compact dtype that holds their values exactly.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        df:: [pandas.dataframe]
+            Dataframe with one row per frame.
+            
+        path:: [str]
+            Path of output file, including extension.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Nothing returned
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Writing '.parquet' and '.feather' files requires pyarrow.
+        - Files can be read back into the original dataframe with `Read_Frames`.
+    
+    """
+    
+    fmt = os.path.splitext(path)[1].lower()
+    if fmt == '.csv':
+        Write_CSV(df, path)
+        return
+    if fmt not in ('.npz','.parquet','.feather'):
+        raise ValueError('Unsupported output format: {f}'.format(f=fmt))
+    
+    #Separate constant columns from per-frame columns
+    meta = dict(length=len(df), columns=[str(col) for col in df.columns], 
+                dtypes=[str(dtype) for dtype in df.dtypes], constants={}, frames=[])
+    frames = []
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if len(df) > 0 and df[col].nunique(dropna=False) == 1:
+            value = values[0]
+            meta['constants'][str(col)] = value.item() if hasattr(value,'item') else value
+            continue
+        if values.dtype.kind in 'iuf':
+            values = Compact_Dtype(values)
+        elif values.dtype.kind == 'O':
+            values = values.astype(str)
+        meta['frames'].append(str(col))
+        frames.append(values)
+    
+    #Write under temporary name and then rename
+    tmp_path = '{p}.{pid}.tmp'.format(p=path, pid=os.getpid())
+    if fmt == '.npz':
+        with open(tmp_path,'wb') as f:
+            np.savez_compressed(f, *frames, meta=np.array(json.dumps(meta)))
+    else:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            import pyarrow.feather as feather
+        except ImportError:
+            raise ImportError('pyarrow is required to write {f} files'.format(f=fmt))
+        table = pa.Table.from_arrays([pa.array(values) for values in frames], names=meta['frames'])
+        table = table.replace_schema_metadata({'ezTrack' : json.dumps(meta)})
+        if fmt == '.parquet':
+            pq.write_table(table, tmp_path)
+        else:
+            feather.write_feather(table, tmp_path)
+    os.replace(tmp_path, path)
+    
+    
+    
+    
+
+########################################################################################
+
+def Read_Frames(path):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Reads frame by frame data written by `Write_Frames`, restoring constant columns and 
+    original dtypes, such that the same dataframe is returned regardless of file format.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        path:: [str]
+            Path of '.csv', '.npz', '.parquet' or '.feather' file.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        df:: [pandas.dataframe]
+            Dataframe with one row per frame.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Reading '.parquet' and '.feather' files requires pyarrow.
+    
+    """
+    
+    fmt = os.path.splitext(path)[1].lower()
+    if fmt == '.csv':
+        return pd.read_csv(path, index_col=0)
+    if fmt == '.npz':
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            frames = [data['arr_{i}'.format(i=i)] for i in range(len(meta['frames']))]
+    elif fmt in ('.parquet','.feather'):
+        try:
+            import pyarrow.parquet as pq
+            import pyarrow.feather as feather
+        except ImportError:
+            raise ImportError('pyarrow is required to read {f} files'.format(f=fmt))
+        table = pq.read_table(path) if fmt == '.parquet' else feather.read_table(path)
+        meta = json.loads(table.schema.metadata[b'ezTrack'])
+        frames = [table.column(col).to_numpy() for col in meta['frames']]
+    else:
+        raise ValueError('Unsupported output format: {f}'.format(f=fmt))
+        
+    #Rebuild dataframe in original column order and dtypes
+    df = pd.DataFrame(dict(zip(meta['frames'], frames)), index=pd.RangeIndex(meta['length']))
+    for col, value in meta['constants'].items():
+        df[col] = value
+    df = df[meta['columns']]
+    return df.astype(dict(zip(meta['columns'], meta['dtypes'])))
+    
+    
+    
+    
+
+########################################################################################
+
+def Compact_Dtype(values):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Returns array of whole numbers in the smallest integer dtype that holds every value
+    exactly (e.g. motion values as uint16). Arrays with fractional, non-finite or 
+    out-of-range values are returned unchanged.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        values:: [numpy.array]
+            Numeric array.
     
     -------------------------------------------------------------------------------------
     Returns:
-        Nothing returned
-        
-    -------------------------------------------------------------------------------------
-    Notes:
-
-
+        values:: [numpy.array]
+            Array in compact integer dtype, or original array.
+    
     """
+    
+    if len(values) == 0 or values.dtype.kind not in 'iuf':
+        return values
+    if values.dtype.kind == 'f' and not (np.all(np.isfinite(values)) 
+                                         and np.all(values == np.around(values))):
+        return values
+    dtype = np.result_type(np.min_scalar_type(int(values.min())), np.min_scalar_type(int(values.max())))
+    if dtype.kind not in 'iu':
+        return values
+    compact = values.astype(dtype)
+    return compact if np.array_equal(compact, values) else values
+    
+    
+    
+    
 
-    #Create Dataframe
-    DataFrame = pd.DataFrame(
-        {'File': [video_dict['file']]*len(Motion),
-         'MotionCutoff':np.ones(len(Motion))*mt_cutoff,
-         'FreezeThresh':np.ones(len(Motion))*FreezeThresh,
-         'MinFreezeDuration':np.ones(len(Motion))*MinDuration,
-         'Frame': np.arange(len(Motion)),
-         'Motion': Motion,
-         'Freezing': Freezing
-        })   
+########################################################################################
 
-    DataFrame.to_csv(os.path.splitext(video_dict['fpath'])[0] + '_FreezingOutput.csv')
+def Batch_Part_Path(video_dict):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Returns path of file to which summary of a single video is written during batch 
+    processing, in 'BatchParts' folder of `video_dict['dpath']`.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        part_path:: [str]
+            Path of .csv file.
+    
+    """
     
+    part_dir = os.path.join(os.path.normpath(video_dict['dpath']), 'BatchParts')
+    os.makedirs(part_dir, exist_ok=True)
+    fname = os.path.splitext(video_dict['file'])[0] + '_FreezingSummary.csv'
+    return os.path.join(part_dir, fname)
     
     
     
     
-########################################################################################        
 
+########################################################################################
 
-def Summarize(video_dict,Motion,Freezing,FreezeThresh,MinDuration,mt_cutoff,bin_dict=None):
+def Batch_Consolidate(video_dict):
     """ 
     -------------------------------------------------------------------------------------
     
-    Generate binned summary report of feezing and motion based upon user-specified bins.
-    If no bins are specified (bin_dict=None), session average will be returned.
-
+    Combines summaries of individual videos, written during batch processing, into 
+    'BatchSummary.csv'. `Batch` does so on completion. Calling this function directly
+    recovers the summary of all completed videos if batch processing was interrupted.
+    
     -------------------------------------------------------------------------------------
     Args:
         video_dict:: [dict]
             Dictionary with the following keys:
                 'dpath' : directory containing files [str]
-                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
-                'fps' : frames per second of video files to be processed [int]
-                'start' : frame at which to start. 0-based [int]
-                'end' : frame at which to end.  set to None if processing 
-                        whole video [int]
-                'ftype' : (only if batch processing) 
-                          video file type extension (e.g. 'wmv') [str]
-                'FileNames' : (only if batch processing)
-                              List of filenames of videos in folder to be batch 
+                'FileNames' : List of filenames of videos in folder to be batch 
                               processed.  [list]
-                              
-        Motion:: [numpy.array]
-            Array containing number of pixels per frame whose intensity change from
-            previous frame exceeds `mt_cutoff`. 
-        
-        Freezing:: [numpy.array]
-            Array defining whether animal is freezing on frame by frame basis.  
-            0 = Not Freezing; 100 = Freezing
-                
-        FreezeThresh:: [float]
-            Threshold value for determining magnitude of activity in `Motion` to designate
-            frame as freezing/not freezing.
-                
-        MinDuration:: [uint8]
-            Duration for which `Motion` must be below `FreezeThresh` for freezing to be 
-            registered.
-        
-        mt_cutoff:: [float]
-            Threshold value for determining magnitude of change sufficient to mark
-            pixel as changing from prior frame.
-        
-        bin_dict:: [dict]
-            Dictionary specifying bins.  Dictionary keys should be names of the bins.  
-            Dictionary value for each bin should be a tuple, with the start and end of 
-            the bin, in seconds, relative to the start of the analysis period 
-            (i.e. if start frame is 100, it will be relative to that). If no bins are to 
-            be specified, set bin_dict = None.
-            example = bin_dict = {1:(0,100), 2:(100,200)}
     
     -------------------------------------------------------------------------------------
     Returns:
-        df:: [pandas.dataframe]
-            Returns pandas dataframe with binned summary information.
-        
+        summary_all:: [pandas.dataframe]
+            Pandas dataframe with summaries of all videos whose summary was found, in 
+            order of `video_dict['FileNames']`.
+    
     -------------------------------------------------------------------------------------
     Notes:
-
-
-    """
-    
-    #define bins
-    avg_dict = {'all': (0, len(Motion))}
-    bin_dict = bin_dict if bin_dict is not None else avg_dict
-    #bin_dict = {k: tuple((np.array(v) * video_dict['fps']).tolist()) for k, v in bin_dict.items()}
+        - Only summaries of videos in `video_dict['FileNames']` are combined. Videos
+          without a summary (not yet processed, or failed) are listed and omitted. 
+          `Batch` removes summaries of earlier runs for videos it is to process.
     
-    #get means
-    bins = (pd.Series(bin_dict).rename('range(f)')
-            .reset_index().rename(columns=dict(index='bin')))
-    bins['Motion'] = bins['range(f)'].apply(
-        lambda rng: Motion[slice(rng[0],rng[1])].mean())
-    bins['Freezing'] = bins['range(f)'].apply(
-        lambda rng: Freezing[slice(rng[0],rng[1])].mean())
+    """
     
-    #Create data frame to store data in
-    df = pd.DataFrame({
-        'File': [video_dict['file']]*len(bins),
-        'FileLength': np.ones(len(bins))*len(Motion),
-        'MotionCutoff':np.ones(len(bins))*mt_cutoff,
-        'FreezeThresh':np.ones(len(bins))*FreezeThresh,
-        'MinFreezeDuration':np.ones(len(bins))*MinDuration
-    })   
-    df = pd.concat([df,bins],axis=1)
-    return df
+    summaries, missing = [], []
+    for file in video_dict['FileNames']:
+        part_path = Batch_Part_Path(dict(video_dict, file=file))
+        if os.path.isfile(part_path):
+            summaries.append(pd.read_csv(part_path, index_col=0, float_precision='round_trip'))
+        else:
+            missing.append(file)
+    if len(missing) > 0:
+        print ('No summary found for {n} file(s): {f}'.format(n=len(missing),f=', '.join(missing)))
+    summary_all = pd.concat(summaries, sort=False) if len(summaries) > 0 else pd.DataFrame()
+    Write_CSV(summary_all, os.path.join(os.path.normpath(video_dict['dpath']), 'BatchSummary.csv'))
+    return summary_all
 
 
 
@@ -786,73 +3070,101 @@ def Summarize(video_dict,Motion,Freezing,FreezeThresh,MinDuration,mt_cutoff,bin_
 
 ########################################################################################
 
-
-def Batch_LoadFiles(video_dict):
+def Batch_Manifest_Load(video_dict):
     """ 
     -------------------------------------------------------------------------------------
     
-    Populates list of files in directory (`dpath`) that are of the specified file type
-    (`ftype`).  List is held in `video_dict['FileNames']`.
+    Loads manifest of batch processing, 'FreezingManifest.json' in 
+    `video_dict['dpath']`, which records each video that has been completely processed,
+    along with the parameters it was processed with and the files that were written.
     
     -------------------------------------------------------------------------------------
     Args:
         video_dict:: [dict]
             Dictionary with the following keys:
                 'dpath' : directory containing files [str]
-                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
-                'fps' : frames per second of video files to be processed [int]
-                'start' : frame at which to start. 0-based [int]
-                'end' : frame at which to end.  set to None if processing 
-                        whole video [int]
-                'ftype' : (only if batch processing) 
-                          video file type extension (e.g. 'wmv') [str]
-                'FileNames' : (only if batch processing)
-                              List of filenames of videos in folder to be batch 
-                              processed.  [list]
-
     
     -------------------------------------------------------------------------------------
     Returns:
+        manifest:: [dict]
+            Dictionary with filenames as keys. Empty if no manifest exists.
+    
+    """
+    
+    manifest_path = os.path.join(os.path.normpath(video_dict['dpath']), 'FreezingManifest.json')
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+    
+    
+    
+    
+
+########################################################################################
+
+def Batch_Manifest_Update(video_dict,params,outputs):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Records video `video_dict['file']` as completely processed in batch manifest. 
+    Manifest is written atomically, such that an interruption never corrupts it.
+    
+    -------------------------------------------------------------------------------------
+    Args:
         video_dict:: [dict]
             Dictionary with the following keys:
                 'dpath' : directory containing files [str]
                 'file' : filename with extension, e.g. 'myvideo.wmv' [str]
-                'fps' : frames per second of video file/files to be processed [int]
-                'start' : frame at which to start. 0-based [int]
-                'end' : frame at which to end.  set to None if processing whole 
-                        video [int]
-                'ftype' : (only if batch processing) 
-                          video file type extension (e.g. 'wmv') [str]
-                'FileNames' : (only if batch processing)
-                              List of filenames of videos in folder to be 
-                              batch processed.  [list]
+                'fpath' : full path to file [str]
+                
+        params:: [dict]
+            Dictionary of all parameters that outputs of video depend upon. Values 
+            must be json serializable.
+            
+        outputs:: [list]
+            List of paths of files written for video.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Nothing returned
     
     -------------------------------------------------------------------------------------
     Notes:
+        - Manifest should only be updated by a single process at a time. 
     
     """
+    
+    dpath = os.path.normpath(video_dict['dpath'])
+    params = json.loads(json.dumps(params, sort_keys=True, default=str))
+    manifest = Batch_Manifest_Load(video_dict)
+    manifest[video_dict['file']] = {
+        'signature' : hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest(),
+        'params' : params,
+        'video' : Video_Hash(video_dict['fpath']),
+        'outputs' : [os.path.relpath(output, dpath) for output in outputs],
+        'completed' : time.strftime('%Y-%m-%d %H:%M:%S')}
+    
+    manifest_path = os.path.join(dpath, 'FreezingManifest.json')
+    tmp_path = '{p}.{pid}.tmp'.format(p=manifest_path, pid=os.getpid())
+    with open(tmp_path,'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    
+    
+    
+    
 
-    #Get list of video files of designated type
-    if os.path.isdir(video_dict['dpath']):
-        video_dict['FileNames'] = sorted(os.listdir(video_dict['dpath']))
-        video_dict['FileNames'] = fnmatch.filter(video_dict['FileNames'], ('*.' + video_dict['ftype'])) 
-        return video_dict
-    else:
-        raise FileNotFoundError('{path} not found. Check that directory is correct'.format(
-            path=video_dict['dpath']))
-
-        
-        
-        
-        
 ########################################################################################
-        
-        
-def Batch(video_dict,bin_dict,mt_cutoff,FreezeThresh,MinDuration,crop=None,SIGMA=1):
+
+def Batch_Manifest_Check(video_dict,manifest,params):
     """ 
     -------------------------------------------------------------------------------------
     
-    Run FreezeAnalysis on folder of videos of specified filetype. 
+    Determines whether video `video_dict['file']` can be skipped when resuming batch 
+    processing: video must be recorded in manifest with the same parameters, must not
+    have been modified since, and all of its outputs must still be present.
     
     -------------------------------------------------------------------------------------
     Args:
@@ -860,90 +3172,40 @@ def Batch(video_dict,bin_dict,mt_cutoff,FreezeThresh,MinDuration,crop=None,SIGMA
             Dictionary with the following keys:
                 'dpath' : directory containing files [str]
                 'file' : filename with extension, e.g. 'myvideo.wmv' [str]
-                'fps' : frames per second of video files to be processed [int]
-                'start' : frame at which to start. 0-based [int]
-                'end' : frame at which to end.  set to None if processing 
-                        whole video [int]
-                'ftype' : (only if batch processing) 
-                          video file type extension (e.g. 'wmv') [str]
-                'FileNames' : (only if batch processing)
-                              List of filenames of videos in folder to be batch 
-                              processed.  [list]
-                              
-        bin_dict:: [dict]
-            Dictionary specifying bins.  Dictionary keys should be names of the bins.  
-            Dictionary value for each bin should be a tuple, with the start and end of 
-            the bin, in seconds, relative to the start of the analysis period 
-            (i.e. if start frame is 100, it will be relative to that). If no bins are to 
-            be specified, set bin_dict = None.
-            example = bin_dict = {1:(0,100), 2:(100,200)}
-        
-        mt_cutoff:: [float]
-            Threshold value for determining magnitude of change sufficient to mark
-            pixel as changing from prior frame.
-        
-        FreezeThresh:: [float]
-            Threshold value for determining magnitude of activity in `Motion` to designate
-            frame as freezing/not freezing.
+                'fpath' : full path to file [str]
                 
-        MinDuration:: [uint8]
-            Duration for which `Motion` must be below `FreezeThresh` for freezing to be 
-            registered.
-            
-        crop:: [holoviews.streams.stream]
-            Holoviews stream object enabling dynamic selection in response to 
-            cropping tool. `crop.data` contains x and y coordinates of crop
-            boundary vertices. Set to None if no cropping supplied.
-            
-        SIGMA:: [float]
-            Sigma value for gaussian filter applied to each image. Passed to 
-            OpenCV `cv2.GuassianBlur`    
-
+        manifest:: [dict]
+            Batch manifest, as returned by `Batch_Manifest_Load`.
+                
+        params:: [dict]
+            Dictionary of all parameters that outputs of video depend upon. See 
+            `Batch_Manifest_Update`.
     
     -------------------------------------------------------------------------------------
     Returns:
-        summary_all:: [pandas.dataframe]
-            Pandas dataframe with binned summary information for all videos
-            processed. If `bin_dict = None`, average freezing and motion for each video
-            will be returned.
-    
-    -------------------------------------------------------------------------------------
-    Notes:
+        completed:: [bool]
+            True if video has already been processed.
     
     """
-
-    #Loop through files    
-    for video_dict['file'] in video_dict['FileNames']:
-
-        #Set file
-        print ('Processing File: {f}'.format(f=video_dict['file']))
-        video_dict['fpath'] = os.path.join(os.path.normpath(video_dict['dpath']), video_dict['file'])
-
-        #Analyze frame by frame motion and freezing and save csv of results
-        Motion = Measure_Motion(video_dict,mt_cutoff,crop,SIGMA=1)  
-        Freezing = Measure_Freezing(Motion,FreezeThresh,MinDuration)  
-        SaveData(video_dict,Motion,Freezing,mt_cutoff,FreezeThresh,MinDuration)
-        summary = Summarize(video_dict,Motion,Freezing,FreezeThresh,
-                            MinDuration,mt_cutoff,bin_dict=bin_dict)
-
-        #Add summary info for individual file to larger summary of all files
-        try:
-            summary_all = pd.concat([summary_all,summary])
-        except NameError: #to be done for first file in list, before summary_all is created
-            summary_all = summary
-
-    #Write summary data to csv file
-    sum_pathout = os.path.join(os.path.normpath(video_dict['dpath']), 'BatchSummary.csv')
-    summary_all.to_csv(sum_pathout)
-    return summary_all
-
-
-
-
+    
+    entry = manifest.get(video_dict['file'])
+    if entry is None:
+        return False
+    params = json.loads(json.dumps(params, sort_keys=True, default=str))
+    if entry.get('signature') != hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest():
+        return False
+    dpath = os.path.normpath(video_dict['dpath'])
+    if not all(os.path.isfile(os.path.join(dpath, output)) for output in entry.get('outputs',[])):
+        return False
+    return entry.get('video') == Video_Hash(video_dict['fpath'])
+    
+    
+    
+    
 
 ########################################################################################
 
-def Calibrate(video_dict,cal_pix,SIGMA):
+def Calibrate(video_dict,cal_pix=None,SIGMA=1,resolution=0.01,downsample=1):
     """ 
     -------------------------------------------------------------------------------------
     
@@ -959,15 +3221,24 @@ def Calibrate(video_dict,cal_pix,SIGMA):
                 'file' : filename with extension, e.g. 'myvideo.wmv' [str]
                 'fps' : frames per second of video files to be processed [int]
                 'cal_sec' : number of seconds to calibrate based upon [int]
+                'reader' : (optional) video decoding backend, 'cv2' (default) or 
+                           'ffmpeg'. See `FrameReader` [str]
         
         cal_pix:: [int]
-            Number of pixels in frame to base calibration upon. Random selection of 
-            all pixels, sampled with replacement. Note that sampling strategy was
-            implemented to reduce memory load.
+            No longer used. Previously, number of pixels randomly sampled per frame. 
+            All pixels of every frame are now used. Retained for compatibility.
             
         SIGMA:: [float]
             Sigma value for gaussian filter applied to each image. Passed to 
             OpenCV `cv2.GuassianBlur`    
+            
+        resolution:: [float]
+            Width of grayscale bins used to accumulate frame by frame differences. 
+            Reported percentile is exact to within this value.
+            
+        downsample:: [float]
+            Factor by which frames are reduced in width and height prior to 
+            analysis. Should match `downsample` passed to `Measure_Motion`.
 
     
     -------------------------------------------------------------------------------------
@@ -979,33 +3250,28 @@ def Calibrate(video_dict,cal_pix,SIGMA):
             
     -------------------------------------------------------------------------------------
     Notes:
+        - Differences of all pixels are accumulated into a fixed-size histogram, such 
+          that memory use does not depend upon `cal_sec` or frame size. 
     
     """
     
-    #Upoad file
-    cap = cv2.VideoCapture(video_dict['fpath'])
-    
     #set seconds to examine and frames
     cal_frames = video_dict['cal_sec']*video_dict['fps']
+    
+    #Upoad file, decoding frames in background
+    cap = FrameReader(video_dict['fpath'],0,cal_frames,reader=video_dict.get('reader','cv2'))
 
-    #Initialize matrix for difference values
-    cal_dif = np.zeros((cal_frames,cal_pix))
-
-    #Initialize video
-    cap.set(cv2.CAP_PROP_POS_FRAMES,0) 
+    #Initialize histogram of difference values, spanning full grayscale range
+    n_bins = int(np.ceil(256/resolution))
+    cal_hist = np.zeros(n_bins,dtype='int64')
+    cal_sum = 0
 
     #Initialize first frame
     ret, frame = cap.read()
-    frame_new = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    frame_new = Downsample(frame, downsample)
+    SIGMA = SIGMA / downsample
     frame_new = cv2.GaussianBlur(frame_new.astype('float'),(0,0),SIGMA)
 
-    #Get random set of pixels to examine across frames
-    h,w=frame_new.shape
-    h_loc = np.random.rand(cal_pix,1)*h
-    h_loc = h_loc.astype(int)
-    w_loc = np.random.rand(cal_pix,1)*w
-    w_loc = w_loc.astype(int)
-
     #Loop through frames to detect frame by frame differences
     for x in range (1,cal_frames):
 
@@ -1017,25 +3283,29 @@ def Calibrate(video_dict,cal_pix,SIGMA):
         
         if ret == True:
             #Process frame
-            frame_new = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            frame_new = Downsample(frame, downsample)
             frame_new = cv2.GaussianBlur(frame_new.astype('float'),(0,0),SIGMA)
 
-            #Get differences for select pixels
-            frame_pix_dif = np.absolute(frame_new[h_loc,w_loc] - frame_old[h_loc,w_loc])
-            frame_pix_dif = frame_pix_dif[:,0]
-
-            #Populate difference array
-            cal_dif[x,:]=frame_pix_dif
+            #Add differences of all pixels to histogram
+            frame_dif = np.absolute(frame_new - frame_old)
+            cal_sum += frame_dif.sum()
+            frame_bin = np.minimum((frame_dif/resolution).astype(int), n_bins-1)
+            cal_hist += np.bincount(frame_bin.ravel(), minlength=n_bins)
             
         else: #if no frame returned
-            cal_dif = cal_dif[:x,:]
             print('Only {a} frames detected'.format(a=x))
             break
+    cap.release()
     
-    percentile = np.percentile(cal_dif,99.99)
+    #Find 99.99 percentile, interpolating within histogram bin
+    cal_cum = np.cumsum(cal_hist)
+    rank = 0.9999*(cal_cum[-1]-1)
+    b = np.searchsorted(cal_cum, rank, side='right')
+    below = cal_cum[b-1] if b > 0 else 0
+    percentile = (b + (rank - below + 0.5)/cal_hist[b])*resolution
 
     #Calculate grayscale change cutoff for detecting motion
-    cal_dif_avg = np.nanmean(cal_dif)
+    cal_dif_avg = cal_sum / cal_cum[-1]
 
     #Set Cutoff
     mt_cutoff = 2*percentile
@@ -1045,7 +3315,9 @@ def Calibrate(video_dict,cal_pix,SIGMA):
     print ('99.99 percentile of pixel change differences: ' + str(percentile))
     print ('Grayscale change cut-off for pixel change: ' + str(mt_cutoff))
     
-    hist_freqs, hist_edges = np.histogram(cal_dif,bins=np.arange(30),density=True)
+    hist_edges = np.arange(30)
+    hist_counts = np.add.reduceat(cal_hist, np.around(hist_edges/resolution).astype(int))[:-1]
+    hist_freqs = hist_counts / hist_counts.sum()
     hist = hv.Histogram((hist_edges, hist_freqs))
     hist.opts(title="Motion Cutoff: "+str(np.around(mt_cutoff,1)),xlabel="Grayscale Change",ylabel=
              'Proportion')
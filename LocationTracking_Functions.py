@@ -3,17 +3,36 @@
 LIST OF FUNCTIONS
 
 LoadAndCrop
+Crop_Spec
 cropframe
+FrameReader
 Reference
+Reference_Frames
+Reference_Cache_Path
+Reference_Cache_Load
+Reference_Cache_Save
 Locate
+Locator
+Hist_Percentile
 TrackLocation
 LocationThresh_View
 ROI_plot
 ROI_Location
 Batch_LoadFiles
 Batch_Process
+Write_CSV
+Write_Frames
+Read_Frames
+Compact_Dtype
+Batch_Part_Path
+Batch_Consolidate
+Batch_Manifest_Load
+Batch_Manifest_Update
+Batch_Manifest_Check
+Video_Hash
 PlayVideo
 PlayVideo_ext
+FrameDisplay
 showtrace
 Heatmap
 DistanceTool
@@ -31,20 +50,23 @@ import os
 import sys
 import cv2
 import fnmatch
+import hashlib
+import json
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import pandas as pd
-import PIL.Image
 import time
 import warnings
+import threading
+import queue
+import subprocess
+import tempfile
 import functools as fct
-from scipy import ndimage
 import holoviews as hv
 from holoviews import opts
 from holoviews import streams
 from holoviews.streams import Stream, param
-from io import BytesIO
 from IPython.display import clear_output, Image, display
 hv.notebook_extension('bokeh')
 warnings.filterwarnings("ignore")
@@ -176,6 +198,62 @@ def LoadAndCrop(video_dict,stretch={'width':1,'height':1},cropmethod=None,fstfil
 
 ########################################################################################
 
+def Crop_Spec(crop):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Converts `crop` into a plain crop specification, with integer bounds of the cropped
+    region. The specification can be computed once per video, applied to each frame by
+    `cropframe`, and passed to other processes or saved, without holoviews.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        crop:: [hv.streams.stream or dict]
+            Holoviews stream object enabling dynamic selection in response to 
+            cropping tool. `crop.data` contains x and y coordinates of crop
+            boundary vertices. Set to None if no cropping supplied. If a crop 
+            specification is passed, it is returned unchanged. If a dictionary of 
+            named crop regions is passed, each region is converted.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        crop:: [dict]
+            Dictionary with the following keys, or None if no cropping supplied:
+                'y0' : first row of cropped region [int]
+                'y1' : row after last row of cropped region [int]
+                'x0' : first column of cropped region [int]
+                'x1' : column after last column of cropped region [int]
+            If dictionary of named crop regions is passed, dictionary of such
+            specifications, with region names as keys.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Bounds are used as python slice bounds, such that a frame is cropped as
+          `frame[y0:y1,x0:x1]`.
+        - Region names should not be 'y0', 'y1', 'x0' or 'x1'.
+
+    """
+    
+    #Dictionary of named regions
+    if isinstance(crop, dict) and 'y0' not in crop:
+        return {name: Crop_Spec(region) for name, region in crop.items()}
+    
+    if crop is None or isinstance(crop, dict):
+        return crop
+    
+    #No crop drawn
+    if len(crop.data.get('x0',[])) == 0:
+        return None
+    
+    Xs=[crop.data['x0'][0],crop.data['x1'][0]]
+    Ys=[crop.data['y0'][0],crop.data['y1'][0]]
+    return dict(y0=int(min(Ys)), y1=int(max(Ys)), x0=int(min(Xs)), x1=int(max(Xs)))
+    
+    
+    
+    
+
+########################################################################################    
 def cropframe(frame,crop=None):
     """ 
     -------------------------------------------------------------------------------------
@@ -185,39 +263,275 @@ def cropframe(frame,crop=None):
     -------------------------------------------------------------------------------------
     Args:
         frame:: [numpy.ndarray]
-            2d numpy array 
-        crop:: [hv.streams.stream]
+            2d numpy array. 3d arrays (e.g. color frames) are cropped in their first 
+            two dimensions.
+        crop:: [hv.streams.stream or dict]
             Holoviews stream object enabling dynamic selection in response to 
             cropping tool. `crop.data` contains x and y coordinates of crop
-            boundary vertices. Set to None if no cropping supplied.
+            boundary vertices. Set to None if no cropping supplied. Alternatively, 
+            crop specification returned by `Crop_Spec`, which should be used when
+            cropping many frames.
     
     -------------------------------------------------------------------------------------
     Returns:
         frame:: [numpy.ndarray]
-            2d numpy array
+            2d numpy array. View of passed frame.
     
     -------------------------------------------------------------------------------------
     Notes:
 
     """
     
-    try:
-        Xs=[crop.data['x0'][0],crop.data['x1'][0]]
-        Ys=[crop.data['y0'][0],crop.data['y1'][0]]
-        fxmin,fxmax=int(min(Xs)), int(max(Xs))
-        fymin,fymax=int(min(Ys)), int(max(Ys))
-        return frame[fymin:fymax,fxmin:fxmax]
-    except:
+    crop = Crop_Spec(crop)
+    if crop is None:
         return frame
+    return frame[crop['y0']:crop['y1'],crop['x0']:crop['x1']]
  
     
     
     
 
+########################################################################################
+
+class FrameReader:
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Reads frames of a video on a background thread, converting each to grayscale and 
+    cropping it, such that decoding of upcoming frames proceeds while the current frame
+    is analyzed. Frames are written to a small, fixed set of reusable buffers.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        fpath:: [str]
+            Full path to video file.
+            
+        start:: [uint]
+            Frame at which to start. 0-based.
+            
+        end:: [uint]
+            Frame at which to end (exclusive). Set to None to read until the last 
+            frame of the video.
+                
+        crop:: [holoviews.streams.stream]
+            Holoviews stream object enabling dynamic selection in response to 
+            cropping tool. `crop.data` contains x and y coordinates of crop
+            boundary vertices. Set to None if no cropping supplied. Alternatively,
+            crop specification returned by `Crop_Spec`.
+            
+        n_buffers:: [uint]
+            Number of frame buffers. Decoding runs at most `n_buffers-1` frames 
+            ahead of analysis. Must be at least 2.
+            
+        reader:: [str]
+            Decoding backend. Takes the following values:
+                'cv2' : frames are decoded to BGR by `cv2.VideoCapture`, then 
+                        cropped and converted to grayscale.
+                'ffmpeg' : frames are decoded by an `ffmpeg` subprocess, which 
+                           crops them and extracts luma before writing raw 
+                           grayscale frames to a pipe. Requires `ffmpeg` on the 
+                           system path. See Notes.
+    
+    -------------------------------------------------------------------------------------
+    Attributes:
+        fps:: [float]
+            Frames per second of video, as reported by OpenCV.
+            
+        frame_count:: [uint]
+            Total number of frames in video, as reported by OpenCV.
+            
+        shape:: [tuple]
+            Shape of processed frames, (height, width). None if no frame could be read.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - `read` mirrors `cv2.VideoCapture.read`, returning `ret, frame`. The returned
+          frame is only valid until the next call to `read`, after which its buffer
+          is reused. Copy it if it must be retained.
+        - `release` should be called when done, or the reader used as a context 
+          manager.
+        - With `reader='ffmpeg'`, grayscale values are the decoder's luma plane
+          rather than OpenCV's weighted sum of BGR values. These typically differ by
+          a grayscale level or less, but can differ more in fine, saturated color 
+          detail, where chroma subsampling affects the BGR values. Parameters such as `mt_cutoff`
+          should be calibrated with the same backend used for analysis. The first 
+          frame is located by input seeking (ffmpeg's `-ss`) to time `start/fps`. 
+          ffmpeg decodes from the preceding keyframe and discards frames before 
+          `start`, such that the prefix of the video is not decoded. This assumes a
+          constant frame rate.
+        - If ffmpeg exits with an error before `end`, `read` raises `RuntimeError`
+          with ffmpeg's error output, rather than ending the video early.
+
+    """
+    
+    def __init__(self,fpath,start=0,end=None,crop=None,n_buffers=4,reader='cv2'):
+        
+        #Open video
+        self.cap = cv2.VideoCapture(fpath)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.remaining = end - start if end is not None else None
+        self.crop = Crop_Spec(crop)
+        self.reader = reader
+        self.free = queue.Queue()
+        self.filled = queue.Queue()
+        self.current = None
+        self.done = False
+        self.error = None
+        self.stopped = threading.Event()
+        self.thread = None
+        self.shape = None
+        if reader == 'cv2':
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES,start)
+        elif reader == 'ffmpeg':
+            self.open_ffmpeg(fpath,start)
+        else:
+            raise ValueError("reader must be 'cv2' or 'ffmpeg'")
+        
+        #Read first frame to define buffers
+        frame = None
+        if reader == 'cv2' and self.remaining != 0:
+            ret, frame = self.cap.read()
+            self.shape = cropframe(frame, self.crop).shape[:2] if ret == True else None
+        if self.shape is None or self.remaining == 0:
+            self.shape = None
+            self.filled.put(None)
+            return
+        for i in range(max(n_buffers,2)):
+            buffer = np.frombuffer(bytearray(self.shape[0]*self.shape[1]),dtype='uint8')
+            self.free.put(buffer.reshape(self.shape))
+        buffer = self.free.get()
+        if not self.grab(buffer,frame):
+            self.shape = None
+            self.filled.put(None)
+            return
+        self.filled.put(buffer)
+        
+        #Decode remaining frames in background
+        self.thread = threading.Thread(target=self.decode,daemon=True)
+        self.thread.start()
+        
+    def open_ffmpeg(self,fpath,start):
+        
+        #Define crop region in ffmpeg terms, with same bounds as `cropframe`
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.cap.release()
+        rows, cols = range(height), range(width)
+        if self.crop is not None:
+            rows = rows[self.crop['y0']:self.crop['y1']]
+            cols = cols[self.crop['x0']:self.crop['x1']]
+        self.shape = (len(rows), len(cols))
+        if len(rows) == 0 or len(cols) == 0:
+            self.remaining = 0
+            return
+        vf = 'format=gray,crop={w}:{h}:{x}:{y}'.format(
+            w=len(cols), h=len(rows), x=cols[0], y=rows[0])
+        
+        #Seek to time of start frame, from which ffmpeg decodes from prior keyframe
+        seek = []
+        if start > 0 and self.fps > 0:
+            seek = ['-ss', '{t:.6f}'.format(t=start/self.fps)]
+        
+        #Launch decoder, writing raw grayscale frames to pipe and errors to file
+        command = ['ffmpeg', '-v', 'error', '-nostdin'] + seek + ['-i', fpath, '-an', '-sn', 
+                   '-vf', vf, '-vsync', '0', '-f', 'rawvideo', '-pix_fmt', 'gray', '-']
+        if self.remaining is not None:
+            command[-1:-1] = ['-frames:v', str(self.remaining)]
+        self.stderr = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(command, stdout=subprocess.PIPE, 
+                                     stderr=self.stderr, bufsize=0)
+        
+    def grab(self,buffer,frame=None):
+        
+        if self.reader == 'cv2':
+            if frame is None:
+                ret, frame = self.cap.read()
+                if ret == False:
+                    return False
+            cv2.cvtColor(cropframe(frame, self.crop), cv2.COLOR_BGR2GRAY, dst=buffer)
+            return True
+        
+        #Fill buffer directly from ffmpeg pipe
+        view = memoryview(buffer).cast('B')
+        n = 0
+        while n < len(view):
+            n_read = self.proc.stdout.readinto(view[n:])
+            if not n_read:
+                self.check_ffmpeg()
+                return False
+            n += n_read
+        return True
+    
+    def check_ffmpeg(self):
+        
+        #Raise ffmpeg's error output if it exited with an error, unless killed by release
+        if self.proc.wait() != 0 and not self.stopped.is_set():
+            self.stderr.seek(0)
+            message = self.stderr.read().decode(errors='replace').strip()
+            raise RuntimeError('ffmpeg exited with code {c}: {m}'.format(
+                c=self.proc.returncode, m=message))
+        
+    def decode(self):
+        try:
+            x = 1
+            while not self.stopped.is_set() and (self.remaining is None or x < self.remaining):
+                buffer = self.free.get()
+                if self.stopped.is_set() or not self.grab(buffer):
+                    break
+                self.filled.put(buffer)
+                x += 1
+        except Exception as e:
+            self.error = e
+        self.filled.put(None)
+        
+    def read(self):
+        
+        #Return buffer of prior frame for reuse
+        if self.current is not None:
+            self.free.put(self.current)
+            self.current = None
+        if self.done:
+            return False, None
+        
+        #Get next frame
+        self.current = self.filled.get()
+        if self.current is None:
+            self.done = True
+            if self.error is not None:
+                raise self.error
+            return False, None
+        return True, self.current
+    
+    def release(self):
+        self.stopped.set()
+        if self.reader == 'ffmpeg' and hasattr(self, 'proc'):
+            self.proc.kill()
+        if self.thread is not None:
+            self.free.put(np.empty(self.shape,dtype='uint8')) #unblock decoding thread
+            self.thread.join()
+        if self.reader == 'ffmpeg' and hasattr(self, 'proc'):
+            self.proc.stdout.close()
+            self.proc.wait()
+            self.stderr.close()
+        self.cap.release()
+        self.done = True
+        
+    def __enter__(self):
+        return self
+    
+    def __exit__(self,*args):
+        self.release()
+        
+        
+        
+        
+
 ########################################################################################
 
 def Reference(video_dict,stretch=dict(width=1,height=1),crop=None,num_frames=100,
-              altfile=False,fstfile=False):
+              altfile=False,fstfile=False,sampling='scan',seek_gap=250,median='exact',
+              cache=True):
     """ 
     -------------------------------------------------------------------------------------
     
@@ -265,6 +579,30 @@ def Reference(video_dict,stretch=dict(width=1,height=1),crop=None,num_frames=100
         fstfile:: [bool]
             Dictates whether to use first file in video_dict['FileNames'] to generate
             reference.  True/False
+            
+        sampling:: ['scan','seek']
+            How randomly selected frames are read. If 'scan', frames are read in order
+            of their position, in a single forward pass through the video. If 'seek',
+            video is seeked to each frame in random order.
+            
+        seek_gap:: [uint]
+            If `sampling='scan'`, gaps between consecutive selected frames that exceed
+            this number of frames are skipped by seeking rather than by decoding 
+            through them. Should be on the order of the keyframe interval of the video.
+            
+        median:: ['exact','histogram']
+            If 'exact', frames are stored as uint8 and their per-pixel median is taken,
+            requiring one byte per pixel per frame. If 'histogram', the same median is
+            located in per-pixel histograms of 16 bins, first of coarse intensity bins 
+            and then of values within the bin holding the median, requiring about 50 
+            bytes per pixel regardless of `num_frames`. Selected frames are read 
+            twice. Preferable when `num_frames` is large on high resolution videos.
+            
+        cache:: [bool]
+            Whether to use on-disk reference cache. When True, a reference previously
+            generated from the same video with the same `crop`, 'start', 'end', 
+            `num_frames`, `sampling` and `median` is loaded rather than generated 
+            again. See `Reference_Cache_Path`.
     
     -------------------------------------------------------------------------------------
     Returns:
@@ -276,6 +614,15 @@ def Reference(video_dict,stretch=dict(width=1,height=1),crop=None,num_frames=100
     -------------------------------------------------------------------------------------
     Notes:
         - If `altfile` is specified, it will be used to generate reference.
+        - Seeking in compressed video decodes from the preceding keyframe, such that 
+          seeking to each frame in random order can be slower than tracking a short
+          video. With `sampling='scan'`, cost is at most one linear pass. Both methods 
+          select the same frames for a given random seed.
+        - With `sampling='scan'`, if frames near the end of the video cannot be read
+          (e.g. frame count reported by file is too high), reference is based on 
+          frames read up to that point.
+        - As reference is based on a random subset of frames, set `cache=False` to 
+          generate a new reference from a different subset.
     
     """
     
@@ -283,38 +630,105 @@ def Reference(video_dict,stretch=dict(width=1,height=1),crop=None,num_frames=100
     video_dict['file'] = video_dict['FileNames'][0] if fstfile else video_dict['file']      
     vname = video_dict.get("altfile","") if altfile else video_dict['file']    
     fpath = os.path.join(os.path.normpath(video_dict['dpath']), vname)
-    if os.path.isfile(fpath):
-        cap = cv2.VideoCapture(fpath)
-    else:
+    if not os.path.isfile(fpath):
         raise FileNotFoundError('File not found. Check that directory and file names are correct.')
-    cap.set(cv2.CAP_PROP_POS_FRAMES,0)
     
-    #Get video dimensions with any cropping applied
-    ret, frame = cap.read()
-    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    frame = cropframe(frame, crop)
-    h,w = frame.shape[0], frame.shape[1]
-    cap_max = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) 
-    cap_max = int(video_dict['end']) if video_dict['end'] is not None else cap_max
+    #Load reference from cache, if previously generated with same parameters
+    crop = Crop_Spec(crop)
+    params = dict(start=video_dict['start'], end=video_dict['end'], crop=crop, 
+                  num_frames=num_frames, sampling=sampling, median=median)
+    cache_path = Reference_Cache_Path(video_dict, fpath, params) if cache else None
+    reference = Reference_Cache_Load(cache_path) if cache else None
     
-    #Collect subset of frames
-    collection = np.zeros((num_frames,h,w))  
-    for x in range (num_frames):          
-        grabbed = False
-        while grabbed == False: 
-            y=np.random.randint(video_dict['start'],cap_max)
-            cap.set(cv2.CAP_PROP_POS_FRAMES, y)
-            ret, frame = cap.read()
-            if ret == True:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                gray = cropframe(gray, crop)
-                collection[x,:,:]=gray
-                grabbed = True
-            elif ret == False:
-                pass
-    cap.release() 
-
-    reference = np.median(collection,axis=0)
+    if reference is None:
+        cap = cv2.VideoCapture(fpath)
+        cap.set(cv2.CAP_PROP_POS_FRAMES,0)
+        
+        #Get video dimensions with any cropping applied
+        ret, frame = cap.read()
+        frame = cropframe(frame, crop)
+        h,w = frame.shape[0], frame.shape[1]
+        cap_max = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) 
+        cap_max = int(video_dict['end']) if video_dict['end'] is not None else cap_max
+        
+        #Select frames, in order of position or at random
+        if sampling == 'scan':
+            positions = np.sort(np.random.randint(video_dict['start'],cap_max,num_frames))
+        elif sampling == 'seek':
+            positions = [None]*num_frames
+        else:
+            raise ValueError("sampling must be 'scan' or 'seek'")
+        if median not in ('exact','histogram'):
+            raise ValueError("median must be 'exact' or 'histogram'")
+        frames = Reference_Frames(cap,positions,crop,sampling,seek_gap,
+                                  video_dict['start'],cap_max)
+        
+        #Store frames as uint8 samples, and take median in blocks of rows, to bound
+        #memory of intermediate arrays
+        if median == 'exact':
+            collection = np.zeros((num_frames,h,w),dtype='uint8')
+            x = 0
+            for y, gray in frames:
+                collection[x,:,:] = gray
+                x += 1
+            cap.release() 
+            if x == 0:
+                raise ValueError('No frames could be read to generate reference.')
+            collection = collection[:x]
+            reference = np.zeros((h,w))
+            rows = max(1, 2**24 // (x*w))
+            for row in range(0, h, rows):
+                reference[row:row+rows] = np.median(collection[:,row:row+rows], axis=0)
+        
+        #Or locate median in per-pixel histograms of 16 intensity bins, first of
+        #coarse bins (values//16), then of values within bin holding median
+        else:
+            dtype = 'uint16' if num_frames < 2**16 else 'uint32'
+            hist = np.zeros((16,h,w),dtype=dtype)
+            coarse = np.empty((h,w),dtype='uint8')
+            mask = np.empty((h,w),dtype='bool')
+            read = []
+            for y, gray in frames:
+                np.right_shift(gray, 4, out=coarse)
+                for b in range(16):
+                    np.equal(coarse, b, out=mask)
+                    hist[b] += mask
+                read.append(y)
+            cap.release()
+            n = len(read)
+            if n == 0:
+                raise ValueError('No frames could be read to generate reference.')
+            
+            #Coarse bin of lower median (rank (n-1)//2), and its rank within bin
+            np.cumsum(hist, axis=0, out=hist)
+            bin_lo = np.argmax(hist > (n-1)//2, axis=0)
+            below = np.where(bin_lo > 0, np.take_along_axis(hist, np.maximum(bin_lo-1,0)[None], 0)[0], 0)
+            rank = ((n-1)//2 - below).astype(dtype)
+            base = (bin_lo*16).astype('uint8')
+            top = base + 15
+            
+            #Histogram of values within bin of lower median, re-reading same frames, 
+            #and smallest value above bin, for upper median of even number of frames
+            hist[:] = 0
+            above = np.full((h,w),255,dtype='uint8')
+            cap = cv2.VideoCapture(fpath)
+            for y, gray in Reference_Frames(cap,read,crop,sampling,seek_gap,
+                                            video_dict['start'],cap_max):
+                np.subtract(gray, base, out=coarse) #wraps to >= 16 outside bin
+                for b in range(16):
+                    np.equal(coarse, b, out=mask)
+                    hist[b] += mask
+                np.minimum(above, gray, out=above, where=gray > top)
+            cap.release()
+            np.cumsum(hist, axis=0, out=hist)
+            lower = base + np.argmax(hist > rank, axis=0)
+            rank += n//2 - (n-1)//2
+            upper = np.where(rank < hist[-1], base + np.argmax(hist > rank, axis=0), above)
+            reference = (lower.astype('float64') + upper) / 2
+            
+        if cache:
+            Reference_Cache_Save(cache_path, reference, params)
+        
     image = hv.Image((np.arange(reference.shape[1]),
                       np.arange(reference.shape[0]), 
                       reference)).opts(width=int(reference.shape[1]*stretch['width']),
@@ -330,6 +744,226 @@ def Reference(video_dict,stretch=dict(width=1,height=1),crop=None,num_frames=100
 
 
 
+########################################################################################
+
+def Reference_Frames(cap,positions,crop=None,sampling='scan',seek_gap=250,start=0,stop=None):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Reads frames selected by `Reference` from an open video, yielding each as a 
+    cropped grayscale frame.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        cap:: [cv2.VideoCapture]
+            Opened video. Reading continues from its current position.
+            
+        positions:: [list]
+            Frames to be read. With `sampling='scan'`, in ascending order. With 
+            `sampling='seek'`, entries that are None are drawn at random between 
+            `start` and `stop`, until a frame can be read.
+            
+        crop:: [dict]
+            Crop specification returned by `Crop_Spec`. None if no cropping.
+            
+        sampling:: ['scan','seek']
+            How frames are read. See `Reference`.
+            
+        seek_gap:: [uint]
+            Gaps between consecutive positions that exceed this number of frames are
+            skipped by seeking rather than decoding through them. See `Reference`.
+            
+        start:: [uint]
+            First frame that can be drawn at random.
+            
+        stop:: [uint]
+            Frame before which frames are drawn at random.
+    
+    -------------------------------------------------------------------------------------
+    Yields:
+        y:: [uint]
+            Position of frame.
+            
+        gray:: [numpy.array]
+            Cropped grayscale frame.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - With `sampling='scan'`, reading stops at the first frame that cannot be 
+          read. With `sampling='seek'`, given positions that cannot be read are 
+          skipped.
+    
+    """
+    
+    pos, gray = int(cap.get(cv2.CAP_PROP_POS_FRAMES)), None #position of next frame
+    for y in positions:
+        
+        if sampling == 'seek':
+            given, ret = y, False
+            while ret == False:
+                y = np.random.randint(start,stop) if given is None else given
+                cap.set(cv2.CAP_PROP_POS_FRAMES, y)
+                ret, frame = cap.read()
+                if ret == False and given is not None:
+                    break
+            if ret == False:
+                continue
+            
+        #Read next position, unless frame was selected more than once 
+        elif gray is None or y != pos-1:
+        
+            #Seek across large gaps, otherwise decode through gap without retrieving frames
+            if y < pos or y - pos > seek_gap:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, y)
+                pos = y
+            ret = True
+            while ret and pos < y:
+                ret = cap.grab()
+                pos += 1
+            if ret:
+                ret, frame = cap.read()
+            if ret == False:
+                break
+            pos += 1
+        
+        gray = cv2.cvtColor(cropframe(frame, crop), cv2.COLOR_BGR2GRAY)
+        yield y, gray
+    
+    
+    
+    
+    
+########################################################################################
+
+def Reference_Cache_Path(video_dict,fpath,params):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Returns path of file in which reference frame is cached for given video and set of
+    reference parameters. Cache files are stored in `video_dict['cache_dir']`, which 
+    defaults to folder 'ReferenceCache' within `video_dict['dpath']`.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'cache_dir' : (optional) directory in which to store cached reference
+                              frames [str]
+                              
+        fpath:: [str]
+            Path to video file from which reference is generated.
+                              
+        params:: [dict]
+            Dictionary of all parameters that reference depends upon (e.g. 'start', 
+            'end', 'crop', 'num_frames'). Values must be json serializable.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        cache_path:: [str]
+            Path to .npy cache file. File may not yet exist.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Cache files are named by a hash of `params` and `Video_Hash` of the video 
+          file, not by file name, such that a renamed video is still recognized and a
+          modified video is not. A video moved to another folder is only recognized 
+          if `video_dict['cache_dir']` points to the same cache directory.
+        - Parameters of each cached reference are written alongside it, in a .json 
+          file of the same name.
+
+    """
+    
+    cache_dir = video_dict.get('cache_dir', os.path.join(os.path.normpath(video_dict['dpath']), 'ReferenceCache'))
+    key = json.dumps(dict(params, video=Video_Hash(fpath)), sort_keys=True, default=str)
+    key = hashlib.sha1(key.encode()).hexdigest()[:20]
+    fname = 'reference_{k}.npy'.format(k=key)
+    return os.path.join(cache_dir, fname)
+
+
+
+
+
+########################################################################################
+
+def Reference_Cache_Load(cache_path):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Loads cached reference frame, if present.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        cache_path:: [str]
+            Path to .npy cache file, as returned by `Reference_Cache_Path`.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        reference:: [numpy.array]
+            Reference image. None if not in cache.
+    
+    """
+    
+    try:
+        reference = np.load(cache_path).astype('float64')
+    except (OSError, ValueError):
+        return None
+    print('Loaded reference from cache: {f}'.format(f=cache_path))
+    return reference
+
+
+
+
+
+########################################################################################
+
+def Reference_Cache_Save(cache_path,reference,params):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Saves reference frame to cache, along with .json file describing parameters it was
+    generated with.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        cache_path:: [str]
+            Path to .npy cache file, as returned by `Reference_Cache_Path`.
+            
+        reference:: [numpy.array]
+            Reference image.
+            
+        params:: [dict]
+            Dictionary of all parameters that reference depends upon. See 
+            `Reference_Cache_Path`.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Nothing returned
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Reference is stored as float32, which holds medians of uint8 frames exactly.
+        - Files are written under a temporary name and then renamed, such that a 
+          partially written file is never loaded.
+
+    """
+    
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    meta_path = os.path.splitext(cache_path)[0] + '.json'
+    tmp_path = '{p}.{pid}.tmp'.format(p=meta_path, pid=os.getpid())
+    with open(tmp_path,'w') as f:
+        json.dump(dict(params, shape=reference.shape, created=time.strftime('%Y-%m-%d %H:%M:%S')), 
+                  f, indent=1, sort_keys=True, default=str)
+    os.replace(tmp_path, meta_path)
+    tmp_path = '{p}.{pid}.tmp'.format(p=cache_path, pid=os.getpid())
+    with open(tmp_path,'wb') as f:
+        np.save(f, reference.astype('float32'))
+    os.replace(tmp_path, cache_path)
+
+
+
+
+
 ########################################################################################
 
 def Locate(cap,reference,tracking_params,crop=None,prior=None):
@@ -340,8 +974,10 @@ def Locate(cap,reference,tracking_params,crop=None,prior=None):
     
     -------------------------------------------------------------------------------------
     Args:
-        cap:: [cv2.VideoCapture]
-            OpenCV VideoCapture class instance for video.
+        cap:: [cv2.VideoCapture or FrameReader]
+            OpenCV VideoCapture class instance for video. Alternatively, FrameReader
+            instance, in which case frames are already converted to grayscale and 
+            cropped.
         
         reference:: [numpy array]
             Reference image that the current frame is compared to.
@@ -398,102 +1034,257 @@ def Locate(cap,reference,tracking_params,crop=None,prior=None):
     
     -------------------------------------------------------------------------------------
     Notes:
+        - Equivalent to a single call of `Locator.locate`. To locate animal across
+          successive frames, create a `Locator` once, such that its buffers are 
+          reused.
     
     """
     
-    #attempt to load frame
-    ret, frame = cap.read() 
-    
-    #set window dimensions
-    if prior != None and tracking_params['use_window']==True:
-        window_size = tracking_params['window_size']//2
-        ymin,ymax = prior[0]-window_size, prior[0]+window_size
-        xmin,xmax = prior[1]-window_size, prior[1]+window_size
-
-    if ret == True:
-        
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        frame = cropframe(frame,crop)
-        
-        #find difference from reference
-        if tracking_params['method'] == 'abs':
-            dif = np.absolute(frame-reference)
-        elif tracking_params['method'] == 'light':
-            dif = frame-reference
-        elif tracking_params['method'] == 'dark':
-            dif = reference-frame
-        dif = dif.astype('int16')
-              
-        #apply window
-        weight = 1 - tracking_params['window_weight']
-        if prior != None and tracking_params['use_window']==True:
-            dif = dif + (dif.min() * -1) #scale so lowest value is 0
-            dif_weights = np.ones(dif.shape)*weight
-            dif_weights[slice(ymin if ymin>0 else 0, ymax),
-                        slice(xmin if xmin>0 else 0, xmax)]=1
-            dif = dif*dif_weights
-            
-        #threshold differences and find center of mass for remaining values
-        dif[dif<np.percentile(dif,tracking_params['loc_thresh'])]=0
-        com=ndimage.measurements.center_of_mass(dif)
-        return ret, dif, com, frame
-    
-    else:
-        return ret, None, None, frame
+    return Locator(reference,tracking_params,crop).locate(cap,prior=prior)
 
     
     
     
     
-########################################################################################        
+########################################################################################
 
-def TrackLocation(video_dict,tracking_params,reference,crop=None):
+class Locator:
     """ 
     -------------------------------------------------------------------------------------
     
-    For each frame in video define location of animal, in x/y coordinates, and distance
-    travelled from previous frame.
+    Locates animal in successive frames, relative to reference frame. Work arrays 
+    (including the histogram buffer of `Hist_Percentile`) are allocated once and reused
+    for each frame, and window weighting scales only values outside the window, in 
+    place, such that no full-frame arrays are allocated per frame.
     
     -------------------------------------------------------------------------------------
     Args:
-        video_dict:: [dict]
-            Dictionary with the following keys:
-                'dpath' : directory containing files [str]
-                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
-                'fps' : frames per second of video files to be processed [int]
-                'start' : frame at which to start. 0-based [int]
-                'end' : frame at which to end.  set to None if processing 
-                        whole video [int]
-                'ftype' : (only if batch processing) 
-                          video file type extension (e.g. 'wmv') [str]
-                'FileNames' : (only if batch processing)
-                              List of filenames of videos in folder to be batch 
-                              processed.  [list]
-                              
+        reference:: [numpy array]
+            Reference image that frames are compared to.
+        
         tracking_params:: [dict]
-            Dictionary with the following keys:
-                'loc_thresh' : Percentile of difference values below which are set to 0. 
-                               After calculating pixel-wise difference between passed 
-                               frame and reference frame, these values are tthresholded 
-                               to make subsequent defining of center of mass more 
-                               reliable. [float between 0-100]
-                'use_window' : Will window surrounding prior location be 
-                               imposed?  Allows changes in area surrounding animal's 
-                               location on previous frame to be more heavily influential
-                               in determining animal's current location.
-                               After finding pixel-wise difference between passed frame 
-                               and reference frame, difference values outside square window 
-                               of prior location will be multiplied by (1 - window_weight), 
-                               reducing their overall influence. [bool]
-                'window_size' : If `use_window=True`, the length of one side of square 
-                                window, in pixels. [uint] 
-                'window_weight' : 0-1 scale for window, if used, where 1 is maximal 
-                                  weight of window surrounding prior locaiton. 
-                                  [float between 0-1]
-         
-        reference:: [numpy.array]
-            Reference image that the current frame is compared to.
-            
+            Dictionary of tracking parameters. See `Locate`.
+        
+        crop:: [holoviews.streams.stream]
+            Holoviews stream object enabling dynamic selection in response to 
+            cropping tool. `crop.data` contains x and y coordinates of crop
+            boundary vertices. Only used if frames are read from `cv2.VideoCapture`.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - `locate(cap,prior=None,lean=False)` reads next frame from `cap` and returns
+          `ret, dif, com, frame`, as `Locate` does. If `lean=True`, only `ret, com` 
+          are returned.
+        - Returned `dif` is a buffer owned by the Locator, which is overwritten on the
+          next call to `locate`. Copy it if it must be retained.
+        - Center of mass is computed from row and column sums of thresholded 
+          differences. It agrees with `scipy.ndimage.center_of_mass` to within 
+          floating point rounding.
+
+    """
+    
+    def __init__(self,reference,tracking_params,crop=None):
+        self.reference = reference
+        self.tracking_params = tracking_params
+        self.crop = Crop_Spec(crop)
+        self.dif = np.zeros(reference.shape, dtype='int16')
+        self.weighted = np.zeros(reference.shape)
+        self.below = np.zeros(reference.shape, dtype=bool)
+        self.shifted = np.zeros(reference.shape, dtype='uint16')
+        self.ygrid = np.arange(reference.shape[0], dtype='float64')
+        self.xgrid = np.arange(reference.shape[1], dtype='float64')
+        
+    def locate(self,cap,prior=None,lean=False):
+        
+        #attempt to load frame
+        ret, frame = cap.read() 
+        if ret == False:
+            return (ret, None) if lean else (ret, None, None, frame)
+        if not isinstance(cap, FrameReader):
+            frame = cv2.cvtColor(cropframe(frame, self.crop), cv2.COLOR_BGR2GRAY)
+        
+        #find difference from reference, truncated to integer
+        method = self.tracking_params['method']
+        if method == 'abs':
+            np.subtract(frame, self.reference, out=self.weighted)
+            np.absolute(self.weighted, out=self.weighted)
+        elif method == 'light':
+            np.subtract(frame, self.reference, out=self.weighted)
+        elif method == 'dark':
+            np.subtract(self.reference, frame, out=self.weighted)
+        np.copyto(self.dif, self.weighted, casting='unsafe')
+        
+        #set window dimensions
+        window = None
+        if prior is not None and self.tracking_params['use_window']==True:
+            self.dif -= self.dif.min() #scale so lowest value is 0
+            window_size = self.tracking_params['window_size']//2
+            ymin,ymax = prior[0]-window_size, prior[0]+window_size
+            xmin,xmax = prior[1]-window_size, prior[1]+window_size
+            window = (slice(ymin if ymin>0 else 0, ymax), slice(xmin if xmin>0 else 0, xmax))
+        
+        #find threshold, then weight values outside window in place
+        weight = 1 - self.tracking_params['window_weight']
+        thresh = Hist_Percentile(self.dif,self.tracking_params['loc_thresh'],window=window,
+                                 weight=weight,out=self.shifted)
+        np.copyto(self.weighted, self.dif)
+        if window is not None:
+            (y0,y1,_), (x0,x1,_) = window[0].indices(self.dif.shape[0]), window[1].indices(self.dif.shape[1])
+            y1, x1 = max(y0,y1), max(x0,x1)
+            for outside in [np.s_[:y0], np.s_[y1:], np.s_[y0:y1,:x0], np.s_[y0:y1,x1:]]:
+                self.weighted[outside] *= weight
+        
+        #threshold differences and find center of mass for remaining values
+        np.less(self.weighted, thresh, out=self.below)
+        np.copyto(self.weighted, 0, where=self.below)
+        rows, cols = self.weighted.sum(axis=1), self.weighted.sum(axis=0)
+        total = rows.sum()
+        com = (np.dot(rows, self.ygrid)/total, np.dot(cols, self.xgrid)/total)
+        return (ret, com) if lean else (ret, self.weighted, com, frame)
+
+
+
+
+
+########################################################################################
+
+def Hist_Percentile(dif,q,window=None,weight=1,out=None):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Returns percentile of difference image, identical to `np.percentile` with default
+    linear interpolation. For integer images, percentile is found from histogram of 
+    values (`cv2.calcHist`), in linear time, rather than by partially sorting all pixels.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        dif:: [numpy.array]
+            Difference image, of integer dtype.
+            
+        q:: [float]
+            Percentile to compute, between 0 and 100.
+            
+        window:: [tuple]
+            Tuple of slices selecting window within `dif`. Values outside window are 
+            taken to be multiplied by `weight`, as in `Locate`. Set to None if no window
+            is applied.
+            
+        weight:: [float]
+            Weight applied to values outside window.
+            
+        out:: [numpy.array]
+            uint16 array of same shape as `dif`, used as work buffer for offset 
+            values, such that none is allocated. Set to None to allocate one as 
+            needed.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        percentile:: [float]
+            Value of `dif` at percentile `q`.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - If `dif` is not of integer dtype, `np.percentile` is used.
+    
+    """
+    
+    #Fall back to sorting for non-integer values
+    if dif.dtype.kind not in 'iu':
+        if window is not None:
+            dif_weights = np.ones(dif.shape)*weight
+            dif_weights[window]=1
+            dif = dif*dif_weights
+        return np.percentile(dif,q)
+    
+    #Count each value, offset such that lowest value is 0. With window, values inside 
+    #window are also counted separately
+    low = int(dif.min())
+    span = int(dif.max()) - low + 1
+    if out is None or span > 2**16:
+        out = np.empty(dif.shape, dtype='uint16' if span <= 2**16 else 'int64')
+    shifted = np.subtract(dif, low, out=out, casting='unsafe')
+    regions = [shifted] if window is None or weight == 1 else [shifted, shifted[window]]
+    if span <= 2**16 and dif.size < 2**24: #counts returned as float32 are exact
+        counts = [cv2.calcHist([region],[0],None,[span],[0,span]).ravel().astype('int64') for region in regions]
+    else:
+        counts = [np.bincount(region.ravel(), minlength=span) for region in regions]
+    values = np.arange(low, low+span).astype('float64')
+    if len(regions) == 1:
+        counts = counts[0]
+    else:
+        counts, inside = counts
+        values = np.concatenate((values, values*weight))
+        counts = np.concatenate((inside, counts-inside))
+        order = np.argsort(values, kind='stable')
+        values, counts = values[order], counts[order]
+    cumulative = np.cumsum(counts)
+    
+    #Interpolate between values adjacent to percentile position, as np.percentile does
+    n = cumulative[-1]
+    index = (n-1) * (q/100)
+    previous = np.floor(index)
+    gamma = index - previous
+    a = values[np.searchsorted(cumulative, previous, side='right')]
+    b = values[np.searchsorted(cumulative, min(previous+1, n-1), side='right')]
+    if gamma >= 0.5:
+        return b - (b-a)*(1-gamma)
+    return a + (b-a)*gamma
+    
+    
+    
+    
+    
+########################################################################################        
+
+def TrackLocation(video_dict,tracking_params,reference,crop=None):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    For each frame in video define location of animal, in x/y coordinates, and distance
+    travelled from previous frame.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+                'fps' : frames per second of video files to be processed [int]
+                'start' : frame at which to start. 0-based [int]
+                'end' : frame at which to end.  set to None if processing 
+                        whole video [int]
+                'reader' : (optional) video decoding backend, 'cv2' (default) or 
+                           'ffmpeg'. See `FrameReader` [str]
+                'ftype' : (only if batch processing) 
+                          video file type extension (e.g. 'wmv') [str]
+                'FileNames' : (only if batch processing)
+                              List of filenames of videos in folder to be batch 
+                              processed.  [list]
+                              
+        tracking_params:: [dict]
+            Dictionary with the following keys:
+                'loc_thresh' : Percentile of difference values below which are set to 0. 
+                               After calculating pixel-wise difference between passed 
+                               frame and reference frame, these values are tthresholded 
+                               to make subsequent defining of center of mass more 
+                               reliable. [float between 0-100]
+                'use_window' : Will window surrounding prior location be 
+                               imposed?  Allows changes in area surrounding animal's 
+                               location on previous frame to be more heavily influential
+                               in determining animal's current location.
+                               After finding pixel-wise difference between passed frame 
+                               and reference frame, difference values outside square window 
+                               of prior location will be multiplied by (1 - window_weight), 
+                               reducing their overall influence. [bool]
+                'window_size' : If `use_window=True`, the length of one side of square 
+                                window, in pixels. [uint] 
+                'window_weight' : 0-1 scale for window, if used, where 1 is maximal 
+                                  weight of window surrounding prior locaiton. 
+                                  [float between 0-1]
+         
+        reference:: [numpy.array]
+            Reference image that the current frame is compared to.
+            
         crop:: [holoviews.streams.stream]
             Holoviews stream object enabling dynamic selection in response to 
             cropping tool. `crop.data` contains x and y coordinates of crop
@@ -511,11 +1302,11 @@ def TrackLocation(video_dict,tracking_params,reference,crop=None):
     
     """
           
-    #load video
-    cap = cv2.VideoCapture(video_dict['fpath'])#set file
-    cap.set(cv2.CAP_PROP_POS_FRAMES,video_dict['start']) #set starting frame
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    cap_max = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) 
+    #load video, decoding frames in background
+    cap = FrameReader(video_dict['fpath'],video_dict['start'],video_dict['end'],crop,
+                      reader=video_dict.get('reader','cv2'))
+    fps = cap.fps
+    cap_max = cap.frame_count
     cap_max = int(video_dict['end']) if video_dict['end'] is not None else cap_max  
     
     #Initialize vector to store motion values in
@@ -523,15 +1314,16 @@ def TrackLocation(video_dict,tracking_params,reference,crop=None):
     Y = np.zeros(cap_max - video_dict['start'])
     D = np.zeros(cap_max - video_dict['start'])
 
-    #Loop through frames to detect frame by frame differences
+    #Loop through frames to detect frame by frame differences, reusing work arrays
+    locator = Locator(reference,tracking_params,crop)
     for f in range(len(D)):
         
         if f>0: 
             yprior = np.around(Y[f-1]).astype(int)
             xprior = np.around(X[f-1]).astype(int)
-            ret,dif,com,frame = Locate(cap,reference,tracking_params,crop,prior=[yprior,xprior])
+            ret,com = locator.locate(cap,prior=[yprior,xprior],lean=True)
         else:
-            ret,dif,com,frame = Locate(cap,reference,tracking_params,crop)
+            ret,com = locator.locate(cap,lean=True)
                                                 
         if ret == True:          
             Y[f] = com[0]
@@ -972,81 +1764,699 @@ def Summarize_Location(location, video_dict, bin_dict=None, region_names=None,
         )
         bins = bins.rename(columns={'range(f)':'range(t)/min'})
     
-    return bins
+    return bins
+
+
+
+
+
+######################################################################################## 
+
+def Batch_LoadFiles(video_dict):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Populates list of files in directory (`dpath`) that are of the specified file type
+    (`ftype`).  List is held in `video_dict['FileNames']`.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+                'fps' : frames per second of video files to be processed [int]
+                'start' : frame at which to start. 0-based [int]
+                'end' : frame at which to end.  set to None if processing 
+                        whole video [int]
+                'ftype' : (only if batch processing) 
+                          video file type extension (e.g. 'wmv') [str]
+                'FileNames' : (only if batch processing)
+                              List of filenames of videos in folder to be batch 
+                              processed.  [list]
+
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename [str]
+                'fps' : frames per second of video file/files to be processed [int]
+                'start' : frame at which to start. 0-based [int]
+                'end' : frame at which to end.  set to None if processing whole 
+                        video [int]
+                'ftype' : (only if batch processing) 
+                          video file type extension (e.g. 'wmv') [str]
+                'FileNames' : (only if batch processing)
+                              List of filenames of videos in folder to be 
+                              batch processed.  [list]
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+    
+    """
+
+    #Get list of video files of designated type
+    if os.path.isdir(video_dict['dpath']):
+        video_dict['FileNames'] = sorted(os.listdir(video_dict['dpath']))
+        video_dict['FileNames'] = fnmatch.filter(video_dict['FileNames'], ('*.' + video_dict['ftype'])) 
+        return video_dict
+    else:
+        raise FileNotFoundError('{path} not found. Check that directory is correct'.format(
+            path=video_dict['dpath']))
+
+        
+        
+        
+        
+######################################################################################## 
+
+def Batch_Process(video_dict,tracking_params,bin_dict,region_names=None, 
+                  stretch={'width':1,'height':1}, scale_dict=None, dist=None, 
+                  crop=None,poly_stream=None,time_bin=False,n_bins_mode='fixed',resume=False,
+                  fmt='csv',cache=True,reference_groups=None,plot=True):   
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Run LocationTracking on folder of videos of specified filetype. 
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+                'fps' : frames per second of video files to be processed [int]
+                'start' : frame at which to start. 0-based [int]
+                'end' : frame at which to end.  set to None if processing 
+                        whole video [int]
+                'ftype' : (only if batch processing) 
+                          video file type extension (e.g. 'wmv') [str]
+                'FileNames' : (only if batch processing)
+                              List of filenames of videos in folder to be batch 
+                              processed.  [list]
+        
+        tracking_params:: [dict]
+            Dictionary with the following keys:
+                'loc_thresh' : Percentile of difference values below which are set to 0. 
+                               After calculating pixel-wise difference between passed 
+                               frame and reference frame, these values are tthresholded 
+                               to make subsequent defining of center of mass more 
+                               reliable. [float between 0-100]
+                'use_window' : Will window surrounding prior location be 
+                               imposed?  Allows changes in area surrounding animal's 
+                               location on previous frame to be more heavily influential
+                               in determining animal's current location.
+                               After finding pixel-wise difference between passed frame 
+                               and reference frame, difference values outside square window 
+                               of prior location will be multiplied by (1 - window_weight), 
+                               reducing their overall influence. [bool]
+                'window_size' : If `use_window=True`, the length of one side of square 
+                                window, in pixels. [uint] 
+                'window_weight' : 0-1 scale for window, if used, where 1 is maximal 
+                                  weight of window surrounding prior locaiton. 
+                                  [float between 0-1]
+                'method' : 'abs', 'light', or 'dark'.  If 'abs', absolute difference
+                           between reference and current frame is taken, and thus the 
+                           background of the frame doesn't matter. 'light' specifies that
+                           the animal is lighter than the background. 'dark' specifies that 
+                           the animal is darker than the background. 
+        
+        bin_dict:: [dict]
+            Dictionary specifying bins.  Dictionary keys should be names of the bins.  
+            Dictionary value for each bin should be a tuple, with the start and end of 
+            the bin, in seconds, relative to the start of the analysis period 
+            (i.e. if start frame is 100, it will be relative to that). If no bins are to 
+            be specified, set bin_dict = None.
+            example: bin_dict = {1:(0,100), 2:(100,200)}  
+                                  
+        region_names:: [list]
+            List containing names of regions to be drawn.  Should be set to None if no
+            regions are used.
+        
+        scale_dict:: [dict]
+            Dictionary with the following keys:
+                'distance' : distance between reference points, in desired scale 
+                             (e.g. cm) [numeric]
+                'scale' : string containing name of scale (e.g. 'cm') [str]
+                'factor' : ratio of desired scale to pixel (e.g. cm/pixel [numeric]
+        
+        dist:: [dict]
+            Dictionary with the following keys:
+                'd' : Euclidean distance between two reference points, in pixel units, 
+                      rounded to thousandth. Returns None if no less than 2 points have 
+                      been selected. [numeric]
+            
+        stretch:: [dict]
+            Dictionary with the following keys:
+                'width' : proportion by which to stretch height for display purposes
+                'height' : proportion by which to stretch height for display purposes                            
+            
+        crop:: [holoviews.streams.stream]
+            Holoviews stream object enabling dynamic selection in response to 
+            cropping tool. `crop.data` contains x and y coordinates of crop
+            boundary vertices.
+            
+        poly_stream:: [holoviews.streams.stream]
+            Holoviews stream object enabling dynamic selection in response to 
+            selection tool. `poly_stream.data` contains x and y coordinates of roi 
+            vertices.
+
+        time_bin::[logical]
+            Time minutes for each bin. Default is `False`, use bin_dict. If set `True`,
+            `bin_dict` value will be regarded as time rather than frame.
+
+        n_bin_mode::{'fixed','auto'}
+            Specific whether `bin_dict` length is fixed or adjusted.
+            
+        resume:: [bool]
+            Whether to skip tracking of videos that have already been processed with 
+            the same parameters, as recorded in 'LocationManifest.json', and whose 
+            outputs are still present. Their location and summary are read from file. Allows an 
+            interrupted batch to be resumed.
+            
+        fmt:: [str]
+            Format of frame by frame location file: 'csv', 'npz', 'parquet' or 
+            'feather'. Binary formats store file name and tracking parameters once 
+            rather than on every row. See `Write_Frames`.
+            
+        cache:: [bool]
+            Whether to use on-disk reference cache, such that references generated 
+            previously (e.g. when processing an individual video with the same 
+            cropping and frame range) are loaded rather than generated again. See 
+            `Reference`.
+            
+        reference_groups:: [dict]
+            Dictionary specifying videos that share a reference frame, e.g. those 
+            recorded by the same camera in the same session. Dictionary keys should be
+            names of the groups, and values lists of filenames. Reference of each group
+            is generated from the first file in its list, and used for all files in 
+            the list. Videos not in any group use their own reference. Set to None if 
+            no groups are used.
+            example: reference_groups = {'cam1':['a.avi','b.avi'], 'cam2':['c.avi']}
+            
+        plot:: [bool]
+            Whether to return trace and heatmap of each video in `layout`. Set to 
+            False for memory use that does not grow with the number of videos, in 
+            which case `layout` is None.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        summary_all:: [pandas.dataframe]
+            Pandas dataframe with distance travelled and proportional time spent in each 
+            region of interest according to user defined time bins, as well as video 
+            information and parameter values. If no region names are supplied 
+            (`region_names=None`), only distance travelled will be included.
+            
+        layout:: [hv.Layout]
+            Holoviews layout wherein for each session the reference frame is returned
+            with the regions of interest highlightted and the animals location across
+            the session overlaid atop the reference image. None if `plot=False`.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - The summary of each video is written to 'BatchParts' folder as soon as it is
+          processed, and is not retained in memory. `Batch_Consolidate` then combines
+          the summaries into 'BatchSummary.csv'. If processing is interrupted, calling
+          `Batch_Consolidate` directly combines the summaries of completed videos. 
+          All files are written atomically.
+        - Summaries left in 'BatchParts' by earlier runs are removed for each video 
+          that is to be processed, such that they are never combined with summaries
+          of the current run.
+        - Each video that is completely processed is recorded in 
+          'LocationManifest.json', along with the parameters used and the files written. 
+          See `Batch_Manifest_Update`.
+        - When resuming, reference frame of skipped videos is still generated (or 
+          loaded from cache) for `layout`, unless `plot=False`.
+    
+    """
+    
+    #Parameters that outputs depend upon, recorded in manifest
+    params = dict(start=video_dict.get('start'), end=video_dict.get('end'), 
+                  fps=video_dict.get('fps'), reader=video_dict.get('reader','cv2'),
+                  tracking_params=tracking_params, bin_dict=bin_dict, region_names=region_names, 
+                  scale_dict=scale_dict, dist=dist, crop=Crop_Spec(crop), 
+                  regions=poly_stream.data if poly_stream is not None else None, 
+                  time_bin=time_bin, n_bins_mode=n_bins_mode, fmt=fmt, 
+                  reference_groups=reference_groups)
+    manifest = Batch_Manifest_Load(video_dict) if resume else {}
+    
+    #File from which reference of each file is generated
+    ref_files = {}
+    for group in (reference_groups or {}).values():
+        for file in group:
+            ref_files[file] = group[0]
+    
+    #Files already processed, and removal of summaries of earlier runs for the rest
+    skip = set()
+    for file in video_dict['FileNames']:
+        file_dict = dict(video_dict, file=file, 
+                         fpath=os.path.join(os.path.normpath(video_dict['dpath']), file))
+        if resume and Batch_Manifest_Check(file_dict,manifest,params):
+            skip.add(file)
+        elif os.path.isfile(Batch_Part_Path(file_dict)):
+            os.remove(Batch_Part_Path(file_dict))
+    
+    images, references = [], {}
+    for file in video_dict['FileNames']:
+        
+        video_dict['file'] = file 
+        video_dict['fpath'] = os.path.join(os.path.normpath(video_dict['dpath']), file)
+        loc_pathout = os.path.splitext(video_dict['fpath'])[0] + '_LocationOutput.' + fmt
+        if file in skip and not plot:
+            print ('Already processed, skipping File: {f}'.format(f=file))
+            continue
+        
+        #Generate reference, or reuse reference of group
+        ref_file = ref_files.get(file, file)
+        if ref_file in references:
+            reference = references[ref_file]
+        else:
+            reference,image = Reference(dict(video_dict, altfile=ref_file),crop=crop,num_frames=100,
+                                        altfile=True,cache=cache) 
+            if file in ref_files:
+                references[ref_file] = reference
+        
+        #Reload location of files already processed
+        if file in skip:
+            print ('Already processed, skipping File: {f}'.format(f=file))
+            location = Read_Frames(loc_pathout)
+        
+        else:
+            print ('Processing File: {f}'.format(f=file))  
+            location = TrackLocation(video_dict,tracking_params,reference,crop=crop)
+
+            if region_names!=None:
+                location = ROI_Location(reference,location,region_names,poly_stream)
+            if scale_dict!=None:
+                location = ScaleDistance(scale_dict, dist, df=location, column='Distance_px')
+            Write_Frames(location, loc_pathout)
+            file_summary = Summarize_Location(location, video_dict, bin_dict=bin_dict, region_names=region_names,
+                                            time_bin=time_bin,n_bins_mode=n_bins_mode)
+            if scale_dict!=None:
+                file_summary = ScaleDistance(scale_dict, dist, df=file_summary, column='Distance_px')
+
+            #Write summary of file as soon as it is complete, and record file as processed
+            Write_CSV(file_summary, Batch_Part_Path(video_dict))
+            Batch_Manifest_Update(video_dict, params, [loc_pathout, Batch_Part_Path(video_dict)])
+        
+        if plot:
+            trace = showtrace(reference,location,poly_stream,stretch=stretch)
+            heatmap = Heatmap(reference, location, sigma=None, stretch=stretch)
+            images = images + [(trace.opts(title=file)), (heatmap.opts(title=file))]
+
+    #Combine summaries of processed files from disk, in file order
+    summary_all = Batch_Consolidate(video_dict)
+    
+    layout = hv.Layout(images) if plot else None
+    return summary_all, layout
+
+
+
+
+
+########################################################################################
+
+def Write_CSV(df,path):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Writes dataframe to .csv file atomically: file is written under a temporary name and
+    then renamed, such that an interrupted write never leaves a partial file in place.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        df:: [pandas.dataframe]
+            Dataframe to be written.
+            
+        path:: [str]
+            Path of .csv file.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Nothing returned
+    
+    """
+    
+    tmp_path = '{p}.{pid}.tmp'.format(p=path, pid=os.getpid())
+    df.to_csv(tmp_path)
+    os.replace(tmp_path, path)
+    
+    
+    
+    
+
+########################################################################################
+
+def Write_Frames(df,path):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Writes frame by frame dataframe to file atomically, in format given by extension of
+    `path`: '.csv', '.npz' (compressed numpy archive), '.parquet' or '.feather'. For 
+    binary formats, columns that are constant across frames (e.g. file name and 
+    parameter values) are stored once as metadata, and remaining columns are stored in 
+    the most compact dtype that holds their values exactly.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        df:: [pandas.dataframe]
+            Dataframe with one row per frame.
+            
+        path:: [str]
+            Path of output file, including extension.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Nothing returned
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Writing '.parquet' and '.feather' files requires pyarrow.
+        - Files can be read back into the original dataframe with `Read_Frames`.
+    
+    """
+    
+    fmt = os.path.splitext(path)[1].lower()
+    if fmt == '.csv':
+        Write_CSV(df, path)
+        return
+    if fmt not in ('.npz','.parquet','.feather'):
+        raise ValueError('Unsupported output format: {f}'.format(f=fmt))
+    
+    #Separate constant columns from per-frame columns
+    meta = dict(length=len(df), columns=[str(col) for col in df.columns], 
+                dtypes=[str(dtype) for dtype in df.dtypes], constants={}, frames=[])
+    frames = []
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if len(df) > 0 and df[col].nunique(dropna=False) == 1:
+            value = values[0]
+            meta['constants'][str(col)] = value.item() if hasattr(value,'item') else value
+            continue
+        if values.dtype.kind in 'iuf':
+            values = Compact_Dtype(values)
+        elif values.dtype.kind == 'O':
+            values = values.astype(str)
+        meta['frames'].append(str(col))
+        frames.append(values)
+    
+    #Write under temporary name and then rename
+    tmp_path = '{p}.{pid}.tmp'.format(p=path, pid=os.getpid())
+    if fmt == '.npz':
+        with open(tmp_path,'wb') as f:
+            np.savez_compressed(f, *frames, meta=np.array(json.dumps(meta)))
+    else:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            import pyarrow.feather as feather
+        except ImportError:
+            raise ImportError('pyarrow is required to write {f} files'.format(f=fmt))
+        table = pa.Table.from_arrays([pa.array(values) for values in frames], names=meta['frames'])
+        table = table.replace_schema_metadata({'ezTrack' : json.dumps(meta)})
+        if fmt == '.parquet':
+            pq.write_table(table, tmp_path)
+        else:
+            feather.write_feather(table, tmp_path)
+    os.replace(tmp_path, path)
+    
+    
+    
+    
+
+########################################################################################
+
+def Read_Frames(path):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Reads frame by frame data written by `Write_Frames`, restoring constant columns and 
+    original dtypes, such that the same dataframe is returned regardless of file format.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        path:: [str]
+            Path of '.csv', '.npz', '.parquet' or '.feather' file.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        df:: [pandas.dataframe]
+            Dataframe with one row per frame.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Reading '.parquet' and '.feather' files requires pyarrow.
+    
+    """
+    
+    fmt = os.path.splitext(path)[1].lower()
+    if fmt == '.csv':
+        return pd.read_csv(path, index_col=0)
+    if fmt == '.npz':
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            frames = [data['arr_{i}'.format(i=i)] for i in range(len(meta['frames']))]
+    elif fmt in ('.parquet','.feather'):
+        try:
+            import pyarrow.parquet as pq
+            import pyarrow.feather as feather
+        except ImportError:
+            raise ImportError('pyarrow is required to read {f} files'.format(f=fmt))
+        table = pq.read_table(path) if fmt == '.parquet' else feather.read_table(path)
+        meta = json.loads(table.schema.metadata[b'ezTrack'])
+        frames = [table.column(col).to_numpy() for col in meta['frames']]
+    else:
+        raise ValueError('Unsupported output format: {f}'.format(f=fmt))
+        
+    #Rebuild dataframe in original column order and dtypes
+    df = pd.DataFrame(dict(zip(meta['frames'], frames)), index=pd.RangeIndex(meta['length']))
+    for col, value in meta['constants'].items():
+        df[col] = value
+    df = df[meta['columns']]
+    return df.astype(dict(zip(meta['columns'], meta['dtypes'])))
+    
+    
+    
+    
+
+########################################################################################
+
+def Compact_Dtype(values):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Returns array of whole numbers in the smallest integer dtype that holds every value
+    exactly (e.g. motion values as uint16). Arrays with fractional, non-finite or 
+    out-of-range values are returned unchanged.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        values:: [numpy.array]
+            Numeric array.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        values:: [numpy.array]
+            Array in compact integer dtype, or original array.
+    
+    """
+    
+    if len(values) == 0 or values.dtype.kind not in 'iuf':
+        return values
+    if values.dtype.kind == 'f' and not (np.all(np.isfinite(values)) 
+                                         and np.all(values == np.around(values))):
+        return values
+    dtype = np.result_type(np.min_scalar_type(int(values.min())), np.min_scalar_type(int(values.max())))
+    if dtype.kind not in 'iu':
+        return values
+    compact = values.astype(dtype)
+    return compact if np.array_equal(compact, values) else values
+    
+    
+    
+    
+
+########################################################################################
+
+def Batch_Part_Path(video_dict):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Returns path of file to which summary of a single video is written during batch 
+    processing, in 'BatchParts' folder of `video_dict['dpath']`.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        part_path:: [str]
+            Path of .csv file.
+    
+    """
+    
+    part_dir = os.path.join(os.path.normpath(video_dict['dpath']), 'BatchParts')
+    os.makedirs(part_dir, exist_ok=True)
+    fname = os.path.splitext(video_dict['file'])[0] + '_LocationSummary.csv'
+    return os.path.join(part_dir, fname)
+    
+    
+    
+    
+
+########################################################################################
+
+def Batch_Consolidate(video_dict):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Combines summaries of individual videos, written during batch processing, into 
+    'BatchSummary.csv'. `Batch_Process` does so on completion. Calling this function directly
+    recovers the summary of all completed videos if batch processing was interrupted.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'dpath' : directory containing files [str]
+                'FileNames' : List of filenames of videos in folder to be batch 
+                              processed.  [list]
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        summary_all:: [pandas.dataframe]
+            Pandas dataframe with summaries of all videos whose summary was found, in 
+            order of `video_dict['FileNames']`.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Only summaries of videos in `video_dict['FileNames']` are combined. Videos
+          without a summary (not yet processed, or failed) are listed and omitted. 
+          `Batch_Process` removes summaries of earlier runs for videos it is to 
+          process.
+    
+    """
+    
+    summaries, missing = [], []
+    for file in video_dict['FileNames']:
+        part_path = Batch_Part_Path(dict(video_dict, file=file))
+        if os.path.isfile(part_path):
+            summaries.append(pd.read_csv(part_path, index_col=0, float_precision='round_trip'))
+        else:
+            missing.append(file)
+    if len(missing) > 0:
+        print ('No summary found for {n} file(s): {f}'.format(n=len(missing),f=', '.join(missing)))
+    summary_all = pd.concat(summaries, sort=False) if len(summaries) > 0 else pd.DataFrame()
+    Write_CSV(summary_all, os.path.join(os.path.normpath(video_dict['dpath']), 'BatchSummary.csv'))
+    return summary_all
 
 
 
 
 
-######################################################################################## 
+########################################################################################
 
-def Batch_LoadFiles(video_dict):
+def Batch_Manifest_Load(video_dict):
     """ 
     -------------------------------------------------------------------------------------
     
-    Populates list of files in directory (`dpath`) that are of the specified file type
-    (`ftype`).  List is held in `video_dict['FileNames']`.
+    Loads manifest of batch processing, 'LocationManifest.json' in 
+    `video_dict['dpath']`, which records each video that has been completely processed,
+    along with the parameters it was processed with and the files that were written.
     
     -------------------------------------------------------------------------------------
     Args:
         video_dict:: [dict]
             Dictionary with the following keys:
                 'dpath' : directory containing files [str]
-                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
-                'fps' : frames per second of video files to be processed [int]
-                'start' : frame at which to start. 0-based [int]
-                'end' : frame at which to end.  set to None if processing 
-                        whole video [int]
-                'ftype' : (only if batch processing) 
-                          video file type extension (e.g. 'wmv') [str]
-                'FileNames' : (only if batch processing)
-                              List of filenames of videos in folder to be batch 
-                              processed.  [list]
-
     
     -------------------------------------------------------------------------------------
     Returns:
+        manifest:: [dict]
+            Dictionary with filenames as keys. Empty if no manifest exists.
+    
+    """
+    
+    manifest_path = os.path.join(os.path.normpath(video_dict['dpath']), 'LocationManifest.json')
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+    
+    
+    
+    
+
+########################################################################################
+
+def Batch_Manifest_Update(video_dict,params,outputs):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Records video `video_dict['file']` as completely processed in batch manifest. 
+    Manifest is written atomically, such that an interruption never corrupts it.
+    
+    -------------------------------------------------------------------------------------
+    Args:
         video_dict:: [dict]
             Dictionary with the following keys:
                 'dpath' : directory containing files [str]
-                'file' : filename [str]
-                'fps' : frames per second of video file/files to be processed [int]
-                'start' : frame at which to start. 0-based [int]
-                'end' : frame at which to end.  set to None if processing whole 
-                        video [int]
-                'ftype' : (only if batch processing) 
-                          video file type extension (e.g. 'wmv') [str]
-                'FileNames' : (only if batch processing)
-                              List of filenames of videos in folder to be 
-                              batch processed.  [list]
+                'file' : filename with extension, e.g. 'myvideo.wmv' [str]
+                'fpath' : full path to file [str]
+                
+        params:: [dict]
+            Dictionary of all parameters that outputs of video depend upon. Values 
+            must be json serializable.
+            
+        outputs:: [list]
+            List of paths of files written for video.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Nothing returned
     
     -------------------------------------------------------------------------------------
     Notes:
+        - Manifest should only be updated by a single process at a time. 
     
     """
+    
+    dpath = os.path.normpath(video_dict['dpath'])
+    params = json.loads(json.dumps(params, sort_keys=True, default=str))
+    manifest = Batch_Manifest_Load(video_dict)
+    manifest[video_dict['file']] = {
+        'signature' : hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest(),
+        'params' : params,
+        'video' : Video_Hash(video_dict['fpath']),
+        'outputs' : [os.path.relpath(output, dpath) for output in outputs],
+        'completed' : time.strftime('%Y-%m-%d %H:%M:%S')}
+    
+    manifest_path = os.path.join(dpath, 'LocationManifest.json')
+    tmp_path = '{p}.{pid}.tmp'.format(p=manifest_path, pid=os.getpid())
+    with open(tmp_path,'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    
+    
+    
+    
 
-    #Get list of video files of designated type
-    if os.path.isdir(video_dict['dpath']):
-        video_dict['FileNames'] = sorted(os.listdir(video_dict['dpath']))
-        video_dict['FileNames'] = fnmatch.filter(video_dict['FileNames'], ('*.' + video_dict['ftype'])) 
-        return video_dict
-    else:
-        raise FileNotFoundError('{path} not found. Check that directory is correct'.format(
-            path=video_dict['dpath']))
-
-        
-        
-        
-        
-######################################################################################## 
+########################################################################################
 
-def Batch_Process(video_dict,tracking_params,bin_dict,region_names=None, 
-                  stretch={'width':1,'height':1}, scale_dict=None, dist=None, 
-                  crop=None,poly_stream=None,time_bin=False,n_bins_mode='fixed'):   
+def Batch_Manifest_Check(video_dict,manifest,params):
     """ 
     -------------------------------------------------------------------------------------
     
-    Run LocationTracking on folder of videos of specified filetype. 
+    Determines whether video `video_dict['file']` can be skipped when resuming batch 
+    processing: video must be recorded in manifest with the same parameters, must not
+    have been modified since, and all of its outputs must still be present.
     
     -------------------------------------------------------------------------------------
     Args:
@@ -1054,142 +2464,76 @@ def Batch_Process(video_dict,tracking_params,bin_dict,region_names=None,
             Dictionary with the following keys:
                 'dpath' : directory containing files [str]
                 'file' : filename with extension, e.g. 'myvideo.wmv' [str]
-                'fps' : frames per second of video files to be processed [int]
-                'start' : frame at which to start. 0-based [int]
-                'end' : frame at which to end.  set to None if processing 
-                        whole video [int]
-                'ftype' : (only if batch processing) 
-                          video file type extension (e.g. 'wmv') [str]
-                'FileNames' : (only if batch processing)
-                              List of filenames of videos in folder to be batch 
-                              processed.  [list]
-        
-        tracking_params:: [dict]
-            Dictionary with the following keys:
-                'loc_thresh' : Percentile of difference values below which are set to 0. 
-                               After calculating pixel-wise difference between passed 
-                               frame and reference frame, these values are tthresholded 
-                               to make subsequent defining of center of mass more 
-                               reliable. [float between 0-100]
-                'use_window' : Will window surrounding prior location be 
-                               imposed?  Allows changes in area surrounding animal's 
-                               location on previous frame to be more heavily influential
-                               in determining animal's current location.
-                               After finding pixel-wise difference between passed frame 
-                               and reference frame, difference values outside square window 
-                               of prior location will be multiplied by (1 - window_weight), 
-                               reducing their overall influence. [bool]
-                'window_size' : If `use_window=True`, the length of one side of square 
-                                window, in pixels. [uint] 
-                'window_weight' : 0-1 scale for window, if used, where 1 is maximal 
-                                  weight of window surrounding prior locaiton. 
-                                  [float between 0-1]
-                'method' : 'abs', 'light', or 'dark'.  If 'abs', absolute difference
-                           between reference and current frame is taken, and thus the 
-                           background of the frame doesn't matter. 'light' specifies that
-                           the animal is lighter than the background. 'dark' specifies that 
-                           the animal is darker than the background. 
-        
-        bin_dict:: [dict]
-            Dictionary specifying bins.  Dictionary keys should be names of the bins.  
-            Dictionary value for each bin should be a tuple, with the start and end of 
-            the bin, in seconds, relative to the start of the analysis period 
-            (i.e. if start frame is 100, it will be relative to that). If no bins are to 
-            be specified, set bin_dict = None.
-            example: bin_dict = {1:(0,100), 2:(100,200)}  
-                                  
-        region_names:: [list]
-            List containing names of regions to be drawn.  Should be set to None if no
-            regions are used.
-        
-        scale_dict:: [dict]
-            Dictionary with the following keys:
-                'distance' : distance between reference points, in desired scale 
-                             (e.g. cm) [numeric]
-                'scale' : string containing name of scale (e.g. 'cm') [str]
-                'factor' : ratio of desired scale to pixel (e.g. cm/pixel [numeric]
-        
-        dist:: [dict]
-            Dictionary with the following keys:
-                'd' : Euclidean distance between two reference points, in pixel units, 
-                      rounded to thousandth. Returns None if no less than 2 points have 
-                      been selected. [numeric]
-            
-        stretch:: [dict]
-            Dictionary with the following keys:
-                'width' : proportion by which to stretch height for display purposes
-                'height' : proportion by which to stretch height for display purposes                            
-            
-        crop:: [holoviews.streams.stream]
-            Holoviews stream object enabling dynamic selection in response to 
-            cropping tool. `crop.data` contains x and y coordinates of crop
-            boundary vertices.
-            
-        poly_stream:: [holoviews.streams.stream]
-            Holoviews stream object enabling dynamic selection in response to 
-            selection tool. `poly_stream.data` contains x and y coordinates of roi 
-            vertices.
+                'fpath' : full path to file [str]
+                
+        manifest:: [dict]
+            Batch manifest, as returned by `Batch_Manifest_Load`.
+                
+        params:: [dict]
+            Dictionary of all parameters that outputs of video depend upon. See 
+            `Batch_Manifest_Update`.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        completed:: [bool]
+            True if video has already been processed.
+    
+    """
+    
+    entry = manifest.get(video_dict['file'])
+    if entry is None:
+        return False
+    params = json.loads(json.dumps(params, sort_keys=True, default=str))
+    if entry.get('signature') != hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest():
+        return False
+    dpath = os.path.normpath(video_dict['dpath'])
+    if not all(os.path.isfile(os.path.join(dpath, output)) for output in entry.get('outputs',[])):
+        return False
+    return entry.get('video') == Video_Hash(video_dict['fpath'])
+    
+    
+    
+    
 
-        time_bin::[logical]
-            Time minutes for each bin. Default is `False`, use bin_dict. If set `True`,
-            `bin_dict` value will be regarded as time rather than frame.
+########################################################################################
 
-        n_bin_mode::{'fixed','auto'}
-            Specific whether `bin_dict` length is fixed or adjusted.
+def Video_Hash(fpath,chunk_size=2**20,n_chunks=8):
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Returns hash identifying content of video file. To remain fast for large files, the
+    hash is computed from file size and evenly spaced chunks of the file, including its 
+    first and last bytes.
     
     -------------------------------------------------------------------------------------
-    Returns:
-        summary_all:: [pandas.dataframe]
-            Pandas dataframe with distance travelled and proportional time spent in each 
-            region of interest according to user defined time bins, as well as video 
-            information and parameter values. If no region names are supplied 
-            (`region_names=None`), only distance travelled will be included.
+    Args:
+        fpath:: [str]
+            Path to video file.
             
-        layout:: [hv.Layout]
-            Holoviews layout wherein for each session the reference frame is returned
-            with the regions of interest highlightted and the animals location across
-            the session overlaid atop the reference image.
+        chunk_size:: [uint]
+            Number of bytes in each chunk read.
+            
+        n_chunks:: [uint]
+            Number of chunks read in addition to first and last chunk of file.
     
     -------------------------------------------------------------------------------------
-    Notes:
+    Returns:
+        digest:: [str]
+            Hexadecimal SHA-1 digest.
     
+    -------------------------------------------------------------------------------------
+    Notes:
+
     """
     
-    images = []
-    for file in video_dict['FileNames']:
-        
-        print ('Processing File: {f}'.format(f=file))  
-        video_dict['file'] = file 
-        video_dict['fpath'] = os.path.join(os.path.normpath(video_dict['dpath']), file)
-        
-        reference,image = Reference(video_dict,crop=crop,num_frames=100) 
-        location = TrackLocation(video_dict,tracking_params,reference,crop=crop)
-        
-        if region_names!=None:
-            location = ROI_Location(reference,location,region_names,poly_stream)
-        if scale_dict!=None:
-            location = ScaleDistance(scale_dict, dist, df=location, column='Distance_px')
-        location.to_csv(os.path.splitext(video_dict['fpath'])[0] + '_LocationOutput.csv')
-        file_summary = Summarize_Location(location, video_dict, bin_dict=bin_dict, region_names=region_names,
-                                        time_bin=time_bin,n_bins_mode=n_bins_mode)
-               
-        try: 
-            summary_all = pd.concat([summary_all,file_summary],sort=False)
-        except NameError: 
-            summary_all = file_summary
-        if scale_dict!=None:
-            summary_all = ScaleDistance(scale_dict, dist, df=summary_all, column='Distance_px')
-        
-        trace = showtrace(reference,location,poly_stream,stretch=stretch)
-        heatmap = Heatmap(reference, location, sigma=None, stretch=stretch)
-        images = images + [(trace.opts(title=file)), (heatmap.opts(title=file))]
-
-    #Write summary data to csv file
-    sum_pathout = os.path.join(os.path.normpath(video_dict['dpath']), 'BatchSummary.csv')
-    summary_all.to_csv(sum_pathout)
-    
-    layout = hv.Layout(images)
-    return summary_all, layout
+    size = os.path.getsize(fpath)
+    digest = hashlib.sha1(str(size).encode())
+    with open(fpath,'rb') as f:
+        positions = np.linspace(0, max(size-chunk_size,0), n_chunks+2).astype(int)
+        for position in np.unique(positions):
+            f.seek(position)
+            digest.update(f.read(chunk_size))
+    return digest.hexdigest()
 
 
 
@@ -1214,6 +2558,8 @@ def PlayVideo(video_dict,display_dict,location,crop=None):
                 'start' : frame at which to start. 0-based [int]
                 'end' : frame at which to end.  set to None if processing 
                         whole video [int]
+                'reader' : (optional) video decoding backend, 'cv2' (default) or 
+                           'ffmpeg'. See `FrameReader` [str]
                 'ftype' : (only if batch processing) 
                           video file type extension (e.g. 'wmv') [str]
                 'FileNames' : (only if batch processing)
@@ -1228,6 +2574,8 @@ def PlayVideo(video_dict,display_dict,location,crop=None):
                            Alternatively, set to tuple as follows: (width,height).
                            Because this is in pixel units, must be integer values.
                 'fps' : frames per second of video file/files to be processed [int]
+                'quality' : (optional) JPEG quality of displayed frames, 0-100. 
+                            Default is 75. [int]
                 'save_video' : option to save video if desired [bool]
                                Currently, will be saved at 20 fps even if video 
                                is something else
@@ -1253,31 +2601,29 @@ def PlayVideo(video_dict,display_dict,location,crop=None):
     """
 
 
-    #Load Video and Set Saving Parameters
-    cap = cv2.VideoCapture(video_dict['fpath'])#set file\
+    #Load Video, decoding frames in background, and Set Saving Parameters
+    cap = FrameReader(video_dict['fpath'],video_dict['start']+display_dict['start'],
+                      video_dict['start']+display_dict['stop'],crop,
+                      reader=video_dict.get('reader','cv2'))
     if display_dict['save_video']==True:
-        ret, frame = cap.read() #read frame
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        frame = cropframe(frame, crop)
-        height, width = int(frame.shape[0]), int(frame.shape[1])
+        height, width = int(cap.shape[0]), int(cap.shape[1])
         fourcc = 0#cv2.VideoWriter_fourcc(*'jpeg') #only writes up to 20 fps, though video read can be 30.
         writer = cv2.VideoWriter(os.path.join(os.path.normpath(video_dict['dpath']), 'video_output.avi'), 
                                  fourcc, 20.0, 
                                  (width, height),
                                  isColor=False)
 
-    #Initialize video play options   
-    cap.set(cv2.CAP_PROP_POS_FRAMES,video_dict['start']+display_dict['start']) 
+
+    #Initialize display
+    screen = FrameDisplay(display_dict['fps'],display_dict['resize'],display_dict.get('quality',75))
 
     #Play Video
     for f in range(display_dict['start'],display_dict['stop']):
         ret, frame = cap.read() #read frame
         if ret == True:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            frame = cropframe(frame, crop)
             markposition = (int(location['X'][f]),int(location['Y'][f]))
             cv2.drawMarker(img=frame,position=markposition,color=255)
-            display_image(frame,display_dict['fps'],display_dict['resize'])
+            screen.show(frame)
             #Save video (if desired). 
             if display_dict['save_video']==True:
                 writer.write(frame) 
@@ -1285,18 +2631,127 @@ def PlayVideo(video_dict,display_dict,location,crop=None):
             print('warning. failed to get video frame')
 
     #Close video window and video writer if open
+    cap.release()
     print('Done playing segment')
+    screen.report()
     if display_dict['save_video']==True:
         writer.release()
 
 def display_image(frame,fps,resize):
-    img = PIL.Image.fromarray(frame, "L")
-    img = img.resize(size=resize) if resize else img
-    buffer = BytesIO()
-    img.save(buffer,format="JPEG")    
-    display(Image(data=buffer.getvalue()))
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Displays single frame in notebook, waits `1/fps` seconds and clears it. Retained for
+    compatibility. For playback of consecutive frames, `FrameDisplay` is faster.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        frame:: [numpy.ndarray]
+            2d uint8 array.
+            
+        fps:: [float]
+            Frames per second of playback.
+            
+        resize:: [tuple]
+            (width,height) to which frame is resized. Set to None to retain size.
+    
+    -------------------------------------------------------------------------------------
+    Returns:
+        Nothing returned
+    
+    """
+    
+    display(FrameDisplay(fps,resize).encode(frame))
     time.sleep(1/fps)
     clear_output(wait=True)
+    
+    
+    
+
+
+########################################################################################
+
+class FrameDisplay:
+    """ 
+    -------------------------------------------------------------------------------------
+    
+    Displays consecutive video frames in notebook at a requested frame rate. Frames are
+    JPEG encoded by OpenCV and shown by updating a single display, rather than clearing
+    and recreating output. Frames are dropped when display falls behind schedule, such 
+    that playback holds the requested frame rate.
+    
+    -------------------------------------------------------------------------------------
+    Args:
+        fps:: [float]
+            Requested frames per second of playback.
+            
+        resize:: [tuple]
+            (width,height) to which frames are resized, in pixels. Set to None to 
+            retain original size.
+            
+        quality:: [uint]
+            JPEG quality, 0-100. Lower values encode and transfer faster.
+    
+    -------------------------------------------------------------------------------------
+    Notes:
+        - `show` is called once per video frame, and returns False if the frame was
+          dropped. Frame `i` is due `i/fps` seconds after the first frame. A frame 
+          arriving more than one frame interval late is dropped without encoding 
+          only if another frame was shown less than one frame interval earlier, 
+          such that bursts of late frames are skipped until playback is back on 
+          schedule, while frames from a source slower than `fps` are all shown.
+        - `report` prints achieved playback and display frame rates, and returns 
+          achieved display frame rate.
+
+    """
+    
+    def __init__(self,fps,resize=None,quality=75):
+        self.fps = fps
+        self.resize = resize
+        self.quality = quality
+        self.handle = None
+        self.t_start = None
+        self.t_shown = None
+        self.n_frames = 0
+        self.n_shown = 0
+        
+    def encode(self,frame):
+        if self.resize:
+            frame = cv2.resize(frame,tuple(self.resize),interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode('.jpg',frame,[cv2.IMWRITE_JPEG_QUALITY,int(self.quality)])
+        return Image(data=buffer.tobytes())
+    
+    def show(self,frame):
+        
+        #Drop frame if more than one frame interval behind schedule, and a frame was
+        #shown within the last interval
+        now = time.perf_counter()
+        self.t_start = now if self.t_start is None else self.t_start
+        due = self.t_start + self.n_frames/self.fps
+        self.n_frames += 1
+        if now > due + 1/self.fps and now - self.t_shown < 1/self.fps:
+            return False
+        
+        #Wait until frame is due, and update display
+        time.sleep(max(due-now,0))
+        self.t_shown = max(due,now)
+        image = self.encode(frame)
+        if self.handle is None:
+            self.handle = display(image,display_id=True)
+        else:
+            self.handle.update(image)
+        self.n_shown += 1
+        return True
+    
+    def report(self):
+        elapsed = time.perf_counter() - self.t_start if self.t_start is not None else 0
+        elapsed = max(elapsed, 1/self.fps)
+        achieved = self.n_shown / elapsed
+        print('Played {n} frames at {p:.1f} fps; displayed {s} frames at {a:.1f} fps '
+              '(requested {r} fps, {d} dropped)'.format(
+                  n=self.n_frames, p=self.n_frames/elapsed, s=self.n_shown, a=achieved,
+                  r=self.fps, d=self.n_frames-self.n_shown))
+        return achieved
 
     
     
@@ -1320,6 +2775,8 @@ def PlayVideo_ext(video_dict,display_dict,location,crop=None):
                 'start' : frame at which to start. 0-based [int]
                 'end' : frame at which to end.  set to None if processing 
                         whole video [int]
+                'reader' : (optional) video decoding backend, 'cv2' (default) or 
+                           'ffmpeg'. See `FrameReader` [str]
                 'ftype' : (only if batch processing) 
                           video file type extension (e.g. 'wmv') [str]
                 'FileNames' : (only if batch processing)
@@ -1355,29 +2812,24 @@ def PlayVideo_ext(video_dict,display_dict,location,crop=None):
 
     """
 
-    #Load Video and Set Saving Parameters
-    cap = cv2.VideoCapture(video_dict['fpath'])#set file\
+    #Load Video, decoding frames in background, and Set Saving Parameters
+    cap = FrameReader(video_dict['fpath'],video_dict['start']+display_dict['start'],
+                      video_dict['start']+display_dict['stop'],crop,
+                      reader=video_dict.get('reader','cv2'))
     if display_dict['save_video']==True:
-        ret, frame = cap.read() #read frame
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        frame = cropframe(frame, crop)
-        height, width = int(frame.shape[0]), int(frame.shape[1])
+        height, width = int(cap.shape[0]), int(cap.shape[1])
         fourcc = 0#cv2.VideoWriter_fourcc(*'jpeg') #only writes up to 20 fps, though video read can be 30.
         writer = cv2.VideoWriter(os.path.join(os.path.normpath(video_dict['dpath']), 'video_output.avi'), 
                                  fourcc, 20.0, 
                                  (width, height),
                                  isColor=False)
 
-    #Initialize video play options   
-    cap.set(cv2.CAP_PROP_POS_FRAMES,video_dict['start']+display_dict['start']) 
     rate = int(1000/display_dict['fps']) 
 
     #Play Video
     for f in range(display_dict['start'],display_dict['stop']):
         ret, frame = cap.read() #read frame
         if ret == True:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            frame = cropframe(frame, crop)
             markposition = (int(location['X'][f]),int(location['Y'][f]))
             cv2.drawMarker(img=frame,position=markposition,color=255)
             cv2.imshow("preview",frame)
@@ -1389,6 +2841,7 @@ def PlayVideo_ext(video_dict,display_dict,location,crop=None):
             print('warning. failed to get video frame')
 
     #Close video window and video writer if open        
+    cap.release()
     cv2.destroyAllWindows()
     _=cv2.waitKey(1) 
     if display_dict['save_video']==True: